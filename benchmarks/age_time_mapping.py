@@ -0,0 +1,49 @@
+"""
+Times mapping ages and times to GBD age group and year IDs, one row at a time
+with an IntervalTree, against the sorted-breakpoint mapper in format_age_time.
+
+    python benchmarks/age_time_mapping.py --n-rows 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from cascade_at.inputs.utilities.gbd_ids import IntervalMapper, make_age_intervals, make_time_intervals
+from cascade_at.inputs.utilities.gbd_ids import make_time_mapper, map_id_from_interval_tree
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--n-rows', type=int, default=1000000)
+    parser.add_argument('--n-rows-per-row', type=int, default=100000,
+                        help='rows to time the row-at-a-time lookup on, which is scaled up')
+    args = parser.parse_args()
+
+    # Roughly the 23 GBD age groups.
+    breaks = np.concatenate([[0., 0.01917808, 0.07671233, 1.], np.arange(5., 100., 5.), [125.]])
+    ages = pd.DataFrame({'age_group_id': np.arange(len(breaks) - 1), 'age_lower': breaks[:-1],
+                         'age_upper': breaks[1:]})
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({'age_lower': rng.choice(breaks[:-1], args.n_rows),
+                       'time_lower': rng.integers(1990, 2020, args.n_rows).astype(float)})
+
+    age_tree, time_tree = make_age_intervals(df=ages), make_time_intervals()
+    subset = df.iloc[:args.n_rows_per_row]
+    start = time.perf_counter()
+    subset.age_lower.apply(lambda x: map_id_from_interval_tree(index=x, tree=age_tree))
+    subset.time_lower.apply(lambda x: map_id_from_interval_tree(index=x, tree=time_tree))
+    elapsed = (time.perf_counter() - start) * len(df) / len(subset)
+    print(f"{'IntervalTree per row':>22}: {elapsed:8.3f} s")
+
+    start = time.perf_counter()
+    age_mapper = IntervalMapper(lower=ages.age_lower.values, upper=ages.age_upper.values,
+                                ids=ages.age_group_id.values)
+    age_mapper(df.age_lower.values)
+    make_time_mapper()(df.time_lower.values)
+    print(f"{'IntervalMapper':>22}: {time.perf_counter() - start:8.3f} s")
+
+
+if __name__ == '__main__':
+    main()
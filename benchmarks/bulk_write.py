@@ -0,0 +1,99 @@
+"""
+Times writing a synthetic DisMod database table by table
+against writing it in one bulk-write session.
+
+    python benchmarks/bulk_write.py --n-data 100000 --n-avgint 200000 --directory /path/on/nfs
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from cascade_at.dismod.api.dismod_io import DismodIO
+
+
+def synthetic_tables(n_data: int, n_avgint: int):
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame({
+        'data_name': [str(i) for i in range(n_data)],
+        'integrand_id': rng.integers(0, 10, n_data),
+        'density_id': 1,
+        'node_id': rng.integers(0, 50, n_data),
+        'weight_id': 0,
+        'subgroup_id': 0,
+        'hold_out': 0,
+        'meas_value': rng.random(n_data),
+        'meas_std': rng.random(n_data),
+        'eta': np.nan,
+        'nu': np.nan,
+        'age_lower': rng.random(n_data) * 100,
+        'age_upper': rng.random(n_data) * 100,
+        'time_lower': 1990.0,
+        'time_upper': 2020.0,
+        'x_0': rng.random(n_data),
+        'x_1': rng.random(n_data),
+    })
+    avgint = pd.DataFrame({
+        'integrand_id': rng.integers(0, 10, n_avgint),
+        'node_id': rng.integers(0, 50, n_avgint),
+        'weight_id': 0,
+        'subgroup_id': 0,
+        'age_lower': rng.random(n_avgint) * 100,
+        'age_upper': rng.random(n_avgint) * 100,
+        'time_lower': 1990.0,
+        'time_upper': 2020.0,
+        'x_0': rng.random(n_avgint),
+        'x_1': rng.random(n_avgint),
+    })
+    return [
+        ('density', pd.DataFrame({'density_name': ['uniform', 'gaussian']})),
+        ('node', pd.DataFrame({'node_name': [str(i) for i in range(50)], 'parent': [np.nan] + [0] * 49})),
+        ('covariate', pd.DataFrame({'covariate_name': ['x_0', 'x_1'], 'reference': 0.0, 'max_difference': np.nan})),
+        ('age', pd.DataFrame({'age': np.linspace(0, 100, 21)})),
+        ('time', pd.DataFrame({'time': np.linspace(1990, 2020, 7)})),
+        ('integrand', pd.DataFrame({'integrand_name': [str(i) for i in range(10)], 'minimum_meas_cv': 0.0})),
+        ('weight', pd.DataFrame({'weight_name': ['constant'], 'n_age': 1, 'n_time': 1})),
+        ('weight_grid', pd.DataFrame({'weight_id': [0], 'age_id': 0, 'time_id': 0, 'weight': 1.0})),
+        ('nslist', pd.DataFrame({'nslist_name': ['children']})),
+        ('subgroup', pd.DataFrame({'subgroup_name': ['world'], 'group_id': 0, 'group_name': 'world'})),
+        ('option', pd.DataFrame({'option_name': ['parent_node_id'], 'option_value': '0'})),
+        ('data', data),
+        ('avgint', avgint),
+    ]
+
+
+def write_all(db: DismodIO, tables):
+    for name, table in tables:
+        db.write_table(name, table.copy())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--n-data', type=int, default=100000)
+    parser.add_argument('--n-avgint', type=int, default=100000)
+    parser.add_argument('--directory', type=str, default=None)
+    args = parser.parse_args()
+
+    tables = synthetic_tables(n_data=args.n_data, n_avgint=args.n_avgint)
+    with tempfile.TemporaryDirectory(dir=args.directory) as tmp:
+        runs = [
+            ('table by table', None),
+            ('bulk session', dict()),
+            ('bulk session, MEMORY/OFF', dict(journal_mode='MEMORY', synchronous='OFF')),
+        ]
+        for i, (label, pragmas) in enumerate(runs):
+            db = DismodIO(path=Path(tmp) / f'dismod_{i}.db')
+            start = time.perf_counter()
+            if pragmas is None:
+                write_all(db, tables)
+            else:
+                with db.bulk_write(**pragmas):
+                    write_all(db, tables)
+            print(f"{label:>28}: {time.perf_counter() - start:8.3f} s")
+
+
+if __name__ == '__main__':
+    main()
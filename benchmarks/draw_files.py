@@ -0,0 +1,57 @@
+"""
+Times saving and reading draw files with ResultsHandler in each draw format,
+and reports their size on disk, for one location and sex.
+
+    python benchmarks/draw_files.py --n-rows 10000 --n-draws 1000
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from cascade_at.saver.results_handler import ResultsHandler
+
+
+def make_draws(n_rows: int, n_draws: int) -> pd.DataFrame:
+    df = pd.DataFrame({
+        'location_id': 102, 'sex_id': 2, 'age_group_id': np.arange(n_rows) % 25,
+        'year_id': 1990 + (np.arange(n_rows) // 25) % 30, 'measure_id': 5 + np.arange(n_rows) // 750
+    })
+    draws = np.random.default_rng(0).random((n_rows, n_draws))
+    return pd.concat([df, pd.DataFrame(draws, columns=[f'draw_{i}' for i in range(n_draws)])], axis=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--n-rows', type=int, default=10000)
+    parser.add_argument('--n-draws', type=int, default=1000)
+    parser.add_argument('--directory', type=str, default=None)
+    args = parser.parse_args()
+
+    df = make_draws(n_rows=args.n_rows, n_draws=args.n_draws)
+    rh = ResultsHandler()
+    for draw_format, float32 in [('csv', False), ('npy', False), ('npy', True)]:
+        with tempfile.TemporaryDirectory(dir=args.directory) as tmp:
+            directory = Path(tmp)
+            label = f"{draw_format}{', float32' if float32 else ''}"
+            start = time.perf_counter()
+            rh.save_draw_files(df=df.copy(), model_version_id=0, directory=directory, add_summaries=False,
+                               draw_format=draw_format, float32=float32)
+            saved = time.perf_counter() - start
+            size = sum(f.stat().st_size for f in directory.rglob('*') if f.is_file())
+
+            start = time.perf_counter()
+            rh.read_draw_files(directory=directory)
+            read_all = time.perf_counter() - start
+            start = time.perf_counter()
+            rh.read_draw_files(directory=directory, measure_ids=[5], draws=list(range(10)))
+            read_some = time.perf_counter() - start
+            print(f"{label:>12}: save {saved:7.3f} s, read {read_all:7.3f} s, "
+                  f"read 10 draws of a measure {read_some:7.3f} s, {size / 2 ** 20:8.1f} MiB")
+
+
+if __name__ == '__main__':
+    main()
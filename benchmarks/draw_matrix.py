@@ -0,0 +1,60 @@
+"""
+Times and measures the peak memory of turning a synthetic predict table of
+samples into wide draws, with set_index and unstack in pandas, as
+DismodExtractor.get_predictions did, against DismodExtractor.get_draw_matrix.
+
+    python benchmarks/draw_matrix.py --n-ages 20 --n-times 15 --n-draws 1000
+"""
+import argparse
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from prior_grid_draws import write_predict
+
+from cascade_at.dismod.api.dismod_extractor import DismodExtractor, INDEX_COLS
+
+
+def unstack(extractor: DismodExtractor):
+    """Wide draws the way they were made before the draw matrix."""
+    df = extractor._extract_raw_predictions()
+    df = df.rename(columns={'c_location_id': 'location_id', 'c_sex_id': 'sex_id'})
+    df['draw'] = df['sample_index'].apply(lambda x: f'draw_{x}')
+    keys = INDEX_COLS + ['location_id', 'sex_id', 'draw']
+    df = df[keys + ['avg_integrand']]
+    assert not df[keys].duplicated().any()
+    return df.set_index(keys).unstack().reset_index()
+
+
+def measure(label, function):
+    """Times a function, then runs it again to trace its peak memory, which slows it down."""
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:>16}: {elapsed:8.3f} s {peak / 2 ** 20:10.1f} MiB peak")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--n-ages', type=int, default=20)
+    parser.add_argument('--n-times', type=int, default=15)
+    parser.add_argument('--n-draws', type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'dismod.db'
+        write_predict(path, n_ages=args.n_ages, n_times=args.n_times, n_draws=args.n_draws)
+        extractor = DismodExtractor(path=path)
+        print(f"Draws are {4 * args.n_ages * args.n_times * args.n_draws * 8 / 2 ** 20:.1f} MiB as a matrix.")
+        measure('unstack', lambda: unstack(extractor))
+        measure('get_draw_matrix', lambda: extractor.get_draw_matrix())
+        measure('get_predictions', lambda: extractor.get_predictions(samples=True))
+
+
+if __name__ == '__main__':
+    main()
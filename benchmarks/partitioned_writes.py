@@ -0,0 +1,67 @@
+"""
+Times saving draw and summary files for many locations and sexes with
+ResultsHandler, against the loop that masked the whole frame for each
+location and sex and summarized each part on its own.
+
+    python benchmarks/partitioned_writes.py --n-locations 50 --n-draws 100
+"""
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from cascade_at.saver.results_handler import ResultsHandler
+
+
+def make_draws(n_locations: int, n_rows: int, n_draws: int) -> pd.DataFrame:
+    df = pd.DataFrame(
+        [(loc, sex, i % 25, 1990 + i // 25, 5) for loc in range(n_locations) for sex in [1, 2]
+         for i in range(n_rows)],
+        columns=['location_id', 'sex_id', 'age_group_id', 'year_id', 'measure_id']
+    )
+    draws = np.random.default_rng(0).random((len(df), n_draws))
+    return pd.concat([df, pd.DataFrame(draws, columns=[f'draw_{i}' for i in range(n_draws)])], axis=1)
+
+
+def masked_loop(rh: ResultsHandler, df: pd.DataFrame, directory: Path) -> None:
+    """The writes as they were, with each part summarized and saved on its own."""
+    df['model_version_id'] = 0
+    for loc in df.location_id.unique().tolist():
+        os.makedirs(str(directory / str(loc)), exist_ok=True)
+        for sex in df.sex_id.unique().tolist():
+            subset = df.loc[(df.location_id == loc) & (df.sex_id == sex)].copy()
+            subset.to_csv(directory / str(loc) / f'{loc}_{sex}.csv')
+            rh.save_summary_files(df=rh.summarize_results(df=subset), model_version_id=0, directory=directory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--n-locations', type=int, default=50)
+    parser.add_argument('--n-rows', type=int, default=300, help='rows for each location and sex')
+    parser.add_argument('--n-draws', type=int, default=100)
+    parser.add_argument('--directory', type=str, default=None)
+    args = parser.parse_args()
+
+    df = make_draws(n_locations=args.n_locations, n_rows=args.n_rows, n_draws=args.n_draws)
+    rh = ResultsHandler()
+    runs = [
+        ('masked loop', lambda d: masked_loop(rh, df.copy(), d)),
+        ('groupby', lambda d: rh.save_draw_files(df.copy(), 0, d, add_summaries=True)),
+        ('groupby, 4 threads', lambda d: rh.save_draw_files(df.copy(), 0, d, add_summaries=True, n_threads=4)),
+        ('groupby, npy', lambda d: rh.save_draw_files(df.copy(), 0, d, add_summaries=True, draw_format='npy')),
+        ('groupby, npy, 4 threads', lambda d: rh.save_draw_files(df.copy(), 0, d, add_summaries=True,
+                                                                 draw_format='npy', n_threads=4)),
+    ]
+    for label, save in runs:
+        with tempfile.TemporaryDirectory(dir=args.directory) as tmp:
+            start = time.perf_counter()
+            save(Path(tmp))
+            print(f"{label:>24}: {time.perf_counter() - start:8.3f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Times a DisMod thread pool with each executor backend, on a synthetic
+thread that copies a database and runs an external process for each index,
+which is the shape of the work that a fit or predict does in the pool.
+
+    python benchmarks/pool_backends.py --backend all --n-sim 100 --n-pool 10 --seconds 0.5 --directory /path/on/nfs
+"""
+import argparse
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from cascade_at.dismod.api.dismod_io import DismodIO
+from cascade_at.dismod.api.executors import BACKENDS
+from cascade_at.dismod.api.multithreading import _DismodThread, dmdismod_in_parallel
+
+
+class SleepThread(_DismodThread):
+    """Stands in for dmdismod with a process that sleeps."""
+    def __init__(self, seconds: float, **kwargs):
+        super().__init__(**kwargs)
+        self.seconds = seconds
+
+    def _process(self, db: str):
+        subprocess.run([sys.executable, '-c', f'import time; time.sleep({self.seconds})'], check=True)
+        return db
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--backend', type=str, default='all', choices=BACKENDS + ['all'])
+    parser.add_argument('--n-sim', type=int, default=40)
+    parser.add_argument('--n-pool', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=0.2)
+    parser.add_argument('--n-avgint', type=int, default=100000)
+    parser.add_argument('--persistent', action='store_true')
+    parser.add_argument('--directory', type=str, default=None)
+    args = parser.parse_args()
+
+    backends = BACKENDS if args.backend == 'all' else [args.backend]
+    with tempfile.TemporaryDirectory(dir=args.directory) as tmp:
+        main_db = Path(tmp) / 'main.db'
+        DismodIO(path=main_db).avgint = pd.DataFrame({
+            'integrand_id': 0, 'node_id': 0, 'weight_id': 0, 'subgroup_id': 0,
+            'age_lower': [float(i % 100) for i in range(args.n_avgint)], 'age_upper': 100.0,
+            'time_lower': 1990.0, 'time_upper': 2020.0
+        })
+        for backend in backends:
+            thread = SleepThread(
+                seconds=args.seconds, main_db=main_db, index_file_pattern=str(Path(tmp) / 'main_{index}.db')
+            )
+            start = time.perf_counter()
+            dmdismod_in_parallel(
+                dm_thread=thread, sims=list(range(args.n_sim)), n_pool=args.n_pool,
+                persistent=args.persistent, backend=backend, queue_dir=Path(tmp) / f'queue_{backend}'
+            )
+            elapsed = time.perf_counter() - start
+            ideal = args.n_sim * args.seconds / args.n_pool
+            print(f"{backend:>10}: {elapsed:8.3f} s, {elapsed - ideal:8.3f} s over the ideal {ideal:.3f} s")
+
+
+if __name__ == '__main__':
+    # The directory queue's workers import SleepThread, so run it from this module by name.
+    sys.path.insert(0, str(Path(__file__).parent))
+    import pool_backends
+    pool_backends.main()
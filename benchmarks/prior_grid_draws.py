@@ -0,0 +1,100 @@
+"""
+Times DismodExtractor.gather_draws_for_prior_grid on a synthetic predict
+table against the loop over ages and times that it replaced.
+
+    python benchmarks/prior_grid_draws.py --n-ages 20 --n-times 15 --n-draws 1000
+"""
+import argparse
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from cascade_at.dismod.api.dismod_extractor import DismodExtractor
+from cascade_at.dismod.api.dismod_io import DismodIO
+
+INTEGRANDS = {'Sincidence': 'iota', 'remission': 'rho', 'mtexcess': 'chi', 'prevalence': 'pini'}
+
+
+def write_predict(path: Path, n_ages: int, n_times: int, n_draws: int) -> None:
+    """One location and sex, each integrand on the age-time grid, with n_draws samples."""
+    db = DismodIO(path=path)
+    db.integrand = pd.DataFrame({'integrand_name': list(INTEGRANDS), 'minimum_meas_cv': 0.})
+    ages = np.linspace(0., 100., n_ages)
+    times = np.linspace(1990., 2020., n_times)
+    grid = pd.DataFrame(
+        [(i, a, t) for i in range(len(INTEGRANDS)) for a in ages for t in times],
+        columns=['integrand_id', 'age_lower', 'time_lower']
+    )
+    grid['age_upper'] = grid['age_lower']
+    grid['time_upper'] = grid['time_lower']
+    grid['c_location_id'] = 101
+    grid['c_sex_id'] = 1
+    grid['node_id'] = 0
+    grid['weight_id'] = 0
+    grid['subgroup_id'] = 0
+    db.avgint = grid
+    db.create_tables([db._table_definitions['predict']])
+    rng = np.random.default_rng(0)
+    n_rows = len(grid) * n_draws
+    connection = sqlite3.connect(str(path))
+    with connection:
+        connection.executemany(
+            "INSERT INTO predict (predict_id, sample_index, avgint_id, avg_integrand) VALUES (?, ?, ?, ?)",
+            ((i, i % n_draws, i // n_draws, float(v)) for i, v in enumerate(rng.random(n_rows)))
+        )
+    connection.close()
+
+
+def loop_over_grid(df: pd.DataFrame, rate: str) -> np.ndarray:
+    """The draw cube for one rate, filtered one age and time at a time."""
+    draw_cols = [col for col in df if col.startswith('draw')]
+    df2 = df.loc[df.rate == rate]
+    ages = np.asarray(sorted(df2.age_lower.unique().tolist()))
+    times = np.asarray(sorted(df2.time_lower.unique().tolist()))
+    draw_data = np.zeros((len(ages), len(times), len(draw_cols)))
+    for age_idx, age in enumerate(ages):
+        for time_idx, t in enumerate(times):
+            draw_data[age_idx, time_idx, :] = df2.loc[
+                (df2.age_lower == age) & (df2.time_lower == t)
+            ][draw_cols].values.ravel()
+    return draw_data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--n-ages', type=int, default=20)
+    parser.add_argument('--n-times', type=int, default=15)
+    parser.add_argument('--n-draws', type=int, default=1000)
+    args = parser.parse_args()
+
+    rates = list(INTEGRANDS.values())
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'dismod.db'
+        write_predict(path, n_ages=args.n_ages, n_times=args.n_times, n_draws=args.n_draws)
+        extractor = DismodExtractor(path=path)
+
+        start = time.perf_counter()
+        df = extractor.get_predictions(locations=[101], sexes=[1], samples=True)
+        read = time.perf_counter() - start
+        print(f"{'get_predictions':>28}: {read:8.3f} s")
+
+        start = time.perf_counter()
+        cubes = {r: loop_over_grid(df, r) for r in rates}
+        print(f"{'loop over ages and times':>28}: {time.perf_counter() - start:8.3f} s")
+
+        # The predictions were read above, so this times building the cube.
+        extractor.get_predictions = lambda **kwargs: df
+        start = time.perf_counter()
+        draws = extractor.gather_draws_for_prior_grid(location_id=101, sex_id=1, rates=rates)
+        print(f"{'gather_draws_for_prior_grid':>28}: {time.perf_counter() - start:8.3f} s")
+
+        for r in rates:
+            assert np.array_equal(cubes[r], draws[r]['value'])
+
+
+if __name__ == '__main__':
+    main()
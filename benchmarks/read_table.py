@@ -0,0 +1,55 @@
+"""
+Times reading a large, all-numeric DisMod table, like sample,
+with pandas and SQLAlchemy against the reader in DismodSQLite.read_table.
+
+    python benchmarks/read_table.py --n-rows 10000000 --directory /path/on/nfs
+"""
+import argparse
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from cascade_at.dismod.api.dismod_io import DismodIO
+
+
+def write_sample(path: Path, n_rows: int, n_var: int = 1000):
+    """Writes the sample table straight with sqlite3, because to_sql is the slow part otherwise."""
+    db = DismodIO(path=path)
+    db.create_tables([db._table_definitions['sample']])
+    rng = np.random.default_rng(0)
+    connection = sqlite3.connect(str(path))
+    with connection:
+        connection.executemany(
+            "INSERT INTO sample (sample_id, sample_index, var_id, var_value) VALUES (?, ?, ?, ?)",
+            ((i, i // n_var, i % n_var, float(v)) for i, v in enumerate(rng.random(n_rows)))
+        )
+    connection.close()
+    return db
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--n-rows', type=int, default=10000000)
+    parser.add_argument('--directory', type=str, default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.directory) as tmp:
+        db = write_sample(Path(tmp) / 'dismod.db', n_rows=args.n_rows)
+        runs = [
+            ('pd.read_sql_table', lambda: pd.read_sql_table('sample', con=db.engine)),
+            ('read_table', lambda: db.read_table('sample')),
+            ('read_table, one sample', lambda: db.read_table('sample', where={'sample_index': 3})),
+            ('iter_table', lambda: sum(len(c) for c in db.iter_table('sample', chunksize=1000000))),
+        ]
+        for label, read in runs:
+            start = time.perf_counter()
+            read()
+            print(f"{label:>24}: {time.perf_counter() - start:8.3f} s")
+
+
+if __name__ == '__main__':
+    main()
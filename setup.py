@@ -52,6 +52,7 @@ setup(
         'upload=cascade_at.executor.upload:main',
         'cleanup=cascade_at.executor.cleanup:main',
         'run_cascade=cascade_at.executor.run:main',
-        'run_dmdismod=cascade_at.executor.run_dmdismod:main'
+        'run_dmdismod=cascade_at.executor.run_dmdismod:main',
+        'dismod_queue_worker=cascade_at.executor.dismod_queue_worker:main'
     ]}
 )
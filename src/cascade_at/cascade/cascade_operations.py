@@ -209,12 +209,17 @@ class ConfigureInputs(_CascadeOperation):
 class _DismodDB(_CascadeOperation):
     def __init__(self, model_version_id: int,
                  parent_location_id: int, sex_id: int, fill: bool,
+                 fill_in_memory: bool = False,
                  prior_samples: bool = False, prior_mulcov: bool = False,
                  prior_parent: Optional[int] = None, prior_sex: Optional[int] = None,
                  dm_options: Optional[Dict[str, Union[int, str, float]]] = None,
                  dm_commands: Optional[List[str]] = None,
                  save_prior: bool = False,
                  save_fit: bool = False,
+                 record_resources: bool = False,
+                 use_cache: bool = False,
+                 warm_start_parent: bool = False,
+                 warm_start_model_version_id: Optional[int] = None,
                  **kwargs):
         """
         Base class for creating an operation that interfaces with the dismod database.
@@ -230,6 +235,9 @@ class _DismodDB(_CascadeOperation):
         fill
             Whether or not to fill this database with new data
             base on the cached inputs or this model version.
+        fill_in_memory
+            Whether or not to build the database in memory and copy it
+            to the file system once, when it is filled.
         prior_samples
             Whether or not the prior came from samples or just a mean fit
         prior_mulcov
@@ -249,6 +257,17 @@ class _DismodDB(_CascadeOperation):
             Whether or not to save the prior as the prior for this parent location.
         save_fit
             Whether or not to save the fit as the fit for this parent location.
+        record_resources
+            Whether to record the wall time, CPU time and memory of each dismod
+            command next to the database, to size this operation from.
+        use_cache
+            Whether to restore the results of dismod commands whose inputs
+            haven't changed since they last ran, as when a workflow resumes.
+        warm_start_parent
+            Whether to start the fit from the prior parent's predictions on
+            this database's prior grid, rather than from the prior means.
+        warm_start_model_version_id
+            A model version whose fit of this location and sex to start the fit from.
         kwargs
         """
 
@@ -265,6 +284,7 @@ class _DismodDB(_CascadeOperation):
             parent_location_id=parent_location_id,
             sex_id=sex_id,
             fill=fill,
+            fill_in_memory=fill_in_memory,
             prior_mulcov=prior_mulcov,
             prior_samples=prior_samples,
             prior_parent=prior_parent,
@@ -272,7 +292,11 @@ class _DismodDB(_CascadeOperation):
             dm_options=dm_options,
             dm_commands=dm_commands,
             save_prior=save_prior,
-            save_fit=save_fit
+            save_fit=save_fit,
+            record_resources=record_resources,
+            use_cache=use_cache,
+            warm_start_parent=warm_start_parent,
+            warm_start_model_version_id=warm_start_model_version_id
         )
 
     @staticmethod
@@ -323,7 +347,10 @@ class Fit(_DismodDB):
 
 class Sample(_CascadeOperation):
     def __init__(self, model_version_id: int, parent_location_id: int, sex_id: int,
-                 n_sim: int, fit_type: str, asymptotic: bool, n_pool: int = 1, **kwargs):
+                 n_sim: int, fit_type: str, asymptotic: bool, n_pool: int = 1,
+                 persistent_workers: bool = False, slim_workers: bool = False,
+                 pool_backend: Optional[str] = None, scratch_dir: Optional[str] = None,
+                 n_accept: Optional[int] = None, **kwargs):
         """
         Create posterior samples from a dismod database that has already
         had a fit run on it. This may be done in parallel with a multiprocessing
@@ -351,6 +378,19 @@ class Sample(_CascadeOperation):
         n_pool
             The number of threads to create in a multiprocessing pool.
             If this is 1, then it will not do multiprocessing.
+        persistent_workers
+            Whether each worker in the pool copies the database once
+            for all of its simulations.
+        slim_workers
+            Whether the databases of the workers in the pool have only
+            the tables that the fit needs.
+        pool_backend
+            How to run the pool, one of "process", "thread" or "directory",
+            which is "process" by default.
+        scratch_dir
+            A node-local directory for the copies of the database in the pool.
+        n_accept
+            Stop once this many fits in the pool have succeeded, skipping the rest.
         kwargs
         """
         super().__init__(**kwargs)
@@ -363,7 +403,12 @@ class Sample(_CascadeOperation):
             n_sim=n_sim,
             n_pool=n_pool,
             fit_type=fit_type,
-            asymptotic=asymptotic
+            asymptotic=asymptotic,
+            persistent_workers=persistent_workers,
+            slim_workers=slim_workers,
+            pool_backend=pool_backend,
+            scratch_dir=scratch_dir,
+            n_accept=n_accept
         )
 
     @staticmethod
@@ -375,7 +420,8 @@ class Predict(_CascadeOperation):
     def __init__(self, model_version_id: int, parent_location_id: int, sex_id: int,
                  child_locations: Optional[List[int]] = None, child_sexes: Optional[List[int]] = None,
                  prior_grid: bool = True, save_fit: bool = False, save_final: bool = False,
-                 sample: bool = True, **kwargs):
+                 sample: bool = True, draw_format: Optional[str] = None,
+                 float32_draws: bool = False, save_threads: Optional[int] = None, **kwargs):
 
         super().__init__(**kwargs)
         self.name_components = [model_version_id, parent_location_id, sex_id]
@@ -389,7 +435,10 @@ class Predict(_CascadeOperation):
             prior_grid=prior_grid,
             save_fit=save_fit,
             save_final=save_final,
-            sample=sample
+            sample=sample,
+            draw_format=draw_format,
+            float32_draws=float32_draws,
+            save_threads=save_threads
         )
 
     @staticmethod
@@ -9,6 +9,7 @@ from cascade_at.context.configuration import application_config
 from cascade_at.core.log import get_loggers
 from cascade_at.inputs.covariate_specs import CovariateSpecs
 from cascade_at.inputs.measurement_inputs import MeasurementInputs
+from cascade_at.inputs.utilities.gbd_ids import get_age_group_metadata
 from cascade_at.model.grid_alchemy import Alchemy
 from cascade_at.settings.settings import load_settings
 from cascade_at.settings.settings_config import SettingsConfig
@@ -73,12 +74,14 @@ class Context:
         self.inputs_dir = self.model_dir / 'inputs'
         self.outputs_dir = self.model_dir / 'outputs'
         self.database_dir = self.model_dir / 'dbs'
+        self.dismod_cache_dir = self.model_dir / 'dismod_cache'
         self.draw_dir = self.outputs_dir / 'draws'
         self.fit_dir = self.outputs_dir / 'fits'
         self.prior_dir = self.outputs_dir / 'priors'
 
         self.inputs_file = self.inputs_dir / 'inputs.p'
         self.settings_file = self.inputs_dir / 'settings.json'
+        self.age_metadata_file = self.inputs_dir / 'age_metadata.csv'
 
         self.log_dir = (
             Path(self.root_directory)
@@ -143,6 +146,27 @@ class Context:
         """
         return str(self.db_folder(location_id, sex_id)) + '/dismod_{index}.db'
 
+    def db_queue_dir(self, location_id: int, sex_id: int, name: str) -> Path:
+        """
+        Gets the directory for the queue of tasks of a pool that runs on a
+        database with the "directory" backend. It is next to the database,
+        on the shared filesystem, so workers on other nodes can see it.
+
+        Parameters
+        ----------
+        location_id
+            Location ID for the database (parent).
+        sex_id
+            Sex ID for the database, as the reference.
+        name
+            The name of the step that runs the pool, like sample or predict.
+
+        Returns
+        -------
+        Path to the queue directory.
+        """
+        return self.db_folder(location_id, sex_id) / f'{name}_queue'
+
     def write_inputs(self, inputs: Optional[MeasurementInputs] = None,
                      settings: Optional[SettingsConfig] = None):
         """
@@ -157,6 +181,24 @@ class Context:
                 LOG.info(f"Writing settings obj to {self.settings_file}.")
                 json.dump(settings, f)
 
+    def write_age_metadata(self, gbd_round_id: int):
+        """
+        Writes the age group metadata for a GBD round to disk, so that
+        the steps that format results for IHME map ages to age groups
+        without querying the database.
+        """
+        LOG.info(f"Writing age group metadata to {self.age_metadata_file}.")
+        get_age_group_metadata(gbd_round_id=gbd_round_id).to_csv(self.age_metadata_file, index=False)
+
+    def age_metadata(self) -> Optional[Path]:
+        """
+        The age group metadata file written by :py:meth:`write_age_metadata`,
+        or None if there isn't one and the metadata has to be queried.
+        """
+        if self.age_metadata_file.exists():
+            return self.age_metadata_file
+        return None
+
     def read_inputs(self) -> (MeasurementInputs, Alchemy, SettingsConfig):
         """
         Read the inputs from disk.
@@ -1,5 +1,6 @@
 import os
-from typing import List, Optional, Dict
+from pathlib import Path
+from typing import List, Optional, Dict, Tuple, Union
 from copy import copy
 
 import numpy as np
@@ -21,6 +22,7 @@ class ExtractorCols:
     SAMPLE_COL = 'sample_index'
     VALUE_COL_SAMPLES = 'draw'
     VALUE_COL_FIT = 'mean'
+    CHUNKSIZE = 1000000
 
 
 INDEX_COLS = [
@@ -35,7 +37,7 @@ class DismodExtractorError(DismodAPIError):
 
 
 class DismodExtractor(DismodIO):
-    def __init__(self, path: str):
+    def __init__(self, path: str, cache: bool = False):
         """
         Sits on top of the DismodIO class,
         and extracts helpful data frames
@@ -45,21 +47,50 @@ class DismodExtractor(DismodIO):
         ----------
         path
             The database filepath
+        cache
+            Whether to keep tables in memory between reads, for
+            extracting many locations and sexes from the same database.
         """
-        super().__init__(path=path)
+        super().__init__(path=path, cache=cache)
         if not os.path.isfile(path):
             raise DismodExtractorError(f"SQLite file {str(path)} has not been created or filled yet.")
 
-    def _extract_raw_predictions(self, predictions: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    def _read_avgint(self, locations: Optional[List[int]] = None,
+                     sexes: Optional[List[int]] = None) -> pd.DataFrame:
+        """
+        Reads the avgint table, or only its rows for some locations and sexes.
+        """
+        where = dict()
+        if locations is not None:
+            where['c_location_id'] = locations
+        if sexes is not None:
+            where['c_sex_id'] = sexes
+        if where:
+            return self.read_table('avgint', where=where)
+        return self.avgint
+
+    def _extract_raw_predictions(self, predictions: Optional[pd.DataFrame] = None,
+                                 locations: Optional[List[int]] = None,
+                                 sexes: Optional[List[int]] = None) -> pd.DataFrame:
         """
         Grab raw predictions from the predict table.
         Or, optionally merge some predictions on the avgint table and integrand table. This
         is a work-around when we've wanted to use a different prediction data frame (from using
         multithreading) because dismod_at does not allow you to set the predict table.
+
+        If locations or sexes are passed, only the avgint rows, and the predictions
+        for them, for those locations and sexes are read from the database.
         """
+        avgint = self._read_avgint(locations=locations, sexes=sexes)
         if predictions is None:
-            predictions = self.predict
-        df = predictions.merge(self.avgint, on=['avgint_id'])
+            # Merge the predict table a chunk at a time so that rows for
+            # other locations and sexes are dropped as they are read.
+            df = pd.concat([
+                chunk.merge(avgint, on=['avgint_id'])
+                for chunk in self.iter_table('predict', chunksize=ExtractorCols.CHUNKSIZE)
+            ], ignore_index=True)
+        else:
+            df = predictions.merge(avgint, on=['avgint_id'])
         df = df.merge(self.integrand, on=['integrand_id'])
         df['rate'] = df['integrand_name'].map(
             PRIMARY_INTEGRANDS_TO_RATES
@@ -75,7 +106,106 @@ class DismodExtractor(DismodIO):
         Will either return a column of 'mean' if not samples, otherwise 'draw', which can then
         be reshaped wide if necessary.
         """
-        df = self._extract_raw_predictions(predictions=predictions)
+        if samples:
+            index, sample_index, draws = self.get_draw_matrix(
+                locations=locations, sexes=sexes, predictions=predictions
+            )
+            df = index.drop(columns='avgint_id')
+            DEMOGRAPHIC_COLS = self._demographic_cols(df)
+            if df[INDEX_COLS + DEMOGRAPHIC_COLS].duplicated().any():
+                raise DismodExtractorError("There are duplicate entries in the prediction data frame"
+                                           "based on the expected columns. Please check the data.")
+            VALUE_COLS = [f'{ExtractorCols.VALUE_COL_SAMPLES}_{i}' for i in sample_index]
+            df = pd.concat([df, pd.DataFrame(draws, columns=VALUE_COLS, index=df.index)], axis=1)
+            return df[DEMOGRAPHIC_COLS + INDEX_COLS + VALUE_COLS]
+
+        df = self._extract_raw_predictions(predictions=predictions, locations=locations, sexes=sexes)
+        df = self._subset_demographics(df, locations=locations, sexes=sexes)
+        DEMOGRAPHIC_COLS = self._demographic_cols(df)
+        df.rename(columns={ExtractorCols.RESULT_COL: ExtractorCols.VALUE_COL_FIT}, inplace=True)
+        VALUE_COLS = [ExtractorCols.VALUE_COL_FIT]
+        return df[DEMOGRAPHIC_COLS + INDEX_COLS + VALUE_COLS]
+
+    def get_draw_matrix(self, locations: Optional[List[int]] = None,
+                        sexes: Optional[List[int]] = None,
+                        predictions: Optional[pd.DataFrame] = None) -> Tuple[pd.DataFrame, np.ndarray, np.ndarray]:
+        """
+        Get the predictions from samples as a matrix of draws, with a row for
+        each avgint_id that has predictions and a column for each sample_index,
+        and a data frame that describes the rows. The matrix is filled by the
+        integer position of each prediction, so the long predictions are never
+        pivoted in pandas.
+
+        Parameters
+        ----------
+        locations
+            A list of locations to extract from the predictions
+        sexes
+            A list of sexes to extract from the predictions
+        predictions
+            An optional data frame with the predictions to use rather than
+            reading them directly from the database.
+
+        Returns
+        -------
+        A data frame with the avgint_id, demographic and integrand columns of each row,
+        in order of avgint_id, the sample index of each column, and a C-contiguous
+        float array of the draws, which is NaN where a row has no prediction for a sample.
+        """
+        avgint = self._read_avgint(locations=locations, sexes=sexes)
+        avgint_ids = np.sort(avgint.avgint_id.values)
+        columns = ['avgint_id', ExtractorCols.SAMPLE_COL, ExtractorCols.RESULT_COL]
+        if predictions is not None and ExtractorCols.SAMPLE_COL not in predictions.columns:
+            raise DismodExtractorError("Cannot find sample index column. Are you sure you created samples?")
+        if predictions is None:
+            # Smaller chunks than elsewhere, because the rows of a chunk are Python
+            # tuples while it's read, and they outweigh the matrix.
+            chunks = self.iter_table('predict', chunksize=ExtractorCols.CHUNKSIZE // 10, columns=columns)
+        else:
+            chunks = [predictions[columns]]
+
+        # Keep the position of each prediction on the grid, one chunk at a time,
+        # so that rows for other locations and sexes are dropped as they are read.
+        rows, samples, values = list(), list(), list()
+        for chunk in chunks:
+            avgint_id = chunk.avgint_id.values
+            sample = chunk[ExtractorCols.SAMPLE_COL].values
+            if len(sample) and pd.isnull(sample).all():
+                raise DismodExtractorError("All sample index values are null. Are you sure you created samples?")
+            keep = np.isin(avgint_id, avgint_ids) & pd.notnull(sample)
+            rows.append(np.searchsorted(avgint_ids, avgint_id[keep]))
+            samples.append(sample[keep].astype(int))
+            values.append(chunk[ExtractorCols.RESULT_COL].values[keep].astype(float))
+        row = np.concatenate(rows) if rows else np.zeros(0, dtype=int)
+        sample = np.concatenate(samples) if samples else np.zeros(0, dtype=int)
+        value = np.concatenate(values) if values else np.zeros(0)
+
+        used_rows, row = np.unique(row, return_inverse=True)
+        sample_index, column = np.unique(sample, return_inverse=True)
+        cell = row * len(sample_index) + column
+        if len(np.unique(cell)) < len(cell):
+            raise DismodExtractorError("There are duplicate entries in the prediction data frame"
+                                       "based on the expected columns. Please check the data.")
+        draws = np.full((len(used_rows), len(sample_index)), np.nan)
+        draws[row, column] = value
+
+        index = avgint.set_index('avgint_id').loc[avgint_ids[used_rows]].reset_index()
+        index = index.merge(self.integrand, on=['integrand_id'], how='left')
+        index['rate'] = index['integrand_name'].map(PRIMARY_INTEGRANDS_TO_RATES)
+        index = index.rename(columns={'c_' + x: x for x in DEMOGRAPHIC_ID_COLS})
+        index = index[['avgint_id'] + self._demographic_cols(index) + INDEX_COLS]
+        if sexes is not None and set(index.sex_id.values) != set(sexes):
+            missing_sexes = set(sexes) - set(index.sex_id.values)
+            raise DismodExtractorError(f"The following sexes you asked for were missing: {missing_sexes}.")
+        return index, sample_index, draws
+
+    @staticmethod
+    def _subset_demographics(df: pd.DataFrame, locations: Optional[List[int]] = None,
+                             sexes: Optional[List[int]] = None) -> pd.DataFrame:
+        """
+        Keeps the raw predictions for the locations and sexes asked for, and
+        renames their demographic columns without the comment prefix.
+        """
         if locations is not None:
             df = df.loc[df.c_location_id.isin(locations)].copy()
             missing_locations = set(df.c_location_id.values) - set(locations)
@@ -87,41 +217,22 @@ class DismodExtractor(DismodIO):
             if set(df.c_sex_id.values) != set(sexes):
                 missing_sexes = set(df.c_sex_id.values) - set(sexes)
                 raise DismodExtractorError(f"The following sexes you asked for were missing: {missing_sexes}.")
+        return df.rename(columns={'c_' + x: x for x in DEMOGRAPHIC_ID_COLS})
 
-        df.rename(
-            columns={'c_' + x: x for x in DEMOGRAPHIC_ID_COLS}, inplace=True
-        )
+    @staticmethod
+    def _demographic_cols(df: pd.DataFrame) -> List[str]:
+        """
+        The required demographic columns and the optional ones that are in the predictions.
+        """
         DEMOGRAPHIC_COLS = copy(ExtractorCols.REQUIRED_DEMOGRAPHIC_COLS)
         for col in ExtractorCols.REQUIRED_DEMOGRAPHIC_COLS:
             if col not in df.columns:
                 raise DismodExtractorError(f"Cannot find required col {col} in the"
-                                           "predictions columns: {predictions.columns}.")
+                                           f"predictions columns: {list(df.columns)}.")
         for col in ExtractorCols.OPTIONAL_DEMOGRAPHIC_COLS:
             if col in df.columns:
                 DEMOGRAPHIC_COLS.append(col)
-
-        if samples:
-            VALUE_COL = ExtractorCols.VALUE_COL_SAMPLES
-            if ExtractorCols.SAMPLE_COL not in df.columns:
-                raise DismodExtractorError("Cannot find sample index column. Are you sure you created samples?")
-            if df[ExtractorCols.SAMPLE_COL].isnull().all():
-                raise DismodExtractorError("All sample index values are null. Are you sure you created samples?")
-            df[ExtractorCols.VALUE_COL_SAMPLES] = df[ExtractorCols.SAMPLE_COL].apply(
-                lambda x: f'{ExtractorCols.VALUE_COL_SAMPLES}_{x}'
-            )
-            VALUE_COLS = df[ExtractorCols.VALUE_COL_SAMPLES].unique().tolist()
-            df = df[INDEX_COLS + DEMOGRAPHIC_COLS + [ExtractorCols.VALUE_COL_SAMPLES] + [ExtractorCols.RESULT_COL]]
-            if df[INDEX_COLS + DEMOGRAPHIC_COLS + [ExtractorCols.VALUE_COL_SAMPLES]].duplicated().any():
-                raise DismodExtractorError("There are duplicate entries in the prediction data frame"
-                                           "based on the expected columns. Please check the data.")
-            df.set_index(INDEX_COLS + DEMOGRAPHIC_COLS + [ExtractorCols.VALUE_COL_SAMPLES], inplace=True)
-            df = df.unstack().reset_index()
-            df.columns = INDEX_COLS + DEMOGRAPHIC_COLS + VALUE_COLS
-        else:
-            df.rename(columns={ExtractorCols.RESULT_COL: ExtractorCols.VALUE_COL_FIT}, inplace=True)
-            VALUE_COLS = [ExtractorCols.VALUE_COL_FIT]
-
-        return df[DEMOGRAPHIC_COLS + INDEX_COLS + VALUE_COLS]
+        return DEMOGRAPHIC_COLS
 
     def gather_draws_for_prior_grid(self,
                                     location_id: int,
@@ -167,34 +278,27 @@ class DismodExtractor(DismodIO):
         assert (df.age_lower.values == df.age_upper.values).all()
         assert (df.time_lower.values == df.time_upper.values).all()
 
-        # Loop over rates, age, and time
+        # Each rate's rows are put on the grid in one pass, by the index of their age and time.
+        rate_values = df.rate.values
+        draw_values = df[DRAW_COLS].to_numpy(dtype=float)
+        n_draws = len(DRAW_COLS)
         for r in rates:
-            df2 = df.loc[df.rate == r].copy()
-
-            ages = np.asarray(sorted(df2.age_lower.unique().tolist()))
-            times = np.asarray(sorted(df2.time_lower.unique().tolist()))
-            n_draws = len(DRAW_COLS)
+            in_rate = rate_values == r
+            ages, age_idx = np.unique(df.age_lower.values[in_rate], return_inverse=True)
+            times, time_idx = np.unique(df.time_lower.values[in_rate], return_inverse=True)
 
             # Save these for later for quality checks
             rate_dict[r]['ages'] = ages
             rate_dict[r]['times'] = times
             rate_dict[r]['n_draws'] = n_draws
 
-            # Create template for filling in the draws
+            # Check to makes sure that there is exactly one row of draws for
+            # every age and time, so that the grid has all of the draws for each
+            cell_idx = age_idx * len(times) + time_idx
+            assert (np.bincount(cell_idx, minlength=len(ages) * len(times)) == 1).all()
+
             draw_data = np.zeros((len(ages), len(times), n_draws))
-            for age_idx, age in enumerate(ages):
-                for time_idx, time in enumerate(times):
-                    # Subset to the draws that we want from avg_integrand
-                    # but only for this particular age and time
-                    draws = df2.loc[
-                        (df2.age_lower == age) &
-                        (df2.time_lower == time)
-                    ][DRAW_COLS].values.ravel()
-
-                    # Check to makes sure that the number of draws corresponds to the number
-                    # of draws for the whole thing per age and time
-                    assert len(draws) == n_draws
-                    draw_data[age_idx, time_idx, :] = draws
+            draw_data[age_idx, time_idx, :] = draw_values[in_rate]
 
             if value:
                 rate_dict[r]['value'] = draw_data
@@ -209,7 +313,8 @@ class DismodExtractor(DismodIO):
                                     locations: Optional[List[int]] = None,
                                     sexes: Optional[List[int]] = None,
                                     samples: bool = False,
-                                    predictions: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+                                    predictions: Optional[pd.DataFrame] = None,
+                                    age_metadata_file: Optional[Union[str, Path]] = None) -> pd.DataFrame:
         """
         Formats predictions from the prediction table and returns either the mean
         or draws, based on whether or not samples is False or True.
@@ -228,6 +333,9 @@ class DismodExtractor(DismodIO):
         predictions
             An optional data frame with the predictions to use rather than
             reading them directly from the database.
+        age_metadata_file
+            An optional CSV file of age group metadata to map ages with,
+            rather than querying it for the GBD round.
 
         Returns
         -------
@@ -235,7 +343,7 @@ class DismodExtractor(DismodIO):
         """
         pred = self.get_predictions(locations=locations, sexes=sexes, samples=samples,
                                     predictions=predictions)
-        pred = format_age_time(df=pred, gbd_round_id=gbd_round_id)
+        pred = format_age_time(df=pred, gbd_round_id=gbd_round_id, age_metadata_file=age_metadata_file)
         pred = integrand_to_gbd_measures(df=pred, integrand_col='integrand_name')
         if samples:
             VALUE_COLS = [col for col in pred.columns if col.startswith(ExtractorCols.VALUE_COL_SAMPLES)]
@@ -150,12 +150,22 @@ class DismodFiller(DismodIO):
 
         Pass in some optional keyword arguments to fill the option
         table with additional info or to over-ride the defaults.
+
+        All tables are written in one bulk-write session, and because
+        they are built by the fill helpers, they are written as trusted,
+        without checking their columns and types. To tune the
+        session's pragmas, open the session around this call, with a
+        ``journal_mode`` that can still roll back, e.g.
+
+        >>> with filler.bulk_write(journal_mode='MEMORY', synchronous='OFF'):
+        >>>     filler.fill_for_parent_child()
         """
         LOG.info(f"Filling tables in {self.path.absolute()}")
-        self.fill_reference_tables()
-        self.fill_grid_tables()
-        self.fill_data_tables()
-        self.option = self.construct_option_table(**options)
+        with self.bulk_write(), self.trusted_writes():
+            self.fill_reference_tables()
+            self.fill_grid_tables()
+            self.fill_data_tables()
+            self.option = self.construct_option_table(**options)
 
     def node_id_from_location_id(self, location_id: int) -> int:
         """
@@ -1,3 +1,9 @@
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+import pandas as pd
+
 from cascade_at.core.log import get_loggers
 from cascade_at.dismod.api.dismod_sqlite import DismodSQLite
 
@@ -11,9 +17,71 @@ class DismodIO(DismodSQLite):
     just be able to say, e.g. dmfile.data = pd.DataFrame({...}) as the 'setter', and it will
     automatically write it. Likewise, if you want to get one of the tables,
     then you can just do df = dmfile.data as the 'getter' and it will automatically read it.
+
+    With ``cache=True``, each table is read from the file once and then
+    served from memory, as a copy, until the table is written through this
+    object or the file changes underneath it, for instance because dmdismod
+    ran on it. A change is detected from the file's modification time and size
+    and from the change counter in the SQLite file header, which every write
+    transaction increments. Checking opens and closes the file, so this object
+    holds no open file and can still be shared after a fork.
     """
-    def __init__(self, path):
+    def __init__(self, path: Union[str, Path], cache: bool = False):
         super().__init__(path=path)
+        self.cache = cache
+        self._table_cache = dict()
+        self._cache_version = None
+
+    def _file_version(self):
+        """
+        A token that changes whenever the database changes
+        outside of this object's own writes.
+        """
+        try:
+            stat = os.stat(self.path)
+            with open(self.path, 'rb') as f:
+                # The file change counter is the four bytes at offset 24 of the header.
+                f.seek(24)
+                change_counter = f.read(4)
+            file_stat = (stat.st_mtime_ns, stat.st_size, change_counter)
+        except FileNotFoundError:
+            file_stat = None
+        return id(self.engine), file_stat
+
+    def clear_cache(self):
+        """
+        Drops all cached tables.
+        """
+        self._table_cache = dict()
+        self._cache_version = None
+
+    def read_table(self, table_name: str, columns: Optional[List[str]] = None,
+                   where: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+        if not self.cache or columns is not None or where is not None:
+            return super().read_table(table_name, columns=columns, where=where)
+        version = self._file_version()
+        if version != self._cache_version:
+            if self._table_cache:
+                LOG.debug(f"{self.path} changed, clearing the table cache.")
+            self._table_cache = dict()
+            self._cache_version = version
+        if table_name not in self._table_cache:
+            self._table_cache[table_name] = super().read_table(table_name)
+        return self._table_cache[table_name].copy()
+
+    def write_table(self, table_name: str, table: pd.DataFrame, trusted: bool = False,
+                    mode: str = "replace", keys: Optional[List[str]] = None):
+        if not self.cache:
+            return super().write_table(table_name, table, trusted=trusted, mode=mode, keys=keys)
+        # Our own write changes the file version, so keep the rest of
+        # the cache if nothing else changed the file since it was filled.
+        unchanged = self._file_version() == self._cache_version
+        self._table_cache.pop(table_name, None)
+        super().write_table(table_name, table, trusted=trusted, mode=mode, keys=keys)
+        if unchanged:
+            self._cache_version = self._file_version()
+        else:
+            self.clear_cache()
 
     # AGE TABLE
     @property
@@ -9,32 +9,180 @@ and validated. Then Pandas uses to_csv to write them to the sqlalchemy
 engine, which uses the metadata wrapper (and its custom conversions)
 to write them to a very specific format that Dismod-AT is able to read.
 """
-from copy import deepcopy
+import os
+import tempfile
+from contextlib import contextmanager
+from functools import lru_cache
 from textwrap import dedent
 from pathlib import Path
-from typing import Union
+from numbers import Integral, Real
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
 from pandas.core.dtypes.base import ExtensionDtype
 from sqlalchemy import Enum, Integer, Float
-from sqlalchemy import create_engine
+from sqlalchemy import MetaData, create_engine
 from sqlalchemy.exc import StatementError
+from sqlalchemy.pool import NullPool
 
 from cascade_at.core.log import get_loggers
 from cascade_at.core.errors import DismodFileError
+from cascade_at.dismod.api import DismodAPIError
 from cascade_at.dismod.api.table_metadata import Base, add_columns_to_table
 
 LOG = get_loggers(__name__)
 
 
 def get_engine(file_path):
+    """
+    Gets the engine for a file. There is one engine per path in a process,
+    so making many objects for the same file doesn't make many engines.
+    Every call with None makes a new in-memory database.
+    """
     if file_path is not None:
-        full_path = file_path.expanduser().absolute()
-        engine = create_engine("sqlite:///{}".format(str(full_path)))
-    else:
-        engine = create_engine("sqlite:///:memory:", echo=False)
-    return engine
+        return _file_engine(str(file_path.expanduser().absolute()))
+    return create_engine("sqlite:///:memory:", echo=False)
+
+
+@lru_cache(maxsize=256)
+def _file_engine(full_path: str):
+    return _new_file_engine(full_path)
+
+
+def _new_file_engine(full_path: str):
+    """
+    Connections aren't pooled, so an engine holds no open file and
+    can be shared after a fork.
+    """
+    return create_engine("sqlite:///{}".format(full_path), poolclass=NullPool)
+
+
+def copy_database(source, destination) -> None:
+    """
+    Copies the whole database behind one engine into the database
+    behind another engine with a single call to the SQLite backup API.
+    Anything already in the destination is replaced.
+
+    Parameters
+    ----------
+    source
+        SQLAlchemy engine to copy from, which may be in memory
+    destination
+        SQLAlchemy engine to copy to
+    """
+    source_connection = source.raw_connection()
+    destination_connection = destination.raw_connection()
+    try:
+        source_connection.connection.backup(destination_connection.connection)
+    finally:
+        destination_connection.close()
+        source_connection.close()
+
+
+def _quote(name: str) -> str:
+    """Quotes an SQLite identifier."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _sql_literal(value) -> Optional[str]:
+    """
+    Writes numbers as SQL literals, so that long lists of ids
+    don't run into SQLite's limit on the number of parameters.
+    Returns None for values that have to be passed as parameters.
+    """
+    if isinstance(value, (bool, np.bool_)) or isinstance(value, Integral):
+        return str(int(value))
+    if isinstance(value, Real):
+        if not np.isfinite(value):
+            raise ValueError(f"Cannot select rows equal to {value}.")
+        return repr(float(value))
+    return None
+
+
+def _where_clauses(where: Dict[str, Any]) -> Tuple[List[str], List[Any]]:
+    """
+    Turns a dictionary of column to value, or column to list of values,
+    into SQL conditions and their parameters.
+    """
+    clauses = list()
+    params = list()
+    for column, value in where.items():
+        if isinstance(value, (list, tuple, set, np.ndarray, pd.Series, pd.Index)):
+            terms = list()
+            for v in value:
+                literal = _sql_literal(v)
+                if literal is None:
+                    literal = "?"
+                    params.append(v)
+                terms.append(literal)
+            clauses.append(f"{_quote(column)} IN ({', '.join(terms)})")
+        else:
+            literal = _sql_literal(value)
+            if literal is None:
+                literal = "?"
+                params.append(value)
+            clauses.append(f"{_quote(column)} = {literal}")
+    return clauses, params
+
+
+def _is_integer_type(column_type: str) -> bool:
+    return column_type.startswith("integer")
+
+
+def _numeric_dtype(column_types: Dict[str, str]) -> Optional[np.dtype]:
+    """
+    A structured dtype to read the columns into, or None if any of
+    them isn't numeric. Integers are read as floats so that nulls become NaN,
+    and become integers again in :py:func:`_harmonize_columns`.
+    """
+    if not all(t == "real" or _is_integer_type(t) for t in column_types.values()):
+        return None
+    return np.dtype([(column, np.float64) for column in column_types])
+
+
+def _frame_from_array(rows: np.ndarray) -> pd.DataFrame:
+    return pd.DataFrame({name: rows[name] for name in rows.dtype.names}, columns=list(rows.dtype.names))
+
+
+def _python_value(value):
+    """sqlite3 binds Python numbers, not NumPy ones."""
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _harmonize_columns(df: pd.DataFrame, column_types: Dict[str, str]) -> pd.DataFrame:
+    """
+    Gives the columns of a query result the same types that
+    ``pd.read_sql_table`` would give them from the declared column types:
+    real columns are floats, and integer columns are integers unless they have nulls.
+    """
+    for column, column_type in column_types.items():
+        if column_type == "real":
+            df[column] = df[column].astype(np.float64)
+        elif _is_integer_type(column_type):
+            if df[column].notnull().all():
+                df[column] = df[column].astype(np.int64)
+            else:
+                df[column] = df[column].astype(np.float64)
+    return df
+
+
+def _executemany_insert(pd_table, conn, keys, data_iter):
+    """
+    Insert method for ``DataFrame.to_sql`` that hands all rows
+    to the sqlite3 cursor in a single ``executemany`` call,
+    skipping SQLAlchemy's per-row parameter processing.
+    """
+    columns = ", ".join(f'"{k}"' for k in keys)
+    placeholders = ", ".join("?" for _ in keys)
+    statement = f'INSERT INTO "{pd_table.name}" ({columns}) VALUES ({placeholders})'
+    cursor = conn.connection.cursor()
+    try:
+        cursor.executemany(statement, list(data_iter))
+    finally:
+        cursor.close()
 
 
 class DismodSQLite:
@@ -54,8 +202,10 @@ class DismodSQLite:
     to the avgint and data tables. These arguments are dictionaries from
     column name to column type.
 
-    This uses a deep copy of the metadata module so that, when it adds columns
-    to tables, it doesn't affect the module itself.
+    The table definitions are shared with the metadata module until columns
+    are added to a table. Then that table alone is copied, with ``to_metadata``,
+    into metadata that belongs to this object, so adding columns doesn't
+    affect the module itself.
 
     Example:
     >>> from pathlib import Path
@@ -66,6 +216,19 @@ class DismodSQLite:
     >>> data = dm.read_table('data')
     >>> time = pd.DataFrame({'time': [1997, 2005, 2017]})
     >>> dm.write_table('time', time)
+
+    To write many tables at once, use a bulk-write session so that
+    all of the tables go to the file in one transaction.
+
+    >>> with dm.bulk_write(journal_mode='MEMORY', synchronous='OFF'):
+    >>>     dm.write_table('time', time)
+    >>>     dm.write_table('age', age)
+
+    To build the database in memory and copy it to the path at the end,
+    use a staging session.
+
+    >>> with dm.staged():
+    >>>     dm.write_table('time', time)
     """
 
     def __init__(self, path: Union[str, Path]):
@@ -82,16 +245,152 @@ class DismodSQLite:
         self.path = path
         LOG.debug(f"Creating an engine at {path.absolute()}.")
         self.engine = get_engine(path)
-        self._metadata = deepcopy(Base.metadata)
-        self._table_definitions = self._metadata.tables
+        # Tables are shared with the table metadata module until
+        # update_table_columns adds columns to one, which copies it first.
+        self._metadata = None
+        self._table_definitions = dict(Base.metadata.tables)
+        self._bulk_connection = None
+        self._staged = False
+        self._trusted = False
         LOG.debug(f"dmfile tables {self._table_definitions.keys()}")
 
+    @property
+    def connectable(self):
+        """
+        The SQLAlchemy connectable to read and write with. This is the
+        engine, unless a bulk-write session is open, in which case it is
+        the session's connection.
+        """
+        if self._bulk_connection is not None:
+            return self._bulk_connection
+        return self.engine
+
+    @contextmanager
+    def bulk_write(self, journal_mode: Optional[str] = None, synchronous: Optional[str] = None):
+        """
+        Opens a bulk-write session. Every table read and written inside the
+        session goes through one connection and one transaction, so the file is
+        synced once when the session closes instead of once per table.
+        Rows are inserted with a single ``executemany`` per table.
+        If anything fails inside the session, none of the writes are kept.
+
+        Sessions can be nested, in which case the inner session joins
+        the outer one and its pragma arguments are ignored.
+
+        Arguments
+        =========
+        journal_mode
+            An optional SQLite ``journal_mode`` pragma for the session, e.g. "MEMORY"
+            or "WAL". "MEMORY" avoids creating a rollback journal next to the file.
+            Don't use "OFF": without a journal, SQLite can't roll back, so a failed
+            session would keep the writes it made.
+        synchronous
+            An optional SQLite ``synchronous`` pragma for the session, e.g. "NORMAL"
+            or "OFF". This only risks the file if the machine crashes, not
+            the rollback of a failed session.
+        """
+        if self._bulk_connection is not None:
+            yield self
+            return
+
+        connection = self.engine.connect()
+        dbapi_connection = connection.connection.connection
+        isolation_level = dbapi_connection.isolation_level
+        pragmas = {
+            name: value for name, value in
+            [('journal_mode', journal_mode), ('synchronous', synchronous)]
+            if value is not None
+        }
+        previous = dict()
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                previous[name] = cursor.execute(f"PRAGMA {name}").fetchone()[0]
+                cursor.execute(f"PRAGMA {name} = {value}")
+            # The sqlite3 module doesn't put DDL statements in a transaction,
+            # so turn off its transaction handling and open one explicitly.
+            dbapi_connection.isolation_level = None
+            transaction = connection.begin()
+            cursor.execute("BEGIN")
+            LOG.debug(f"Opened bulk-write session on {self.path} with pragmas {pragmas}.")
+            self._bulk_connection = connection
+            try:
+                yield self
+            except BaseException:
+                transaction.rollback()
+                raise
+            else:
+                transaction.commit()
+            finally:
+                self._bulk_connection = None
+        finally:
+            dbapi_connection.isolation_level = isolation_level
+            for name, value in previous.items():
+                cursor.execute(f"PRAGMA {name} = {value}")
+            cursor.close()
+            connection.close()
+
+    @contextmanager
+    def staged(self, scratch_dir: Optional[Union[str, Path]] = None):
+        """
+        Opens a staging session. Inside the session, all reads and writes go
+        to a copy of the database that lives in memory, or in a file in
+        ``scratch_dir``. When the session closes without error, the copy replaces
+        the database at ``self.path`` with one SQLite backup, so the file
+        at the path sees one large write instead of many small ones.
+        If the session fails, the database at the path is left as it was.
+
+        If there is already a database at the path, the staged copy starts from it.
+
+        Arguments
+        =========
+        scratch_dir
+            An optional directory, e.g. on node-local disk, to stage the database in.
+            If not given, the database is staged in memory.
+        """
+        if self._staged:
+            yield self
+            return
+        if self._bulk_connection is not None:
+            raise DismodAPIError("Cannot open a staging session inside a bulk-write session.")
+
+        target_engine = self.engine
+        if scratch_dir is None:
+            stage_file = None
+        else:
+            handle, stage_file = tempfile.mkstemp(
+                prefix=f"{self.path.stem}_", suffix=self.path.suffix, dir=str(scratch_dir)
+            )
+            os.close(handle)
+            stage_file = Path(stage_file)
+        if stage_file is None:
+            stage_engine = get_engine(None)
+        else:
+            stage_engine = _new_file_engine(str(stage_file))
+        LOG.debug(f"Staging {self.path} in {stage_file or 'memory'}.")
+        try:
+            if self.path.exists():
+                copy_database(source=target_engine, destination=stage_engine)
+            self.engine = stage_engine
+            self._staged = True
+            try:
+                yield self
+            finally:
+                self.engine = target_engine
+                self._staged = False
+            LOG.debug(f"Copying staged database to {self.path}.")
+            copy_database(source=stage_engine, destination=target_engine)
+        finally:
+            stage_engine.dispose()
+            if stage_file is not None:
+                stage_file.unlink()
+
     def create_tables(self, tables=None):
         """
         Make all of the tables in the metadata.
         """
         LOG.debug(f"Creating table subset {tables}")
-        Base.metadata.create_all(self.engine, tables, checkfirst=False)
+        Base.metadata.create_all(self.connectable, tables, checkfirst=False)
 
     def update_table_columns(self, table_name, table):
         """
@@ -118,27 +417,290 @@ class DismodSQLite:
 
             raise ValueError(dedent(msg))
 
+        if table_definition.metadata is Base.metadata:
+            if self._metadata is None:
+                self._metadata = MetaData()
+            table_definition = table_definition.to_metadata(self._metadata)
+            self._table_definitions[table_name] = table_definition
         add_columns_to_table(table_definition, new_column_types)
 
-    def read_table(self, table_name):
+    def read_table(self, table_name: str, columns: Optional[List[str]] = None,
+                   where: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
         """
         Read a table from the database in engine specified.
+
+        Optionally reads only some columns and rows. The selection happens
+        in SQLite, so rows that aren't asked for never reach Python.
+
+        Tables whose columns are all numbers, like sample, predict and fit_var,
+        are read with the sqlite3 cursor directly into NumPy arrays,
+        which is several times faster than going through SQLAlchemy.
+
+        >>> dm.read_table('sample', where={'sample_index': 3})
+        >>> dm.read_table('avgint', columns=['avgint_id'], where={'c_location_id': [101, 102]})
+
+        Arguments
+        =========
+        table_name
+            The name of the table to read
+        columns
+            An optional list of columns to read. Defaults to all columns.
+        where
+            An optional dictionary from column name to a value, which keeps
+            rows where the column equals the value, or to a list of values,
+            which keeps rows where the column is one of the values.
+            Conditions on different columns are combined with "and".
+        """
+        query, params, column_types = self._select(table_name, columns=columns, where=where)
+        dtype = _numeric_dtype(column_types)
+        if dtype is not None:
+            try:
+                return self._read_numeric(query, params, dtype, column_types)
+            except (TypeError, ValueError):
+                LOG.debug(f"Table {table_name} has values that aren't numbers, reading it with pandas.")
+        if columns is None and where is None:
+            return pd.read_sql_table(table_name=table_name, con=self.connectable)
+        df = pd.read_sql_query(query, con=self.connectable, params=params)
+        return _harmonize_columns(df, column_types)
+
+    def iter_table(self, table_name: str, chunksize: int, columns: Optional[List[str]] = None,
+                   where: Optional[Dict[str, Any]] = None) -> Iterator[pd.DataFrame]:
+        """
+        Reads a table in chunks of rows from a single query, so that a large
+        table, like sample or predict, can be processed without holding all of it
+        in memory. The chunks have the same column types that :py:meth:`read_table` gives.
+
+        >>> for chunk in dm.iter_table('predict', chunksize=100000, where={'sample_index': [0, 1]}):
+        >>>     ...
+
+        Arguments
+        =========
+        table_name
+            The name of the table to read
+        chunksize
+            The number of rows in each chunk
+        columns
+            An optional list of columns to read, as in :py:meth:`read_table`.
+        where
+            An optional selection of rows, as in :py:meth:`read_table`.
+        """
+        query, params, column_types = self._select(table_name, columns=columns, where=where)
+        dtype = _numeric_dtype(column_types)
+        with self._cursor() as cursor:
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunksize)
+                if not rows:
+                    break
+                chunk = None
+                if dtype is not None:
+                    try:
+                        chunk = _frame_from_array(np.array(rows, dtype=dtype))
+                    except (TypeError, ValueError):
+                        pass
+                if chunk is None:
+                    chunk = pd.DataFrame.from_records(rows, columns=list(column_types), coerce_float=True)
+                yield _harmonize_columns(chunk, column_types)
+
+    def _read_numeric(self, query: str, params: List[Any], dtype: np.dtype,
+                      column_types: Dict[str, str]) -> pd.DataFrame:
+        """
+        Reads the result of a query on numeric columns with the sqlite3 cursor,
+        straight into a preallocated NumPy array, skipping SQLAlchemy and the
+        row-by-row construction of Python objects in pandas.
+        """
+        with self._cursor() as cursor:
+            count = cursor.execute(f"SELECT COUNT(*) FROM ({query})", params).fetchone()[0]
+            cursor.execute(query, params)
+            rows = np.fromiter(cursor, dtype=dtype, count=count)
+            if cursor.fetchone() is not None:
+                raise ValueError("The table changed while it was being read.")
+        return _harmonize_columns(_frame_from_array(rows), column_types)
+
+    @contextmanager
+    def _cursor(self):
+        """
+        A sqlite3 cursor on the connection that this object reads with.
+        """
+        if self._bulk_connection is not None:
+            cursor = self._bulk_connection.connection.cursor()
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+        else:
+            connection = self.engine.raw_connection()
+            cursor = connection.cursor()
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+                connection.close()
+
+    def _select(self, table_name: str, columns: Optional[List[str]],
+                where: Optional[Dict[str, Any]]) -> Tuple[str, List[Any], Dict[str, str]]:
+        """
+        Builds the query for a selection of columns and rows from a table,
+        returning the query, its parameters and the types of the selected columns.
+        """
+        column_types = self._column_types(table_name)
+        if columns is None:
+            columns = list(column_types.keys())
+        missing = [c for c in columns + list((where or dict()).keys()) if c not in column_types]
+        if missing:
+            raise DismodFileError(f"Table '{table_name}' doesn't have columns {missing}.")
+
+        select = ", ".join(_quote(c) for c in columns)
+        query = f"SELECT {select} FROM {_quote(table_name)}"
+        clauses, params = _where_clauses(where or dict())
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        return query, params, {c: column_types[c] for c in columns}
+
+    def _column_types(self, table_name: str) -> Dict[str, str]:
+        """
+        The declared SQLite type of each column in a table in the file,
+        in table order.
         """
-        return pd.read_sql_table(table_name=table_name, con=self.engine)
+        with self._cursor() as cursor:
+            info = cursor.execute(f"PRAGMA table_info({_quote(table_name)})").fetchall()
+        if not info:
+            raise ValueError(f"Table {table_name} not found")
+        return {row[1]: row[2].lower() for row in info}
+
+    @contextmanager
+    def trusted_writes(self):
+        """
+        Writes every table inside the context as if with ``trusted=True``,
+        skipping the checks on columns and types. This is for frames
+        that this package builds itself, in ``fill_extract_helpers``.
+        """
+        if self._trusted:
+            yield self
+            return
+        self._trusted = True
+        try:
+            yield self
+        finally:
+            self._trusted = False
 
-    def write_table(self, table_name, table):
+    def write_table(self, table_name, table, trusted=False, mode="replace", keys=None):
         """
         Writes a table to the database in the engine specified.
 
+        Besides replacing the table, rows can be appended to it or upserted
+        into it. Appended rows are numbered after the last id in the table,
+        whatever ``{table_name}_id`` they came with. Upserted rows that match
+        the ``keys`` of a row in the table update that row and keep its id,
+        and the rest are appended. So the ids stay numbered from zero without
+        gaps, as DisMod-AT needs, and rows keep their order in the file.
+        If the table doesn't exist yet, both modes write it as new. Extra
+        columns, like "c_" comments, are added to the table in the file.
+
+        >>> dm.write_table('sample', samples_for_one_index, mode='append')
+        >>> dm.write_table('fit_var', refit, mode='upsert', keys=['fit_var_id'])
+
         Parameters:
             table_name (str): the name of the table to write to
             table (pd.DataFrame): data frame to write
+            trusted (bool): skip the checks on columns and types, for frames
+                that are built by this package and known to be right
+            mode (str): one of "replace", "append" or "upsert"
+            keys (List[str]): the columns that identify a row when upserting,
+                which default to the table's id column
+        """
+        if mode not in ["replace", "append", "upsert"]:
+            raise ValueError(f"Unknown write mode {mode}, must be replace, append or upsert.")
+        if mode == "replace":
+            self._write_rows(table_name, table, trusted=trusted, if_exists="replace")
+            return
+        with self.bulk_write():
+            try:
+                column_types = self._column_types(table_name)
+            except ValueError:
+                self._write_rows(table_name, table, trusted=trusted, if_exists="replace")
+                return
+            self._add_columns(table_name, table, column_types)
+            table = self._number_rows(table_name, table, mode=mode, keys=keys, trusted=trusted)
+            self._write_rows(table_name, table, trusted=trusted, if_exists="append")
+
+    def _add_columns(self, table_name, table, column_types):
+        """
+        Adds the columns of a frame that a table in the file doesn't have yet,
+        which :py:meth:`update_table_columns` allows, to the table in the file.
+        """
+        new_columns = [c for c in table.columns if c not in column_types]
+        if not new_columns:
+            return
+        self.update_table_columns(table_name, table)
+        table_definition = self._table_definitions[table_name]
+        with self._cursor() as cursor:
+            for name in new_columns:
+                column_type = table_definition.c[name].type.compile(dialect=self.engine.dialect)
+                cursor.execute(f"ALTER TABLE {_quote(table_name)} ADD COLUMN {_quote(name)} {column_type}")
+
+    def _number_rows(self, table_name, table, mode, keys, trusted):
+        """
+        Gives ids to rows that will be added to an existing table. For an upsert,
+        rows that match existing rows are updated here and left out of the result.
+        The rows that are left are new, and any ids they had are replaced, so that
+        they can't leave a gap or collide with a row already in the table.
         """
+        id_column = f"{table_name}_id"
+        table = table.copy()
+        if id_column not in table:
+            table[id_column] = np.nan
+        if mode == "upsert":
+            keys = keys or [id_column]
+            if keys != [id_column]:
+                existing = self.read_table(
+                    table_name, columns=keys + [id_column],
+                    where={k: table[k].unique() for k in keys}
+                )
+                if existing[keys].duplicated().any():
+                    raise DismodFileError(f"Keys {keys} don't identify single rows of table '{table_name}'.")
+                table[id_column] = table[keys].merge(existing, on=keys, how='left')[id_column].values
+            matched = table[id_column].notnull()
+            if matched.any():
+                present = self.read_table(
+                    table_name, columns=[id_column], where={id_column: table.loc[matched, id_column].unique()}
+                )
+                matched &= table[id_column].isin(present[id_column])
+                self._update_rows(table_name, table.loc[matched], id_column, trusted=trusted)
+                table = table.loc[~matched]
+        if len(table):
+            with self._cursor() as cursor:
+                next_id = cursor.execute(
+                    f"SELECT COALESCE(MAX({_quote(id_column)}) + 1, 0) FROM {_quote(table_name)}"
+                ).fetchone()[0]
+            table[id_column] = np.arange(next_id, next_id + len(table))
+        table[id_column] = table[id_column].astype(np.int64)
+        return table
+
+    def _update_rows(self, table_name, table, id_column, trusted):
+        columns = [c for c in table.columns if c != id_column]
+        if not columns:
+            return
+        if not (trusted or self._trusted):
+            # The rows may update only some columns, so only those are checked.
+            table = table.copy()
+            self._validate_data(self._table_definitions[table_name], table, partial=True)
+        assignments = ", ".join(f"{_quote(c)} = ?" for c in columns)
+        values = table[columns + [id_column]].astype(object)
+        values = values.where(values.notnull(), None)
+        with self._cursor() as cursor:
+            cursor.executemany(
+                f"UPDATE {_quote(table_name)} SET {assignments} WHERE {_quote(id_column)} = ?",
+                [tuple(_python_value(v) for v in row) for row in values.itertuples(index=False)]
+            )
+
+    def _write_rows(self, table_name, table, trusted, if_exists):
         table_definition = self._table_definitions[table_name]
 
         extra_columns = set(table.columns.difference(table_definition.c.keys()))
         if extra_columns:
             self.update_table_columns(table_name, table)
+            table_definition = self._table_definitions[table_name]
 
         # Force the table to have the dismod-required columns
         dtypes = {k: v.type for k, v in table_definition.c.items()}
@@ -147,7 +709,8 @@ class DismodSQLite:
             table[id_column] = table.reset_index(drop=True).index
         table = pd.DataFrame(table, columns = dtypes.keys())
 
-        self._validate_data(table_definition, table)
+        if not (trusted or self._trusted):
+            self._validate_data(table_definition, table)
 
         try:
             table = table.set_index(id_column)
@@ -159,10 +722,11 @@ class DismodSQLite:
             table.index.name = None
             table.to_sql(
                 name=table_name,
-                con=self.engine,
+                con=self.connectable,
                 index_label=id_column,
-                if_exists="replace",
-                dtype=dtypes
+                if_exists=if_exists,
+                dtype=dtypes,
+                method=_executemany_insert if self._bulk_connection is not None else None
             )
         except StatementError:
             raise
@@ -180,7 +744,7 @@ class DismodSQLite:
             df = pd.concat([df, extras], axis=1)
         return df
 
-    def _validate_data(self, table_definition, data):
+    def _validate_data(self, table_definition, data, partial=False):
         """Validates that the dtypes in data match the expected types in the
         table_definition.
         Pandas makes this difficult because DataFrames with no length have
@@ -194,46 +758,68 @@ class DismodSQLite:
          * For a float column, infinity is the maximum float value,
            which is ``10e318`` or minimum, which is ``-10e318`` according to
            Dismod-AT's arbitrary version of calculating this.
+
+        If partial, the data may leave out required columns, as for rows
+        that update some of the columns of a table.
         """
         if len(data) == 0:
             # Length zero columns get converted on write.
             return
 
-        columns_checked = set()
-
-        for column_name, column_definition in table_definition.c.items():
-            if column_name in data:
-                expected_type = self._expected_type(column_definition)
-                is_nullable_numeric = (column_definition.nullable and
-                                       expected_type in [int, float])
-                if is_nullable_numeric:
-                    data[column_name] = data[column_name].fillna(value=np.nan)
-                actual_type = data[column_name].dtype
-                is_pandas_extension = isinstance(actual_type, ExtensionDtype)
-                if expected_type is int:
-                    self._check_int_type(actual_type, column_name,
-                                         is_pandas_extension, table_definition)
-                elif expected_type is float:
-                    self._check_float_type(actual_type, column_name,
-                                           table_definition)
-                elif expected_type is str:
-                    self._check_str_type(actual_type, column_name, data,
-                                         table_definition)
+        # The checks depend only on the table's columns and the column dtypes,
+        # so they run once for each layout of data written to a table.
+        signature = tuple(zip(data.columns, data.dtypes))
+        for column_name in _validation_plan(_table_layout(table_definition), signature, partial):
+            data[column_name] = data[column_name].fillna(value=np.nan)
+            self._check_column_type(table_definition.name, self._expected_type(table_definition.c[column_name]),
+                                    column_name, data[column_name].dtype, data)
+
+    @classmethod
+    def _check_data_layout(cls, layout, dtypes, partial=False):
+        """
+        Checks the columns and dtypes of data for a table with the layout
+        from :py:func:`_table_layout`, given as a dict from column name to dtype. Returns the names of nullable numeric
+        columns with object dtype, which may hold None and are only
+        checked after those become NaN. If partial, required columns
+        may be missing.
+        """
+        table_name, columns = layout
+        to_fill = list()
+        for column_name, expected_type, nullable, primary_key in columns:
+            if column_name in dtypes:
+                actual_type = dtypes[column_name]
+                is_nullable_numeric = nullable and expected_type in [int, float]
+                if is_nullable_numeric and actual_type == np.dtype('O'):
+                    to_fill.append(column_name)
                 else:
-                    raise RuntimeError(f"Unexpected type from column "
-                                       f"definitions: {expected_type}.")
-            elif not (column_definition.primary_key or
-                      column_definition.nullable):
+                    cls._check_column_type(table_name, expected_type, column_name, actual_type)
+            elif not (partial or primary_key or nullable):
                 raise DismodFileError(f"Missing column in data for table "
-                                      f"'{table_definition.name}': "
+                                      f"'{table_name}': "
                                       f"'{column_name}'")
-            columns_checked.add(column_name)
 
-        extra_columns = set(data.columns).difference(table_definition.c.keys())
+        extra_columns = set(dtypes).difference(column[0] for column in columns)
         if extra_columns:
             raise DismodFileError(f"extra columns in data for table "
-                                  f"'{table_definition.name}': {extra_columns}"
+                                  f"'{table_name}': {extra_columns}"
                                   )
+        return tuple(to_fill)
+
+    @classmethod
+    def _check_column_type(cls, table_name, expected_type, column_name, actual_type, data=None):
+        is_pandas_extension = isinstance(actual_type, ExtensionDtype)
+        if expected_type is int:
+            cls._check_int_type(actual_type, column_name,
+                                is_pandas_extension, table_name)
+        elif expected_type is float:
+            cls._check_float_type(actual_type, column_name,
+                                  table_name)
+        elif expected_type is str:
+            cls._check_str_type(actual_type, column_name, data,
+                                table_name)
+        else:
+            raise RuntimeError(f"Unexpected type from column "
+                               f"definitions: {expected_type}.")
 
     @staticmethod
     def _expected_type(column_definition):
@@ -251,13 +837,13 @@ class DismodSQLite:
         return expected_type
 
     @staticmethod
-    def _check_int_type(actual_type, column_name, is_pandas_extension, table_definition):
+    def _check_int_type(actual_type, column_name, is_pandas_extension, table_name):
         if is_pandas_extension:
             if actual_type.is_dtype(pd.Int64Dtype()):
                 return
             else:
                 raise DismodFileError(
-                    f"column '{column_name}' in data for table '{table_definition.name}' must be integer"
+                    f"column '{column_name}' in data for table '{table_name}' must be integer"
                 )
         else:
             # Permit np.float because an int column with a None is cast to float.
@@ -266,24 +852,49 @@ class DismodSQLite:
             allowed = [np.integer, np.floating]
             if not any(np.issubdtype(actual_type, given_type) for given_type in allowed):
                 raise DismodFileError(
-                    f"column '{column_name}' in data for table '{table_definition.name}' must be integer"
+                    f"column '{column_name}' in data for table '{table_name}' must be integer"
                 )
 
     @staticmethod
-    def _check_float_type(actual_type, column_name, table_definition):
+    def _check_float_type(actual_type, column_name, table_name):
         if not np.issubdtype(actual_type, np.number):
             raise DismodFileError(
-                f"column '{column_name}' in data for table '{table_definition.name}' must be numeric"
+                f"column '{column_name}' in data for table '{table_name}' must be numeric"
             )
 
     @staticmethod
-    def _check_str_type(actual_type, column_name, data, table_definition):
-        if len(data) > 0:
-            correct = data[column_name].dtype == np.dtype('O')
+    def _check_str_type(actual_type, column_name, data, table_name):
+        # Data is empty only when it is None, because empty data isn't checked.
+        if data is None or len(data) > 0:
+            correct = actual_type == np.dtype('O')
             if not correct:
                 raise DismodFileError(
-                    f"column '{column_name}' in data for table '{table_definition.name}' must be string "
+                    f"column '{column_name}' in data for table '{table_name}' must be string "
                     f"but type is {actual_type}."
                 )
         else:
             pass  # Will convert to string on write of empty rows.
+
+
+def _table_layout(table_definition) -> Tuple[str, Tuple[Tuple[str, type, bool, bool], ...]]:
+    """
+    What the checks on data need from a table definition: the table name and,
+    for each column, its name, expected type, and whether it is nullable and
+    a primary key. Tables of different DismodSQLite objects with the same
+    columns have the same layout.
+    """
+    return table_definition.name, tuple(
+        (name, DismodSQLite._expected_type(column), bool(column.nullable), bool(column.primary_key))
+        for name, column in table_definition.c.items()
+    )
+
+
+@lru_cache(maxsize=1024)
+def _validation_plan(layout, signature, partial=False) -> Tuple[str, ...]:
+    """
+    The checks in :py:meth:`DismodSQLite._check_data_layout`, cached for each
+    table layout and tuple of (column name, dtype). The key holds no table
+    objects, so the cache doesn't keep them alive. A layout that fails raises
+    each time, because exceptions aren't cached.
+    """
+    return DismodSQLite._check_data_layout(layout, dict(signature), partial)
@@ -0,0 +1,384 @@
+"""
+Backends that run the tasks of a DisMod thread pool.
+
+Each backend has the part of the ``multiprocessing.Pool`` interface that
+:py:mod:`cascade_at.dismod.api.multithreading` uses: ``apply_async``,
+which returns a result with ``ready()`` and ``get()``, and ``map``.
+
+ * ``process``: a pool of processes, which is the default.
+ * ``thread``: a pool of threads. The work in a task is mostly an external
+   dmdismod process, so threads are enough, and they start without
+   forking a large parent process.
+ * ``directory``: a queue of task files in a shared directory, which
+   any number of workers, on this node or others, take tasks from.
+   Start workers on other nodes, for instance as a job array, with
+   ``dismod_queue_worker --queue-dir <directory>``.
+"""
+import multiprocessing
+import os
+import pickle
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from cascade_at.core.log import get_loggers
+from cascade_at.dismod.api import DismodAPIError
+
+LOG = get_loggers(__name__)
+
+BACKENDS = ['process', 'thread', 'directory']
+
+# Functions that a queue worker calls when it stops, by a key that makes each one run once.
+_AT_WORKER_EXIT: Dict[str, Callable[[], None]] = dict()
+_IN_QUEUE_WORKER = False
+
+
+class _Executor:
+    """
+    Runs functions on arguments in a pool of workers. Use it as a
+    context manager, which stops the workers when it closes.
+    Tasks that are still running then are abandoned.
+    """
+    def __init__(self, n_workers: int):
+        self.n_workers = n_workers
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def apply_async(self, fn: Callable, args: Tuple = ()):
+        raise NotImplementedError
+
+    def map(self, fn: Callable, iterable: Iterable) -> List:
+        results = [self.apply_async(fn, (x,)) for x in iterable]
+        return [r.get() for r in results]
+
+    def close(self) -> None:
+        raise NotImplementedError
+
+
+class ProcessExecutor(_Executor):
+    """A pool of processes from ``multiprocessing``."""
+    def __init__(self, n_workers: int):
+        super().__init__(n_workers)
+        self._pool = Pool(n_workers)
+
+    def apply_async(self, fn, args=()):
+        return self._pool.apply_async(fn, args)
+
+    def map(self, fn, iterable):
+        return self._pool.map(fn, iterable)
+
+    def close(self):
+        self._pool.terminate()
+
+
+class ThreadExecutor(ProcessExecutor):
+    """
+    A pool of threads. Closing it waits for running tasks, because
+    threads can't be stopped, so set a timeout on dmdismod commands.
+    """
+    def __init__(self, n_workers: int):
+        _Executor.__init__(self, n_workers)
+        self._pool = ThreadPool(n_workers)
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+
+class _FileResult:
+    """
+    The result of a task in a directory queue, which is a file once the task finishes.
+    It is also ready, and getting it raises, if the worker that took the task has died.
+    """
+    def __init__(self, path: Path, executor: 'DirectoryQueueExecutor'):
+        self._path = path
+        self._executor = executor
+
+    def ready(self) -> bool:
+        return self._path.exists() or self._executor._failure(self._path.name) is not None
+
+    def wait(self, timeout: Optional[float] = None, poll_interval: float = 0.1) -> None:
+        start = time.perf_counter()
+        while not self.ready():
+            if timeout is not None and time.perf_counter() - start > timeout:
+                return
+            time.sleep(poll_interval)
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        self.wait(timeout=timeout)
+        if not self._path.exists():
+            failure = self._executor._failure(self._path.name)
+            if failure is not None:
+                raise DismodAPIError(failure)
+            raise multiprocessing.TimeoutError(f"The task {self._path.name} didn't finish in {timeout} seconds.")
+        with open(self._path, 'rb') as f:
+            ok, value = pickle.load(f)
+        if not ok:
+            raise value
+        return value
+
+
+class DirectoryQueueExecutor(_Executor):
+    """
+    A queue of tasks in a directory. Each task is a pickle in ``pending``,
+    and a worker takes it by renaming it into ``running``, which only one
+    worker can do. The worker writes the result to ``done``, and until then
+    it touches the file in ``running`` as a heartbeat. A ``stop`` file
+    tells the workers to finish. Workers import the functions of the tasks,
+    so they can't be in a script that is run as ``__main__``, and the local
+    workers get this process's ``sys.path``.
+
+    A directory can be used again. The ``stop`` file and any tasks and results
+    left in it from before are removed when the executor starts, so start the
+    workers on other nodes after it.
+
+    Arguments
+    =========
+    queue_dir
+        A directory that every worker can see, which is created if needed
+    n_workers
+        The number of workers to start on this node. There can be zero
+        if workers on other nodes serve the queue.
+    poll_interval
+        How often, in seconds, the local workers look for tasks
+    cleanup
+        Whether to remove the directory when the executor closes
+    heartbeat_timeout
+        How long, in seconds, the heartbeat of a task on another node may
+        stop before its worker counts as dead and the task fails. Workers on
+        this node are checked by their process instead.
+    """
+    def __init__(self, queue_dir: Union[str, Path], n_workers: int, poll_interval: float = 0.1,
+                 cleanup: bool = False, heartbeat_timeout: float = 120.0):
+        super().__init__(n_workers)
+        self.queue_dir = Path(queue_dir)
+        self.cleanup = cleanup
+        self.heartbeat_timeout = heartbeat_timeout
+        self._host = socket.gethostname()
+        # The last modification time of each running task, and when this process saw it change.
+        self._heartbeats = dict()
+        self._clear()
+        self._count = 0
+        LOG.info(f"Queueing tasks in {self.queue_dir}. Start workers on other nodes with "
+                 f"dismod_queue_worker --queue-dir {self.queue_dir}")
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in sys.path if p))
+        self._workers = [
+            subprocess.Popen([
+                sys.executable, '-m', 'cascade_at.executor.dismod_queue_worker',
+                '--queue-dir', str(self.queue_dir), '--poll-interval', str(poll_interval)
+            ], env=env)
+            for _ in range(n_workers)
+        ]
+
+    def _clear(self) -> None:
+        """Removes what a queue that used this directory before left in it."""
+        stale = [self.queue_dir / 'stop'] + list(self.queue_dir.glob('*.tmp'))
+        for sub in ['pending', 'running', 'done']:
+            (self.queue_dir / sub).mkdir(parents=True, exist_ok=True)
+            stale.extend((self.queue_dir / sub).iterdir())
+        stale = [path for path in stale if path.exists()]
+        if stale:
+            LOG.warning(f"Removing {len(stale)} files left in the queue {self.queue_dir} from before.")
+        for path in stale:
+            path.unlink(missing_ok=True)
+
+    def apply_async(self, fn, args=()):
+        # Names sort in the order of submission, so workers take tasks in that order.
+        name = f"{self._count:08d}_{uuid.uuid4().hex}"
+        self._count += 1
+        temporary = self.queue_dir / f"{name}.tmp"
+        with open(temporary, 'wb') as f:
+            pickle.dump((fn, args), f)
+        temporary.rename(self.queue_dir / 'pending' / name)
+        return _FileResult(self.queue_dir / 'done' / name, executor=self)
+
+    def _worker_alive(self, pid: int) -> bool:
+        """Whether the worker with this pid on this node is alive."""
+        for worker in self._workers:
+            if worker.pid == pid:
+                return worker.poll() is None
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def _heartbeat_stopped(self, running: Path) -> bool:
+        """
+        Whether the file of a running task hasn't been touched for the heartbeat timeout.
+        The time is measured here, so clocks on other nodes don't matter.
+        """
+        try:
+            mtime = running.stat().st_mtime
+        except FileNotFoundError:
+            return False
+        now = time.monotonic()
+        seen = self._heartbeats.get(running.name)
+        if seen is None or seen[0] != mtime:
+            self._heartbeats[running.name] = (mtime, now)
+            return False
+        return now - seen[1] > self.heartbeat_timeout
+
+    def _failure(self, name: str) -> Optional[str]:
+        """Why the task will never have a result, because the worker running it has died, or None."""
+        for running in (self.queue_dir / 'running').glob(f"{name}.*"):
+            owner = running.name[len(name) + 1:]
+            if owner.endswith('.result'):
+                continue
+            host, _, pid = owner.rpartition('_')
+            if host == self._host:
+                dead = not self._worker_alive(int(pid))
+            else:
+                dead = self._heartbeat_stopped(running)
+            if dead and not (self.queue_dir / 'done' / name).exists():
+                return f"The worker {owner} died while running task {name}."
+        return None
+
+    def close(self):
+        (self.queue_dir / 'stop').touch()
+        for worker in self._workers:
+            try:
+                worker.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                worker.kill()
+        if self.cleanup:
+            shutil.rmtree(self.queue_dir, ignore_errors=True)
+
+
+def at_worker_exit(key: str, fn: Callable[[], None]) -> None:
+    """
+    Registers a function for the queue worker that runs the calling task
+    to call when it stops, once for each key, such as one that removes
+    what the tasks left on its node. Outside of a queue worker, it does nothing,
+    because the process that runs the pool cleans up after itself.
+    """
+    if _IN_QUEUE_WORKER:
+        _AT_WORKER_EXIT.setdefault(key, fn)
+
+
+def _heartbeat(running: Path, interval: float, finished: threading.Event) -> None:
+    """Touches the file of a running task until it finishes, so the parent can tell that its worker is alive."""
+    while not finished.wait(interval):
+        try:
+            os.utime(running)
+        except FileNotFoundError:
+            return
+
+
+def run_queue_worker(queue_dir: Union[str, Path], poll_interval: float = 0.5,
+                     heartbeat_interval: float = 10.0) -> int:
+    """
+    Takes tasks from a directory queue and runs them until the queue
+    has a ``stop`` file, and then calls the functions that tasks registered
+    with :py:func:`at_worker_exit`. Returns the number of tasks this worker ran.
+
+    Parameters
+    ----------
+    queue_dir
+        The directory of a :py:class:`DirectoryQueueExecutor`
+    poll_interval
+        How long, in seconds, to wait when there is no task to take
+    heartbeat_interval
+        How often, in seconds, to touch the file of the running task, which
+        has to be well within the executor's ``heartbeat_timeout``
+    """
+    global _IN_QUEUE_WORKER
+    _IN_QUEUE_WORKER = True
+    try:
+        n_run = _run_queue(Path(queue_dir), poll_interval, heartbeat_interval)
+    finally:
+        _IN_QUEUE_WORKER = False
+        while _AT_WORKER_EXIT:
+            key, fn = _AT_WORKER_EXIT.popitem()
+            try:
+                fn()
+            except Exception:
+                LOG.exception(f"Cleanup {key} failed when the worker stopped.")
+    return n_run
+
+
+def _run_queue(queue_dir: Path, poll_interval: float, heartbeat_interval: float) -> int:
+    me = f"{socket.gethostname()}_{os.getpid()}"
+    n_run = 0
+    while not (queue_dir / 'stop').exists():
+        took = False
+        for task in sorted((queue_dir / 'pending').iterdir()):
+            running = queue_dir / 'running' / f"{task.name}.{me}"
+            try:
+                task.rename(running)
+            except FileNotFoundError:
+                # Another worker took it first.
+                continue
+            took = True
+            finished = threading.Event()
+            heartbeat = threading.Thread(target=_heartbeat, args=(running, heartbeat_interval, finished), daemon=True)
+            heartbeat.start()
+            try:
+                with open(running, 'rb') as f:
+                    fn, args = pickle.load(f)
+                result = (True, fn(*args))
+            except Exception as error:
+                result = (False, error)
+            except SystemExit as error:
+                # run_dismod_commands exits when dmdismod fails, which mustn't stop the worker.
+                result = (False, DismodAPIError(f"The task exited with status {error.code}."))
+            finally:
+                finished.set()
+                heartbeat.join()
+            temporary = queue_dir / 'running' / f"{task.name}.{me}.result"
+            with open(temporary, 'wb') as f:
+                try:
+                    pickle.dump(result, f)
+                except Exception as error:
+                    f.seek(0)
+                    f.truncate()
+                    pickle.dump((False, DismodAPIError(f"Can't return the result of a task: {error}")), f)
+            temporary.rename(queue_dir / 'done' / task.name)
+            running.unlink()
+            n_run += 1
+            break
+        if not took:
+            time.sleep(poll_interval)
+    LOG.info(f"Worker {me} ran {n_run} tasks.")
+    return n_run
+
+
+def make_executor(backend: str, n_workers: int, queue_dir: Optional[Union[str, Path]] = None) -> _Executor:
+    """
+    Makes an executor for a backend by name.
+
+    Parameters
+    ----------
+    backend
+        One of "process", "thread" or "directory"
+    n_workers
+        The number of workers, which for a directory queue is the number
+        of workers on this node
+    queue_dir
+        For a directory queue, the directory to use, which must be visible to every worker.
+        If not given, it is a temporary directory, removed when the executor closes.
+    """
+    if backend == 'process':
+        return ProcessExecutor(n_workers)
+    if backend == 'thread':
+        return ThreadExecutor(n_workers)
+    if backend == 'directory':
+        if queue_dir is None:
+            return DirectoryQueueExecutor(tempfile.mkdtemp(prefix='dismod_queue_'), n_workers, cleanup=True)
+        return DirectoryQueueExecutor(queue_dir, n_workers)
+    raise DismodAPIError(f"Unknown executor backend {backend}, must be one of {BACKENDS}.")
@@ -1,5 +1,6 @@
 import pandas as pd
-from typing import Dict, List
+from pathlib import Path
+from typing import Dict, List, Optional, Union
 import numpy as np
 from scipy import stats
 
@@ -79,7 +80,8 @@ def get_prior_avgint_grid(grids: Dict[str, Dict[str, np.ndarray]],
 
 
 def format_rate_grid_for_ihme(rates: Dict[str, SmoothGrid], gbd_round_id: int,
-                              location_id: int, sex_id: int) -> pd.DataFrame:
+                              location_id: int, sex_id: int,
+                              age_metadata_file: Optional[Union[str, Path]] = None) -> pd.DataFrame:
     """
     Formats a grid of mean, upper, and lower for a prior rate
     for the IHME database. **Only does this for Gaussian priors.**
@@ -94,6 +96,9 @@ def format_rate_grid_for_ihme(rates: Dict[str, SmoothGrid], gbd_round_id: int,
         the location ID to append to this data frame
     sex_id
         the sex ID to append to this data frame
+    age_metadata_file
+        an optional CSV file of age group metadata to map ages with,
+        rather than querying it for the GBD round
 
     Returns
     -------
@@ -110,7 +115,7 @@ def format_rate_grid_for_ihme(rates: Dict[str, SmoothGrid], gbd_round_id: int,
         df['time_lower'] = df['time']
         df['time_upper'] = df['time']
 
-        df = format_age_time(df=df, gbd_round_id=gbd_round_id)
+        df = format_age_time(df=df, gbd_round_id=gbd_round_id, age_metadata_file=age_metadata_file)
 
         group_cols = ['age', 'time']
         # TODO: Once we can upgrade to pandas 1.1.0, then we can use the groupby(..., dropna=False)
@@ -1,9 +1,25 @@
-from typing import Union, List
+import copy
+import fcntl
+import shutil
+import sqlite3
+import statistics
+import time
+import traceback
+import uuid
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple, Union, List
 from pathlib import Path
 from shutil import copy2
-from multiprocessing import Pool
 
-from cascade_at.dismod.api.run_dismod import run_dismod
+from cascade_at.core.log import get_loggers
+from cascade_at.dismod.api import DismodAPIError
+from cascade_at.dismod.api.dismod_io import DismodIO
+from cascade_at.dismod.api.executors import _Executor, at_worker_exit, make_executor
+from cascade_at.dismod.api.run_dismod import DismodTimeoutError, kill_dismod, run_dismod
+from cascade_at.dismod.api.slim_clone import slim_clone
+
+LOG = get_loggers(__name__)
 
 
 class _DismodThread:
@@ -11,34 +27,621 @@ class _DismodThread:
     Splits a dismod database into multiple databases to run parallel
     processes on the database. The work happens when you call
     an instantiated _DismodThread.
+
+    Calling it copies the main database for each index. Alternatively,
+    :py:meth:`run_batch` copies it once for a batch of indices.
+    Subclasses list the tables that ``_process`` changes in ``reset_tables``,
+    which are restored from the main database before each index after
+    the first, and the tables that hold its results in ``result_tables``,
+    which are saved for each index in the index database.
+
+    If slim, the copies have only the tables that the dmdismod command
+    from ``_slim_command`` reads, made with
+    :py:func:`~cascade_at.dismod.api.slim_clone.slim_clone`.
+
+    Subclasses pass ``timeout`` to the dmdismod commands they run, and
+    ``track_process``, so that :py:meth:`abandon` can kill them. An
+    ``attempt`` after the first, from a relaunch, works in its own copy.
+
+    With a ``scratch_dir``, such as node-local disk or tmpfs, the main
+    database is staged into it once for each node, and the copies are made
+    and run there. Only the ``result_tables`` of each index, or the whole copy
+    if there are none, are written to the index database next to the main database.
+    The copies are removed whether ``_process`` succeeds or fails, and
+    :py:meth:`cleanup_scratch` removes the staged database. If the scratch
+    directory doesn't have room for the staged database, or for another copy
+    next to the copies that are already there, the copy is made next to the
+    main database instead.
     """
-    def __init__(self, main_db: Union[str, Path], index_file_pattern: str):
+    reset_tables: List[str] = []
+    result_tables: List[str] = []
+
+    def __init__(self, main_db: Union[str, Path], index_file_pattern: str, slim: bool = False,
+                 timeout: Optional[float] = None, scratch_dir: Optional[Union[str, Path]] = None):
         self.main_db = main_db
         self.index_file_pattern = index_file_pattern
+        self.slim = slim
+        self.timeout = timeout
+        self.scratch_dir = scratch_dir
+        # Copies of this thread, in any worker, share the staged database for this run.
+        self.run_id = uuid.uuid4().hex
         self.index = None
+        self.attempt = 0
 
     def __call__(self, index: int):
         self.index = index
-        index_db = self.index_file_pattern.format(index=index)
-        copy2(src=str(self.main_db), dst=str(index_db))
-        
-        # Set the seed to null so each process will have a unique random sequence
-        run_dismod(str(index_db), "set option random_seed ''")
-        return self._process(db=index_db)
+        if self.attempt:
+            index_db = self.index_file_pattern.format(index=f'{index}_attempt{self.attempt}')
+        else:
+            index_db = self.index_file_pattern.format(index=index)
+        work_db = self._work_db(index_db)
+        try:
+            self._copy(work_db)
+            # Set the seed to null so each process will have a unique random sequence
+            run_dismod(str(work_db), "set option random_seed ''")
+            result = self._process(db=work_db)
+            if work_db != index_db:
+                if self.result_tables:
+                    self._save_results(work_db, index_db)
+                else:
+                    copy2(src=str(work_db), dst=str(index_db))
+                if isinstance(result, (str, Path)) and str(result) == str(work_db):
+                    result = index_db
+        finally:
+            if work_db != index_db:
+                Path(work_db).unlink(missing_ok=True)
+        return result
+
+    def run_batch(self, indices: List[int]) -> List:
+        """
+        Runs a batch of indices against one copy of the main database,
+        returning the result for each index. Between indices, only the
+        tables in ``reset_tables`` are copied again, and of those only the
+        rows that ``_slim_where`` picks for the index. After each index,
+        the tables in ``result_tables`` are saved to the database for that
+        index, so that they can be merged as if each index had its own copy.
+        If ``_process`` returns the path to the database it worked on,
+        the result is the path to the index database instead.
+        """
+        worker_db = self._work_db(self.index_file_pattern.format(index=f'worker_{indices[0]}'))
+        self.index = indices[0]
+        results = []
+        try:
+            self._copy(worker_db)
+            run_dismod(str(worker_db), "set option random_seed ''")
+            for i, index in enumerate(indices):
+                self.index = index
+                if i > 0:
+                    self._reset(worker_db)
+                result = self._process(db=worker_db)
+                index_db = self.index_file_pattern.format(index=index)
+                if self.result_tables:
+                    self._save_results(worker_db, index_db)
+                if isinstance(result, (str, Path)) and str(result) == str(worker_db):
+                    result = index_db
+                results.append(result)
+        finally:
+            Path(worker_db).unlink(missing_ok=True)
+        return results
+
+    def abandon(self, indices: List[int], attempt: int = 0, persistent: bool = False) -> None:
+        """
+        Kills dmdismod for a task that is no longer wanted, on this host,
+        and then removes the databases it worked on and wrote, so that
+        a command that was still running can't write them afterwards.
+        """
+        names = [f'{index}_attempt{attempt}' if attempt else index for index in indices]
+        if persistent:
+            names.append(f'worker_{indices[0]}')
+        index_dbs = [Path(self.index_file_pattern.format(index=name)) for name in names]
+        dbs = list(index_dbs)
+        if self.scratch_dir is not None:
+            dbs.extend(self._run_scratch() / db.name for db in index_dbs)
+        for db in dbs:
+            kill_dismod(db)
+        for db in dbs:
+            db.unlink(missing_ok=True)
+
+    def cleanup_scratch(self) -> None:
+        """Removes the database staged in the scratch directory on this node, if any."""
+        if self.scratch_dir is not None:
+            shutil.rmtree(self._run_scratch(), ignore_errors=True)
+
+    def cleanup_at_worker_exit(self) -> None:
+        """
+        Has a directory queue worker that runs this thread remove the database
+        staged on its node when it stops, because the parent can only clean up its own node.
+        """
+        if self.scratch_dir is not None:
+            at_worker_exit(f'scratch_{self.run_id}', self.cleanup_scratch)
+
+    def _run_scratch(self) -> Path:
+        return Path(self.scratch_dir) / f'dismod_{self.run_id}'
+
+    def _staged_db(self) -> Optional[Path]:
+        """
+        The main database, staged into the scratch directory by the first worker
+        on this node that needs it, or None if there is no room for it and a copy.
+        """
+        run_scratch = self._run_scratch()
+        staged = run_scratch / Path(self.main_db).name
+        if staged.exists():
+            return staged
+        with self._scratch_lock():
+            if not staged.exists():
+                needed = 2 * Path(self.main_db).stat().st_size
+                free = shutil.disk_usage(run_scratch).free
+                if free < needed:
+                    LOG.warning(f"Scratch directory {self.scratch_dir} has {free} bytes free but needs {needed}, "
+                                f"so copies go next to {self.main_db}.")
+                    return None
+                LOG.info(f"Staging {self.main_db} into {run_scratch}.")
+                temporary = run_scratch / f'{staged.name}.tmp'
+                copy2(src=str(self.main_db), dst=str(temporary))
+                temporary.replace(staged)
+        return staged
+
+    @contextmanager
+    def _scratch_lock(self):
+        """Holds a lock on the scratch directory of this run, across the workers on this node."""
+        run_scratch = self._run_scratch()
+        run_scratch.mkdir(parents=True, exist_ok=True)
+        with open(run_scratch / '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def _source(self) -> Union[str, Path]:
+        """The database to copy from, which is the staged one if there is a scratch directory."""
+        if self.scratch_dir is not None:
+            staged = self._staged_db()
+            if staged is not None:
+                return staged
+        return self.main_db
+
+    def _work_db(self, index_db: Union[str, Path]) -> Union[str, Path]:
+        """
+        Where to make the copy that runs for index_db. In the scratch directory,
+        the copy is claimed while holding the lock, so that the workers on a node
+        count each other's copies, which may still be growing, against the free space.
+        """
+        if self.scratch_dir is None or self._staged_db() is None:
+            return index_db
+        run_scratch = self._run_scratch()
+        staged = run_scratch / Path(self.main_db).name
+        work_db = run_scratch / Path(index_db).name
+        with self._scratch_lock():
+            others = [db for db in run_scratch.glob('*.db') if db not in (staged, work_db)]
+            needed = (len(others) + 1) * staged.stat().st_size
+            free = shutil.disk_usage(run_scratch).free
+            if free < needed:
+                LOG.warning(f"Scratch directory {self.scratch_dir} has {free} bytes free but needs {needed} "
+                            f"for {len(others) + 1} copies, so {index_db} is made next to {self.main_db}.")
+                return index_db
+            work_db.touch()
+        return work_db
+
+    def _copy(self, db: Union[str, Path]) -> None:
+        command = self._slim_command() if self.slim else None
+        if command is None:
+            copy2(src=str(self._source()), dst=str(db))
+        else:
+            slim_clone(source=self._source(), destination=db, command=command, where=self._slim_where())
+
+    def _slim_command(self) -> Optional[str]:
+        """The dmdismod command that _process runs for self.index, if any."""
+        return None
+
+    def _slim_where(self) -> Dict[str, str]:
+        """
+        Conditions on the rows of tables to copy for self.index, for a slim copy
+        and when a table in ``reset_tables`` is restored between indices.
+        """
+        return dict()
+
+    def _reset(self, worker_db: Union[str, Path]) -> None:
+        # Only the rows for this index, so that a batch doesn't copy the whole table for each index.
+        where = self._slim_where()
+        connection = sqlite3.connect(str(worker_db), isolation_level=None)
+        try:
+            connection.execute("ATTACH DATABASE ? AS source", (str(self._source()),))
+            try:
+                with connection:
+                    connection.execute("BEGIN")
+                    for table in self.reset_tables:
+                        columns = ", ".join(
+                            f'"{row[1]}"' for row in connection.execute(f'PRAGMA main.table_info("{table}")')
+                        )
+                        connection.execute(f'DELETE FROM main."{table}"')
+                        condition = f" WHERE {where[table]}" if table in where else ""
+                        connection.execute(
+                            f'INSERT INTO main."{table}" ({columns}) SELECT {columns} FROM source."{table}"{condition}'
+                        )
+            finally:
+                connection.execute("DETACH DATABASE source")
+        finally:
+            connection.close()
+
+    def _save_results(self, worker_db: Union[str, Path], index_db: Union[str, Path]) -> None:
+        if Path(index_db).exists():
+            Path(index_db).unlink()
+        connection = sqlite3.connect(str(worker_db), isolation_level=None)
+        try:
+            connection.execute("ATTACH DATABASE ? AS result", (str(index_db),))
+            try:
+                with connection:
+                    connection.execute("BEGIN")
+                    for table in self.result_tables:
+                        connection.execute(f'CREATE TABLE result."{table}" AS SELECT * FROM main."{table}"')
+            finally:
+                connection.execute("DETACH DATABASE result")
+        finally:
+            connection.close()
 
     def _process(self, db: str):
         raise NotImplementedError
 
 
+def _batches(sims: List[int], n_batch: int) -> List[List[int]]:
+    """Splits sims into at most n_batch contiguous batches of nearly equal size."""
+    size, extra = divmod(len(sims), n_batch)
+    batches = []
+    start = 0
+    for i in range(n_batch):
+        end = start + size + (1 if i < extra else 0)
+        if end > start:
+            batches.append(list(sims[start:end]))
+        start = end
+    return batches
+
+
+@contextmanager
+def _executor(backend: Union[str, _Executor], n_pool: int, queue_dir: Optional[Union[str, Path]] = None):
+    """
+    An executor for a backend name, which closes when the pool is done,
+    or an executor that the caller made and closes.
+    """
+    if isinstance(backend, _Executor):
+        yield backend
+    else:
+        with make_executor(backend, n_workers=n_pool, queue_dir=queue_dir) as executor:
+            yield executor
+
+
+def _call(task: Tuple[_DismodThread, List[int], bool]) -> List:
+    """
+    Runs one task on its own copy of the dismod thread, which keeps the
+    index it works on, so that tasks in a thread pool don't share one.
+    """
+    dm_thread, indices, persistent = task
+    dm_thread = copy.copy(dm_thread)
+    dm_thread.cleanup_at_worker_exit()
+    if persistent:
+        return dm_thread.run_batch(indices)
+    return [dm_thread(index) for index in indices]
+
+
 def dmdismod_in_parallel(dm_thread: _DismodThread,
-                         sims: List[int], n_pool: int):
+                         sims: List[int], n_pool: int,
+                         persistent: bool = False,
+                         backend: Union[str, _Executor] = 'process',
+                         queue_dir: Optional[Union[str, Path]] = None):
     """
     Run a dismod thread in parallel by constructing
     a multiprocessing pool. A dismod thread is
     anything that is based off of _DismodThread so it has
     a __call__ method with an overridden _process method.
+
+    If persistent, each worker in the pool copies the main database
+    once and runs a batch of the sims against that copy, so the number
+    of copies is n_pool instead of the number of sims. The results are
+    in the order of sims either way.
+
+    The backend is the name of one in :py:mod:`cascade_at.dismod.api.executors`,
+    "process", "thread" or "directory", or an executor, which the caller closes.
+    A directory queue is in ``queue_dir``, or in a temporary directory if
+    that is None.
+    """
+    if persistent:
+        tasks = _batches(sims, n_pool)
+    else:
+        tasks = [[index] for index in sims]
+    try:
+        with _executor(backend, n_pool, queue_dir) as executor:
+            batches = executor.map(_call, [(dm_thread, indices, persistent) for indices in tasks])
+    finally:
+        dm_thread.cleanup_scratch()
+    return [result for batch in batches for result in batch]
+
+
+def _run_task(task: Tuple[_DismodThread, List[int], bool, int]) -> SimpleNamespace:
+    """
+    Runs one task in a pool worker, timing it and catching its failure, so that
+    the parent hears about it instead of waiting. Catches SystemExit too,
+    because run_dismod_commands exits when dmdismod fails.
+    """
+    dm_thread, indices, persistent, attempt = task
+    dm_thread = copy.copy(dm_thread)
+    dm_thread.attempt = attempt
+    dm_thread.cleanup_at_worker_exit()
+    outcome = SimpleNamespace(indices=indices, attempt=attempt, results=None, seconds=None,
+                              error=None, timed_out=False)
+    start = time.perf_counter()
+    try:
+        if persistent:
+            outcome.results = dm_thread.run_batch(indices)
+        else:
+            outcome.results = [dm_thread(index) for index in indices]
+    except (Exception, SystemExit) as error:
+        outcome.timed_out = isinstance(error, DismodTimeoutError)
+        outcome.error = f"{type(error).__name__}: {error}\n{traceback.format_exc()}"
+    outcome.seconds = time.perf_counter() - start
+    return outcome
+
+
+def dmdismod_in_parallel_streaming(dm_thread: _DismodThread, sims: List[int], n_pool: int,
+                                   sink: Optional[Callable[[int, Any], None]] = None,
+                                   persistent: bool = False, ordered: bool = False,
+                                   raise_on_failure: bool = True,
+                                   timeout: Optional[float] = None,
+                                   straggler_factor: Optional[float] = None,
+                                   n_accept: Optional[int] = None,
+                                   poll_interval: float = 0.1,
+                                   backend: Union[str, _Executor] = 'process',
+                                   queue_dir: Optional[Union[str, Path]] = None) -> SimpleNamespace:
+    """
+    Runs a dismod thread in parallel like :py:func:`dmdismod_in_parallel`,
+    but hands each result to a sink as soon as its task finishes, in whatever
+    order the tasks finish, instead of returning them all at the end.
+    The sink can write the result to the main database or to a file, so the
+    parent never holds more than one result. Progress, the time each task
+    took and failures are logged as they happen, and a failed task doesn't
+    stop the others.
+
+    There are three policies for slow tasks, which need single tasks
+    rather than persistent batches. A timeout kills a dmdismod command that
+    runs too long, and the index fails. A straggler factor relaunches an
+    index, in a fresh copy with a fresh seed, when it has run for longer than
+    that factor times the median time of the tasks finished so far and a worker
+    is free. The first attempt to finish wins. And ``n_accept`` stops once that many
+    indices have succeeded, skipping the rest. A task that is no longer wanted,
+    the losing attempt or one still running when this stops, is abandoned with
+    :py:meth:`_DismodThread.abandon`, which kills its dmdismod on this host
+    and removes its databases.
+
+    >>> dmdismod_in_parallel_streaming(
+    >>>     dm_thread=predict, sims=list(range(100)), n_pool=10,
+    >>>     sink=lambda index, db: merge_worker_tables(..., indices=[index], replace=False)
+    >>> )
+
+    Parameters
+    ----------
+    dm_thread
+        Anything based off of _DismodThread
+    sims
+        The indices to run
+    n_pool
+        The number of processes in the pool
+    sink
+        A function of the index and the result of ``dm_thread`` for that index,
+        called in this process for each index that succeeds
+    persistent
+        Whether each task is a batch that runs against one copy of the
+        database, as in :py:meth:`_DismodThread.run_batch`. There are then
+        n_pool tasks.
+    ordered
+        Whether to hand results to the sink in the order of sims. Results that
+        finish early wait for the ones before them.
+    raise_on_failure
+        Whether to raise a DismodAPIError at the end if any index failed or timed out
+    timeout
+        A limit in seconds on each dmdismod command of a task
+    straggler_factor
+        How many times the median task time a task may run before it is relaunched
+    n_accept
+        The number of indices that have to succeed, after which the rest are skipped
+    poll_interval
+        How often, in seconds, to check on running tasks
+    backend
+        The name of an executor backend or an executor, as in :py:func:`dmdismod_in_parallel`
+    queue_dir
+        The directory for a directory queue
+
+    Returns
+    -------
+    A namespace with ``tasks``, a list with the ``indices``, ``attempt``, ``seconds``,
+    ``error`` and ``timed_out`` of each task that finished, and lists of the indices
+    that ``succeeded``, ``failed``, ``timed_out``, were ``relaunched`` or ``skipped``.
+    """
+    if persistent and (timeout is not None or straggler_factor is not None or n_accept is not None):
+        raise DismodAPIError("Timeouts and straggler policies need single tasks, not persistent batches.")
+    if timeout is not None:
+        dm_thread = copy.copy(dm_thread)
+        dm_thread.timeout = timeout
+    if persistent:
+        tasks = _batches(sims, n_pool)
+    else:
+        tasks = [[index] for index in sims]
+    n_accept = len(sims) if n_accept is None else n_accept
+    summary = SimpleNamespace(tasks=[], succeeded=[], failed=[], timed_out=[], relaunched=[], skipped=[])
+    # Results wait here when they are ordered and an earlier index hasn't finished.
+    waiting = dict()
+    resolved = set()
+    order = list(sims)
+    next_position = 0
+
+    def deliver():
+        nonlocal next_position
+        while next_position < len(order) and order[next_position] in resolved:
+            index = order[next_position]
+            if index in waiting and sink is not None:
+                sink(index, waiting.pop(index))
+            next_position += 1
+
+    def resolve(index, result, ok):
+        resolved.add(index)
+        if ok:
+            summary.succeeded.append(index)
+            if ordered:
+                waiting[index] = result
+                deliver()
+            elif sink is not None:
+                sink(index, result)
+
+    running = dict()
+    abandoned = []
+
+    def abandon(key):
+        del running[key]
+        abandoned.append(key)
+        dm_thread.abandon(list(key[0]), attempt=key[1], persistent=persistent)
+
+    try:
+        with _executor(backend, n_pool, queue_dir) as p:
+            queue = list(tasks)
+
+            def launch(indices, attempt):
+                result = p.apply_async(_run_task, ((dm_thread, indices, persistent, attempt),))
+                running[(tuple(indices), attempt)] = (result, time.perf_counter())
+
+            try:
+                while len(summary.succeeded) < n_accept and len(resolved) < len(sims):
+                    while queue and len(running) < n_pool:
+                        launch(queue.pop(0), attempt=0)
+
+                    for key, (result, start) in list(running.items()):
+                        if key not in running or not result.ready():
+                            continue
+                        del running[key]
+                        try:
+                            outcome = result.get()
+                        except Exception as error:
+                            # The task never finished, as when the worker running it died.
+                            outcome = SimpleNamespace(
+                                indices=list(key[0]), attempt=key[1], results=None,
+                                seconds=time.perf_counter() - start, error=f"{type(error).__name__}: {error}",
+                                timed_out=False
+                            )
+                        summary.tasks.append(outcome)
+                        other_attempts = [k for k in running if k[0] == key[0]]
+                        for index, value in zip(outcome.indices, outcome.results or [None] * len(outcome.indices)):
+                            if index in resolved:
+                                continue
+                            if outcome.error is None:
+                                resolve(index, value, ok=True)
+                            elif not other_attempts:
+                                if outcome.timed_out:
+                                    summary.timed_out.append(index)
+                                else:
+                                    summary.failed.append(index)
+                                resolve(index, None, ok=False)
+                        if outcome.error is None:
+                            LOG.info(f"Finished {outcome.indices} in {outcome.seconds:.1f} s, "
+                                     f"{len(resolved)} of {len(sims)} done.")
+                            # The first attempt to finish wins, and the other one is killed.
+                            for other in other_attempts:
+                                abandon(other)
+                        else:
+                            LOG.error(f"Failed {outcome.indices} attempt {outcome.attempt} "
+                                      f"after {outcome.seconds:.1f} s, "
+                                      f"{len(resolved)} of {len(sims)} done: {outcome.error}")
+                        outcome.results = None
+
+                    if straggler_factor is not None and not queue and len(running) < n_pool:
+                        times = [t.seconds for t in summary.tasks if t.error is None]
+                        if times:
+                            limit = straggler_factor * statistics.median(times)
+                            now = time.perf_counter()
+                            for (indices, attempt), (_, start) in list(running.items()):
+                                if len(running) >= n_pool:
+                                    break
+                                settled = set(indices) <= resolved or set(indices) <= set(summary.relaunched)
+                                if attempt == 0 and not settled and now - start > limit:
+                                    LOG.warning(f"Relaunching {list(indices)} after {now - start:.1f} s, "
+                                                f"more than {straggler_factor} times the median.")
+                                    summary.relaunched.extend(indices)
+                                    launch(list(indices), attempt=1)
+                    time.sleep(poll_interval)
+            finally:
+                # Tasks still running are abandoned, and their dmdismod killed, before the pool closes.
+                for key in list(running):
+                    abandon(key)
+    finally:
+        # Once the pool has closed, no worker can write the files of an abandoned task again.
+        for indices, attempt in abandoned:
+            dm_thread.abandon(list(indices), attempt=attempt, persistent=persistent)
+        dm_thread.cleanup_scratch()
+
+    summary.skipped = [index for index in sims if index not in resolved]
+    if summary.skipped:
+        LOG.warning(f"Skipped {summary.skipped} after {len(summary.succeeded)} succeeded.")
+    resolved.update(summary.skipped)
+    deliver()
+    if (summary.failed or summary.timed_out) and raise_on_failure:
+        raise DismodAPIError(f"dmdismod failed for indices {sorted(summary.failed)} "
+                             f"and timed out for {sorted(summary.timed_out)}.")
+    return summary
+
+
+def merge_worker_tables(main_db: Union[str, Path], index_file_pattern: str, indices: Iterable[int],
+                        source_table: str, target_table: str, columns: Dict[str, str],
+                        replace: bool = True) -> None:
     """
-    p = Pool(n_pool)
-    processes = list(p.map(dm_thread, sims))
-    p.close()
-    return processes
+    Merges a table from each worker database into one table of the main database,
+    entirely inside SQLite. Each worker database is attached in turn and its rows
+    are copied with ``INSERT INTO main.{target_table} SELECT ... FROM worker.{source_table}``,
+    so none of the data passes through Python. The target table is replaced, unless
+    replace is False, and each worker's rows are committed as they are copied.
+
+    >>> merge_worker_tables(
+    >>>     main_db='main.db', index_file_pattern='main_{index}.db', indices=range(100),
+    >>>     source_table='predict', target_table='predict',
+    >>>     columns={'predict_id': '{offset} + predict_id', 'sample_index': '{index}',
+    >>>              'avgint_id': 'avgint_id', 'avg_integrand': 'avg_integrand'}
+    >>> )
+
+    Parameters
+    ----------
+    main_db
+        Path to the main database
+    index_file_pattern
+        File pattern of the worker databases, formatted with ``index``,
+        or the path to one worker database, which comes out unchanged
+    indices
+        The indices of the worker databases to merge, in the order to merge them
+    source_table
+        The table to read in each worker database
+    target_table
+        The table to write in the main database
+    columns
+        Each column of the target table with the SQL expression that computes it
+        from the source table. The expressions can use ``{index}``, the worker's index,
+        and ``{offset}``, the number of rows already in the target table.
+    replace
+        Whether to replace the target table, or add to it, which it
+        has to exist for
+    """
+    if replace:
+        dm = DismodIO(path=main_db)
+        dm.write_table(target_table, dm.empty_table(target_table))
+    target_columns = ", ".join(f'"{c}"' for c in columns)
+
+    connection = sqlite3.connect(str(main_db), isolation_level=None)
+    try:
+        for index in indices:
+            index_db = index_file_pattern.format(index=index)
+            LOG.debug(f"Merging {index_db} {source_table} into {main_db} {target_table}.")
+            offset = connection.execute(f'SELECT COUNT(*) FROM main."{target_table}"').fetchone()[0]
+            expressions = ", ".join(e.format(index=int(index), offset=offset) for e in columns.values())
+            # SQLite can't detach a database inside a transaction, so there's one per worker.
+            connection.execute("ATTACH DATABASE ? AS worker", (str(index_db),))
+            try:
+                with connection:
+                    connection.execute("BEGIN")
+                    connection.execute(
+                        f'INSERT INTO main."{target_table}" ({target_columns}) '
+                        f'SELECT {expressions} FROM worker."{source_table}"'
+                    )
+            finally:
+                connection.execute("DETACH DATABASE worker")
+    finally:
+        connection.close()
@@ -0,0 +1,254 @@
+"""
+A cache of the results of dmdismod commands, keyed on the content of the
+tables that a command reads, so that re-running a command on a database
+that hasn't changed restores its results instead of running it again.
+
+The key is a hash of the command and of the definition and every row of each
+table that the command reads, from
+:py:func:`~cascade_at.dismod.api.slim_clone.command_tables`. Each entry is
+an SQLite file with the tables the command writes. Commands with a random
+seed of zero, which DisMod-AT takes from the clock, are cached like any
+other, so a hit restores the draws of the run that made the entry.
+
+Entries are kept next to the databases of a model version, so they go
+away with it. Within it, :py:func:`save_results` keeps the cache under
+``MAX_CACHE_BYTES`` by removing the entries that were used longest ago,
+and :py:func:`prune_cache` can remove entries by age as well.
+"""
+import hashlib
+import os
+import sqlite3
+import time
+import uuid
+from pathlib import Path
+from typing import List, Optional, Union
+
+from cascade_at.core.log import get_loggers
+from cascade_at.dismod.api.slim_clone import command_tables
+
+LOG = get_loggers(__name__)
+
+CACHE_VERSION = 2
+"""Part of every key, to change when entries from before aren't valid anymore."""
+
+MAX_CACHE_BYTES = 20 * 2 ** 30
+"""The size of a cache directory above which the entries used longest ago are removed."""
+
+
+def output_tables(command: str) -> Optional[List[str]]:
+    """
+    The tables that a dmdismod command writes, if its results can be cached.
+    Returns None for commands that are cheap or whose outputs aren't known.
+
+    Parameters
+    ----------
+    command
+        The command, as it is passed to dmdismod
+    """
+    words = command.split()
+    if not words:
+        return None
+    if words[0] == 'fit':
+        return ['fit_var', 'fit_data_subset']
+    if words[0] == 'sample':
+        # The asymptotic method also writes the Hessians it draws from.
+        if words[1:2] == ['asymptotic']:
+            return ['sample', 'hes_fixed', 'hes_random']
+        return ['sample']
+    if words[0] == 'predict':
+        return ['predict']
+    return None
+
+
+def cache_key(dm_file: Union[str, Path], command: str) -> Optional[str]:
+    """
+    The key of a command on a database, or None if the command can't be cached.
+
+    Parameters
+    ----------
+    dm_file
+        The database the command runs on
+    command
+        The command, as it is passed to dmdismod
+    """
+    tables = command_tables(command)
+    if tables is None or output_tables(command) is None:
+        return None
+    digest = hashlib.sha256(f"{CACHE_VERSION}\n{' '.join(command.split())}\n".encode())
+    connection = sqlite3.connect(str(dm_file))
+    try:
+        existing = {name for (name,) in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        for table in sorted(tables):
+            if table not in existing:
+                # A missing table changes the key just as different rows would.
+                digest.update(f"{table} missing\n".encode())
+                continue
+            columns = connection.execute(f'PRAGMA table_info("{table}")').fetchall()
+            digest.update(f"{table} {[(c[1], c[2]) for c in columns]}\n".encode())
+            cursor = connection.execute(f'SELECT * FROM "{table}" ORDER BY rowid')
+            while True:
+                rows = cursor.fetchmany(10000)
+                if not rows:
+                    break
+                digest.update(repr(rows).encode())
+    finally:
+        connection.close()
+    return digest.hexdigest()
+
+
+def _copy_tables(source: Union[str, Path], destination: Union[str, Path], tables: List[str]) -> None:
+    """
+    Replaces tables in destination with the tables in source, with their definitions.
+    A table that isn't in source, because the version of dmdismod that ran doesn't
+    write it, is dropped from destination.
+    """
+    connection = sqlite3.connect(str(destination), isolation_level=None)
+    try:
+        connection.execute("ATTACH DATABASE ? AS source", (str(source),))
+        try:
+            present = {name for (name,) in connection.execute(
+                "SELECT name FROM source.sqlite_master WHERE type = 'table'"
+            )}
+            schema = connection.execute(
+                "SELECT type, tbl_name, sql FROM source.sqlite_master "
+                "WHERE type IN ('table', 'index') AND sql IS NOT NULL"
+            ).fetchall()
+            with connection:
+                connection.execute("BEGIN")
+                for table in tables:
+                    connection.execute(f'DROP TABLE IF EXISTS main."{table}"')
+                # Definitions run unqualified, so they make the tables in the destination.
+                for kind, table, sql in schema:
+                    if kind == 'table' and table in tables:
+                        connection.execute(sql)
+                for table in tables:
+                    if table in present:
+                        connection.execute(f'INSERT INTO main."{table}" SELECT * FROM source."{table}"')
+                for kind, table, sql in schema:
+                    if kind == 'index' and table in tables:
+                        connection.execute(sql)
+        finally:
+            connection.execute("DETACH DATABASE source")
+    finally:
+        connection.close()
+
+
+def _append_log(dm_file: Union[str, Path], command: str) -> None:
+    """Logs the command the way dmdismod does, so checks that it finished pass."""
+    connection = sqlite3.connect(str(dm_file), isolation_level=None)
+    try:
+        now = int(time.time())
+        with connection:
+            connection.execute("BEGIN")
+            for message in [f"begin {command}", f"end {command}"]:
+                connection.execute(
+                    "INSERT INTO log (message_type, table_name, row_id, unix_time, message) "
+                    "VALUES ('command', NULL, NULL, ?, ?)", (now, message)
+                )
+    except sqlite3.OperationalError:
+        LOG.warning(f"Couldn't log the cached '{command}' in {dm_file}, which has no log table.")
+    finally:
+        connection.close()
+
+
+def restore_results(cache_dir: Union[str, Path], key: str, dm_file: Union[str, Path], command: str) -> bool:
+    """
+    Restores the results of a command into a database from the cache,
+    if they are there. Returns whether they were.
+
+    Parameters
+    ----------
+    cache_dir
+        The directory of the cache
+    key
+        The key from :py:func:`cache_key`
+    dm_file
+        The database to restore the results to
+    command
+        The command, as it is passed to dmdismod
+    """
+    entry = Path(cache_dir) / f"{key}.db"
+    try:
+        # Marks the entry as used, so that pruning keeps it.
+        os.utime(entry)
+    except FileNotFoundError:
+        return False
+    _copy_tables(source=entry, destination=dm_file, tables=output_tables(command))
+    _append_log(dm_file, command)
+    LOG.info(f"Restored the results of '{command}' on {dm_file} from {entry}.")
+    return True
+
+
+def save_results(cache_dir: Union[str, Path], key: str, dm_file: Union[str, Path], command: str,
+                 max_bytes: Optional[int] = MAX_CACHE_BYTES) -> Path:
+    """
+    Saves the results of a command on a database to the cache,
+    and then prunes the cache to ``max_bytes``.
+
+    Parameters
+    ----------
+    cache_dir
+        The directory of the cache, which is created if needed
+    key
+        The key from :py:func:`cache_key`, from before the command ran
+    dm_file
+        The database the command ran on
+    command
+        The command, as it is passed to dmdismod
+    max_bytes
+        The size to prune the cache to, or None to keep every entry
+    """
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    entry = cache_dir / f"{key}.db"
+    # Written to the side and renamed, so that a reader never sees part of an entry.
+    temporary = cache_dir / f"{key}.{uuid.uuid4().hex}.tmp"
+    try:
+        _copy_tables(source=dm_file, destination=temporary, tables=output_tables(command))
+        os.replace(temporary, entry)
+    finally:
+        if temporary.exists():
+            temporary.unlink()
+    LOG.info(f"Saved the results of '{command}' on {dm_file} to {entry}.")
+    prune_cache(cache_dir, max_bytes=max_bytes)
+    return entry
+
+
+def prune_cache(cache_dir: Union[str, Path], max_bytes: Optional[int] = MAX_CACHE_BYTES,
+                max_age_seconds: Optional[float] = None) -> List[Path]:
+    """
+    Removes the entries of a cache that were last saved or restored
+    more than ``max_age_seconds`` ago, and then the entries used longest
+    ago until the rest fit in ``max_bytes``. Returns the removed entries.
+
+    Parameters
+    ----------
+    cache_dir
+        The directory of the cache
+    max_bytes
+        The most that entries may take up together, or None for no limit
+    max_age_seconds
+        How long ago an entry may have been used, or None for no limit
+    """
+    entries = []
+    for entry in Path(cache_dir).glob('*.db'):
+        try:
+            entry_stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((entry_stat.st_mtime, entry_stat.st_size, entry))
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    now = time.time()
+    removed = []
+    for used, size, entry in entries:
+        too_old = max_age_seconds is not None and now - used > max_age_seconds
+        too_big = max_bytes is not None and total > max_bytes
+        if not (too_old or too_big):
+            break
+        entry.unlink(missing_ok=True)
+        total -= size
+        removed.append(entry)
+    if removed:
+        LOG.info(f"Removed {len(removed)} entries used longest ago from the cache in {cache_dir}.")
+    return removed
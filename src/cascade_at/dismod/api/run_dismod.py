@@ -1,15 +1,168 @@
+import asyncio
+import json
+import os
+import signal
+import socket
 import subprocess
 import sys
+import threading
+import time
+from pathlib import Path
 from types import SimpleNamespace
-from typing import List
+from typing import Callable, Dict, List, Optional, Union
+
+import pandas as pd
+
 from cascade_at.core.log import get_loggers
+from cascade_at.dismod.api import DismodAPIError
+from cascade_at.dismod.api.result_cache import cache_key, restore_results, save_results
+from cascade_at.dismod.process.process_behavior import get_ipopt_exit, get_ipopt_iteration
 
 LOG = get_loggers(__name__)
 
 
-def run_dismod(dm_file: str, command: str):
+class DismodTimeoutError(DismodAPIError):
+    """Raised when a dmdismod command runs past its time limit."""
+    pass
+
+
+def _communicate(process: subprocess.Popen, timeout: Optional[float] = None):
+    """
+    Reads the output of a process while it runs and reaps it with os.wait4,
+    to keep the resources it used, which include the resources of the children
+    it waited for. Unlike getrusage(RUSAGE_CHILDREN), it counts only this
+    process, even when other threads run processes at the same time.
+    The process is reaped here, so it gets its ``returncode`` here too.
+
+    Returns
+    -------
+    The stdout, stderr and resource usage of the process.
+
+    Raises
+    ------
+    subprocess.TimeoutExpired
+        if the process runs longer than the timeout, after killing its process
+        group, so the process has to be in its own session
+    """
+    output = dict()
+    readers = [
+        threading.Thread(target=lambda name, pipe: output.update({name: pipe.read()}), args=(name, pipe), daemon=True)
+        for name, pipe in [('stdout', process.stdout), ('stderr', process.stderr)]
+    ]
+    for reader in readers:
+        reader.start()
+    timed_out = False
+    if timeout is None:
+        _, status, rusage = os.wait4(process.pid, 0)
+    else:
+        deadline = time.monotonic() + timeout
+        delay = 0.0005
+        while True:
+            pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+            if pid:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                os.killpg(process.pid, signal.SIGKILL)
+                _, status, rusage = os.wait4(process.pid, 0)
+                timed_out = True
+                break
+            delay = min(2 * delay, remaining, 0.05)
+            time.sleep(delay)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    for reader in readers:
+        reader.join()
+    process.stdout.close()
+    process.stderr.close()
+    if timed_out:
+        raise subprocess.TimeoutExpired(process.args, timeout)
+    return output['stdout'], output['stderr'], rusage
+
+
+def _max_rss_bytes(rusage) -> int:
+    # Linux reports kilobytes and macOS reports bytes.
+    return rusage.ru_maxrss if sys.platform == 'darwin' else rusage.ru_maxrss * 1024
+
+
+def resource_file(dm_file: Union[str, Path]) -> Path:
+    """The sidecar file next to a dismod file with the resources its commands used."""
+    return Path(f"{dm_file}.resources.jsonl")
+
+
+def process_file(dm_file: Union[str, Path]) -> Path:
+    """
+    The sidecar file next to a dismod file with the host and process group
+    of the dmdismod command running on it, while it runs, for commands
+    run with ``track_process``.
+    """
+    return Path(f"{dm_file}.pid")
+
+
+def _write_process(dm_file: Union[str, Path], pid: int) -> None:
+    process_file(dm_file).write_text(f"{socket.gethostname()} {pid}\n")
+
+
+def kill_dismod(dm_file: Union[str, Path]) -> bool:
+    """
+    Kills the process group of a dmdismod command running on a dismod file,
+    from another process on the same host, such as the parent of a pool
+    whose task was abandoned. Only commands run with ``track_process``
+    can be killed. Each command runs in its own session, so the
+    group has dmdismod and not only the shell that started it.
+
+    Returns
+    -------
+    Whether there was a command on this host to kill.
     """
-    Executes a command on a dismod file.
+    path = process_file(dm_file)
+    try:
+        host, pid = path.read_text().split()
+    except (FileNotFoundError, ValueError):
+        return False
+    if host != socket.gethostname():
+        LOG.warning(f"Can't kill dmdismod on {dm_file} because it runs on {host}.")
+        return False
+    try:
+        os.killpg(int(pid), signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    path.unlink(missing_ok=True)
+    return True
+
+
+def _record_resources(dm_file: Union[str, Path], command: str, info: SimpleNamespace) -> None:
+    record = dict(
+        command=command, host=socket.gethostname(), end=time.time(), exit_status=info.exit_status,
+        wall_seconds=info.wall_seconds, user_seconds=info.user_seconds,
+        system_seconds=info.system_seconds, max_rss_bytes=info.max_rss_bytes
+    )
+    # One line for each command, appended, so that commands from several processes don't clobber each other.
+    with open(resource_file(dm_file), 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+
+def read_resources(dm_file: Union[str, Path]) -> pd.DataFrame:
+    """
+    Reads the resources that commands on a dismod file used, as recorded by
+    :py:func:`run_dismod` with ``record_resources``, one row for each command,
+    for sizing the memory and runtime of the cascade operations that run them.
+    """
+    path = resource_file(dm_file)
+    if not path.exists():
+        return pd.DataFrame(columns=[
+            'command', 'host', 'end', 'exit_status', 'wall_seconds', 'user_seconds',
+            'system_seconds', 'max_rss_bytes'
+        ])
+    return pd.read_json(path, lines=True)
+
+
+def run_dismod(dm_file: str, command: str, timeout: Optional[float] = None, record_resources: bool = False,
+               track_process: bool = False):
+    """
+    Executes a command on a dismod file. Along with the exit status,
+    stdout and stderr, the info it returns has the resources the command
+    used: ``wall_seconds``, ``user_seconds`` and ``system_seconds`` of CPU
+    time, and the maximum resident set size in ``max_rss_bytes``.
 
     Parameters
     ----------
@@ -17,22 +170,55 @@ def run_dismod(dm_file: str, command: str):
         the dismod db filepath
     command
         a command to run
+    timeout
+        an optional limit in seconds on the wall-clock time of the command,
+        after which dmdismod is killed and this raises a DismodTimeoutError
+    record_resources
+        whether to append the resources the command used to a sidecar
+        file next to the dismod file, which :py:func:`read_resources` reads
+    track_process
+        whether to write the host and process group of the command to a
+        sidecar file next to the dismod file while it runs, so that
+        :py:func:`kill_dismod` can kill it from another process
     """
+    dm_command = command
     command = ["dmdismod", str(dm_file), command]
     command = ' '.join(command)
     LOG.info(f"Running {command}...")
 
-    process = subprocess.run(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    start = time.perf_counter()
+    # In its own session, so that a timeout, or kill_dismod, kills dmdismod and not only the shell.
+    process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               start_new_session=True)
+    try:
+        if track_process:
+            _write_process(dm_file, process.pid)
+        stdout, stderr, rusage = _communicate(process, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        raise DismodTimeoutError(f"{command} took longer than {timeout} s.")
+    finally:
+        if track_process:
+            process_file(dm_file).unlink(missing_ok=True)
 
     info = SimpleNamespace()
     info.exit_status = process.returncode
-    info.stdout = process.stdout.decode()
-    info.stderr = process.stderr.decode()
+    info.stdout = stdout.decode()
+    info.stderr = stderr.decode()
+    info.wall_seconds = time.perf_counter() - start
+    info.user_seconds = rusage.ru_utime
+    info.system_seconds = rusage.ru_stime
+    info.max_rss_bytes = _max_rss_bytes(rusage)
+    LOG.info(f"{command} took {info.wall_seconds:.1f} s with {info.user_seconds} s user CPU "
+             f"and a maximum RSS of {info.max_rss_bytes} bytes.")
+    if record_resources:
+        _record_resources(dm_file, dm_command, info)
 
     return info
 
 
-def run_dismod_commands(dm_file: str, commands: List[str], sys_exit=True):
+def run_dismod_commands(dm_file: str, commands: List[str], sys_exit=True, timeout: Optional[float] = None,
+                        record_resources: bool = False, cache_dir: Optional[Union[str, Path]] = None,
+                        track_process: bool = False):
     """
     Runs multiple commands on a dismod file and returns the exit statuses.
     Will raise an exception if it runs into an error.
@@ -46,13 +232,35 @@ def run_dismod_commands(dm_file: str, commands: List[str], sys_exit=True):
     sys_exit
         whether to exit the code altogether if there is an error. If False,
         then it will pass the error string back to the original python process.
+    timeout
+        an optional limit in seconds on each command, as in :py:func:`run_dismod`
+    record_resources
+        whether to record the resources each command used next to the dismod file,
+        as in :py:func:`run_dismod`
+    cache_dir
+        an optional directory of results of fit, sample and predict commands,
+        from :py:mod:`~cascade_at.dismod.api.result_cache`. When the tables a
+        command reads are the same as for a result in the cache, the result is
+        restored to the dismod file instead of running the command, and its
+        process has ``cached`` set.
+    track_process
+        whether each command can be killed with :py:func:`kill_dismod` while
+        it runs, as in :py:func:`run_dismod`
     """
     processes = dict()
     if isinstance(commands, str):
         commands = [commands]
     for c in commands:
-        process = run_dismod(dm_file=dm_file, command=c)
+        key = cache_key(dm_file, c) if cache_dir is not None else None
+        if key is not None and restore_results(cache_dir=cache_dir, key=key, dm_file=dm_file, command=c):
+            processes.update({c: SimpleNamespace(exit_status=0, stdout='', stderr='', cached=True)})
+            continue
+        process = run_dismod(dm_file=dm_file, command=c, timeout=timeout, record_resources=record_resources,
+                             track_process=track_process)
+        process.cached = False
         processes.update({c: process})
+        if key is not None and not process.exit_status:
+            save_results(cache_dir=cache_dir, key=key, dm_file=dm_file, command=c)
         if process.exit_status:
             LOG.error(f"{c} failed with exit_status {process.exit_status}:")
             LOG.error(f"Error: {process.stderr}")
@@ -69,3 +277,211 @@ def run_dismod_commands(dm_file: str, commands: List[str], sys_exit=True):
             LOG.info(f"{process.stdout}")
             LOG.info(f"{process.stderr}")
     return processes
+
+
+class DismodProgress:
+    """
+    The live progress of a dmdismod command, which the asynchronous runners
+    update from each line of its output as it is printed. During a fit, it has
+    the last Ipopt iteration, and afterwards the Ipopt EXIT message.
+    """
+    def __init__(self, dm_file: Union[str, Path], command: str):
+        self.dm_file = str(dm_file)
+        self.command = command
+        self.start = time.time()
+        self.lines = 0
+        self.iteration = None
+        self.restoration = False
+        self.objective = None
+        self.inf_pr = None
+        self.inf_du = None
+        self.ipopt_exit = None
+        self.exit_status = None
+
+    @property
+    def seconds(self) -> float:
+        return time.time() - self.start
+
+    @property
+    def done(self) -> bool:
+        return self.exit_status is not None
+
+    def update(self, line: str) -> bool:
+        """Reads a line of output, and returns whether it changed the progress of a fit."""
+        self.lines += 1
+        iteration = get_ipopt_iteration(line)
+        if iteration is not None:
+            self.__dict__.update(iteration)
+            return True
+        ipopt_exit = get_ipopt_exit(line)
+        if ipopt_exit is not None:
+            self.ipopt_exit = ipopt_exit
+            return True
+        return False
+
+    def __repr__(self):
+        state = f"exit status {self.exit_status}" if self.done else f"iteration {self.iteration}"
+        return (f"DismodProgress({self.dm_file} '{self.command}', {state}, objective {self.objective}, "
+                f"{self.seconds:.0f} s)")
+
+
+async def _stream_lines(stream: asyncio.StreamReader, label: str, lines: List[str],
+                        progress: DismodProgress, on_progress: Optional[Callable[[DismodProgress], None]]):
+    while True:
+        raw = await stream.readline()
+        if not raw:
+            return
+        line = raw.decode(errors='replace').rstrip('\n')
+        lines.append(line)
+        LOG.info(f"{label}: {line}")
+        if progress.update(line) and on_progress is not None:
+            on_progress(progress)
+
+
+async def run_dismod_async(dm_file: str, command: str, timeout: Optional[float] = None,
+                           on_progress: Optional[Callable[[DismodProgress], None]] = None,
+                           track_process: bool = False):
+    """
+    Executes a command on a dismod file like :py:func:`run_dismod`, but in an
+    event loop, logging stdout and stderr line by line as dmdismod prints them.
+
+    Parameters
+    ----------
+    dm_file
+        the dismod db filepath
+    command
+        a command to run
+    timeout
+        an optional limit in seconds on the wall-clock time of the command,
+        after which dmdismod is killed and this raises a DismodTimeoutError
+    on_progress
+        an optional function that gets the :py:class:`DismodProgress` of the
+        command each time an Ipopt iteration or exit is printed
+    track_process
+        whether :py:func:`kill_dismod` can kill the command while it runs,
+        as in :py:func:`run_dismod`
+
+    Returns
+    -------
+    A namespace with the ``exit_status``, ``stdout``, ``stderr`` and ``wall_seconds``,
+    as from :py:func:`run_dismod`, and the final ``progress``.
+    """
+    full_command = ' '.join(["dmdismod", str(dm_file), command])
+    LOG.info(f"Running {full_command}...")
+    progress = DismodProgress(dm_file=dm_file, command=command)
+    label = f"{Path(dm_file).name} {command}"
+    stdout, stderr = [], []
+
+    # Long lines, like a large option table, fit in the stream's buffer.
+    process = await asyncio.create_subprocess_shell(
+        full_command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+        start_new_session=True, limit=2 ** 24
+    )
+
+    async def communicate():
+        await asyncio.gather(
+            _stream_lines(process.stdout, label, stdout, progress, on_progress),
+            _stream_lines(process.stderr, label, stderr, progress, on_progress)
+        )
+        return await process.wait()
+
+    try:
+        if track_process:
+            _write_process(dm_file, process.pid)
+        exit_status = await asyncio.wait_for(communicate(), timeout=timeout)
+    except asyncio.TimeoutError:
+        os.killpg(process.pid, signal.SIGKILL)
+        await process.wait()
+        raise DismodTimeoutError(f"{full_command} took longer than {timeout} s.")
+    finally:
+        if track_process:
+            process_file(dm_file).unlink(missing_ok=True)
+
+    progress.exit_status = exit_status
+    if on_progress is not None:
+        on_progress(progress)
+
+    info = SimpleNamespace()
+    info.exit_status = exit_status
+    info.stdout = '\n'.join(stdout)
+    info.stderr = '\n'.join(stderr)
+    info.wall_seconds = progress.seconds
+    # The event loop reaps the process, so its CPU time and memory aren't known here.
+    info.user_seconds = None
+    info.system_seconds = None
+    info.max_rss_bytes = None
+    info.progress = progress
+    return info
+
+
+async def run_dismod_commands_async(dm_file: str, commands: List[str], timeout: Optional[float] = None,
+                                    on_progress: Optional[Callable[[DismodProgress], None]] = None):
+    """
+    Runs multiple commands on a dismod file in an event loop, one after the
+    other, like :py:func:`run_dismod_commands` without ``sys_exit``, streaming
+    their output with :py:func:`run_dismod_async`. It stops at the first
+    command that fails, because the commands after it depend on it.
+
+    Returns
+    -------
+    The namespace from :py:func:`run_dismod_async` for each command that ran, by command.
+    """
+    processes = dict()
+    if isinstance(commands, str):
+        commands = [commands]
+    for c in commands:
+        process = await run_dismod_async(dm_file=dm_file, command=c, timeout=timeout, on_progress=on_progress)
+        processes.update({c: process})
+        if process.exit_status:
+            LOG.error(f"{c} failed on {dm_file} with exit_status {process.exit_status}:")
+            LOG.error(f"Error: {process.stderr}")
+            break
+    return processes
+
+
+def run_dismod_concurrently(jobs: Dict[str, List[str]], timeout: Optional[float] = None,
+                            max_concurrent: Optional[int] = None,
+                            on_progress: Optional[Callable[[DismodProgress], None]] = None):
+    """
+    Runs commands on several dismod files at once from one event loop,
+    without a thread for each process. The commands for each file run one
+    after the other, as in :py:func:`run_dismod_commands_async`.
+
+    >>> run_dismod_concurrently(
+    >>>     {'1/dismod.db': ['init', 'fit both'], '2/dismod.db': ['init', 'fit both']},
+    >>>     on_progress=lambda p: print(p.dm_file, p.iteration, p.objective)
+    >>> )
+
+    Parameters
+    ----------
+    jobs
+        The commands to run, by dismod db filepath
+    timeout
+        an optional limit in seconds on each command
+    max_concurrent
+        The most files to run at once, or all of them if None
+    on_progress
+        an optional function that gets the :py:class:`DismodProgress` of
+        a command each time an Ipopt iteration or exit is printed
+
+    Returns
+    -------
+    The commands that ran on each file, as from :py:func:`run_dismod_commands_async`.
+    If a command timed out, this raises its DismodTimeoutError once the other files finish.
+    """
+    async def run_all():
+        limit = asyncio.Semaphore(max_concurrent or max(len(jobs), 1))
+
+        async def run_file(dm_file, commands):
+            async with limit:
+                return await run_dismod_commands_async(
+                    dm_file=dm_file, commands=commands, timeout=timeout, on_progress=on_progress
+                )
+
+        return await asyncio.gather(*[run_file(f, c) for f, c in jobs.items()], return_exceptions=True)
+
+    results = asyncio.run(run_all())
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return dict(zip(jobs, results))
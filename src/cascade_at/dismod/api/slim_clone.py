@@ -0,0 +1,140 @@
+"""
+Makes slim copies of a DisMod database, with only the tables that a
+dmdismod command needs, for workers that run one command on a copy
+of the main database.
+
+The main database collects large tables that a worker doesn't use,
+like data_sim, sample, predict and the hes tables, and copying it
+whole for every worker costs disk and time.
+"""
+import sqlite3
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from cascade_at.core.log import get_loggers
+from cascade_at.dismod.api import DismodAPIError
+
+LOG = get_loggers(__name__)
+
+
+INPUT_TABLES = [
+    'age', 'avgint', 'covariate', 'data', 'density', 'integrand', 'mulcov',
+    'node', 'nslist', 'nslist_pair', 'option', 'prior', 'rate', 'smooth',
+    'smooth_grid', 'subgroup', 'time', 'weight', 'weight_grid'
+]
+"""The input tables that every dmdismod command reads."""
+
+INIT_TABLES = ['age_avg', 'var', 'data_subset', 'start_var', 'scale_var']
+"""The tables that init writes and that the commands after it read."""
+
+SCHEMA_ONLY_TABLES = ['log']
+"""Tables that every command writes to, which are cloned without rows."""
+
+
+def command_tables(command: str) -> Optional[List[str]]:
+    """
+    The tables that a dmdismod command reads. Returns None for
+    commands that aren't known, which need the whole database.
+
+    >>> command_tables('predict sample')
+    >>> command_tables('fit both 3')
+
+    Parameters
+    ----------
+    command
+        The command, as it is passed to dmdismod
+    """
+    words = command.split()
+    if not words:
+        raise DismodAPIError("Empty dmdismod command.")
+    name = words[0]
+    if name == 'init':
+        return list(INPUT_TABLES)
+    if name == 'set' and len(words) > 1 and words[1] == 'option':
+        return list(INPUT_TABLES)
+    tables = INPUT_TABLES + INIT_TABLES
+    if name == 'fit':
+        # A simulate index means fitting simulated data.
+        if len(words) > 2:
+            tables += ['data_sim', 'prior_sim']
+        return tables
+    if name == 'predict' and len(words) > 1:
+        return tables + [words[1]]
+    if name == 'sample' and len(words) > 1:
+        if words[1] == 'simulate':
+            return tables + ['fit_var', 'data_sim', 'prior_sim']
+        return tables + ['fit_var']
+    if name == 'simulate':
+        return tables + ['truth_var']
+    if name == 'set' and len(words) > 2:
+        # e.g. set start_var fit_var, where the source may be prior_mean
+        return tables + [w for w in words[1:3] if w not in tables]
+    if name == 'depend':
+        return tables
+    return None
+
+
+def slim_clone(source: Union[str, Path], destination: Union[str, Path], command: str,
+               where: Optional[Dict[str, str]] = None) -> List[str]:
+    """
+    Copies a DisMod database to a new file with only the tables that
+    a dmdismod command reads, keeping their definitions and indices
+    exactly as they are, which DisMod-AT needs. The log table is
+    created without rows. Commands that aren't known copy every table.
+    Anything at the destination is replaced.
+
+    >>> slim_clone('main.db', 'main_3.db', 'predict sample', where={'sample': 'sample_index = 3'})
+
+    Parameters
+    ----------
+    source
+        Path to the database to copy
+    destination
+        Path to the new database
+    command
+        The dmdismod command that will run on the new database
+    where
+        An optional SQL condition on the rows to copy for some tables,
+        by table name
+
+    Returns
+    -------
+    The names of the tables copied with their rows.
+    """
+    where = where or dict()
+    destination = Path(destination)
+    if destination.exists():
+        destination.unlink()
+
+    connection = sqlite3.connect(str(destination), isolation_level=None)
+    try:
+        connection.execute("ATTACH DATABASE ? AS source", (str(source),))
+        try:
+            schema = connection.execute(
+                "SELECT type, name, tbl_name, sql FROM source.sqlite_master "
+                "WHERE type IN ('table', 'index') AND sql IS NOT NULL"
+            ).fetchall()
+            existing = [name for kind, name, _, _ in schema if kind == 'table']
+            needed = command_tables(command)
+            if needed is None:
+                needed = existing
+            copied = [t for t in existing if t in needed]
+            cloned = copied + [t for t in existing if t in SCHEMA_ONLY_TABLES and t not in copied]
+            LOG.debug(f"Slim clone of {source} for '{command}' with tables {copied}.")
+            with connection:
+                connection.execute("BEGIN")
+                # Definitions run unqualified, so they make the tables in the new database.
+                for kind, _, table, sql in schema:
+                    if kind == 'table' and table in cloned:
+                        connection.execute(sql)
+                for table in copied:
+                    condition = f" WHERE {where[table]}" if table in where else ""
+                    connection.execute(f'INSERT INTO main."{table}" SELECT * FROM source."{table}"{condition}')
+                for kind, _, table, sql in schema:
+                    if kind == 'index' and table in cloned:
+                        connection.execute(sql)
+        finally:
+            connection.execute("DETACH DATABASE source")
+    finally:
+        connection.close()
+    return copied
@@ -0,0 +1,158 @@
+"""
+Starts a fit from values that are close to its optimum, instead of from
+the means of its priors, by filling the start_var and scale_var tables
+after init. The values come from the fit_var of another database, like
+the same location in a previous model version, or from the predictions
+of a parent database on this database's prior grid.
+
+Variables in two databases are matched by what they mean, rather than by
+their ids: their type, rate, integrand, covariate, location, age and time.
+"""
+from pathlib import Path
+from typing import Union
+
+import numpy as np
+import pandas as pd
+
+from cascade_at.core.log import get_loggers
+from cascade_at.dismod.api import DismodAPIError
+from cascade_at.dismod.api.dismod_extractor import DismodExtractor
+from cascade_at.dismod.api.dismod_io import DismodIO
+
+LOG = get_loggers(__name__)
+
+VAR_KEY = ['var_type', 'rate_name', 'integrand_name', 'covariate_name', 'location', 'age', 'time']
+"""The columns that identify a model variable across databases."""
+
+# Ages and times are matched after rounding, so that grids built separately still match.
+DECIMALS = 6
+
+# A value this close to zero is a start but not a scale, because DisMod-AT divides by the scale.
+MIN_SCALE = 1e-10
+
+
+def _location_names(node: pd.DataFrame) -> pd.Series:
+    """The location of each node as a string, by node_id, from c_location_id if the node table has it."""
+    if 'c_location_id' in node:
+        location = pd.to_numeric(node.c_location_id).astype('Int64').astype(str)
+    else:
+        location = node.node_name.astype(str)
+    return pd.Series(location.values, index=node.node_id.values)
+
+
+def describe_vars(db: DismodIO) -> pd.DataFrame:
+    """
+    The var table of a database, after init, with the columns in
+    :py:data:`VAR_KEY` in place of the ids.
+
+    Parameters
+    ----------
+    db
+        The database
+    """
+    var = db.var
+    if var.empty:
+        raise DismodAPIError(f"The var table of {db.path} is empty. Run init first.")
+    df = var.merge(db.age, on='age_id', how='left').merge(db.time, on='time_id', how='left')
+    df['rate_name'] = df.rate_id.map(db.rate.set_index('rate_id').rate_name)
+    df['integrand_name'] = df.integrand_id.map(db.integrand.set_index('integrand_id').integrand_name)
+    df['covariate_name'] = df.covariate_id.map(db.covariate.set_index('covariate_id').covariate_name)
+    df['location'] = df.node_id.map(_location_names(db.node))
+    df['age'] = df.age.round(DECIMALS)
+    df['time'] = df.time.round(DECIMALS)
+    for col in ['rate_name', 'integrand_name', 'covariate_name', 'location']:
+        df[col] = df[col].fillna('')
+    return df[['var_id', 'smooth_id', 'age_id', 'time_id'] + VAR_KEY]
+
+
+def fit_values(path: Union[str, Path]) -> pd.DataFrame:
+    """
+    The fit of every variable in a database that has been fit,
+    as the :py:data:`VAR_KEY` columns and a ``value``.
+
+    Parameters
+    ----------
+    path
+        The database that has a fit_var table
+    """
+    db = DismodIO(path=path)
+    fit = db.fit_var
+    if fit.empty:
+        raise DismodAPIError(f"There is no fit in {path} to start from.")
+    df = describe_vars(db).merge(fit, left_on='var_id', right_on='fit_var_id')
+    return df[VAR_KEY].assign(value=df.fit_var_value.values)
+
+
+def prior_grid_values(path: Union[str, Path], location_id: int, sex_id: int) -> pd.DataFrame:
+    """
+    The predictions of a parent database for the rates of a child
+    location and sex on the prior grid, which are where the child's
+    parent rate variables are, as the :py:data:`VAR_KEY` columns and a ``value``.
+
+    Parameters
+    ----------
+    path
+        The parent database, which has predicted on the prior grid for the child
+    location_id
+        The location of the child
+    sex_id
+        The sex of the child
+    """
+    df = DismodExtractor(path=path).get_predictions(locations=[location_id], sexes=[sex_id])
+    df = df.loc[df.rate.notnull()]
+    df = df.groupby(['rate', 'age_lower', 'time_lower'], as_index=False)['mean'].mean()
+    return pd.DataFrame({
+        'var_type': 'rate',
+        'rate_name': df.rate.values,
+        'integrand_name': '',
+        'covariate_name': '',
+        'location': str(location_id),
+        'age': df.age_lower.round(DECIMALS).values,
+        'time': df.time_lower.round(DECIMALS).values,
+        'value': df['mean'].values
+    })
+
+
+def warm_start(path: Union[str, Path], values: pd.DataFrame) -> int:
+    """
+    Sets start_var and scale_var in a database, after init, to the values for the
+    variables that have one, moved inside the limits of their value priors. Other
+    variables, and variables with a constant value, keep the start and scale
+    that init gave them. A value at or near zero is used as the start, but the
+    variable keeps the scale from init, which comes from its prior.
+
+    Parameters
+    ----------
+    path
+        The database to start, which has run init
+    values
+        The :py:data:`VAR_KEY` columns and a ``value``, as from :py:func:`fit_values`
+        or :py:func:`prior_grid_values`. Later rows win for a variable that has more than one.
+
+    Returns
+    -------
+    The number of variables that were given a value.
+    """
+    db = DismodIO(path=path)
+    target = describe_vars(db)
+    values = values.drop_duplicates(subset=VAR_KEY, keep='last')
+    df = target.merge(values, on=VAR_KEY, how='left')
+
+    grid = db.smooth_grid[['smooth_id', 'age_id', 'time_id', 'value_prior_id', 'const_value']]
+    df = df.merge(grid, on=['smooth_id', 'age_id', 'time_id'], how='left')
+    prior = db.prior.set_index('prior_id')
+    lower = df.value_prior_id.map(prior.lower).fillna(-np.inf).values
+    upper = df.value_prior_id.map(prior.upper).fillna(np.inf).values
+    use = df.value.notnull().values & df.const_value.isnull().values
+
+    start = df.var_id.map(db.start_var.set_index('start_var_id').start_var_value).values
+    scale = df.var_id.map(db.scale_var.set_index('scale_var_id').scale_var_value).values
+    value = np.clip(df.value.values, lower, upper)
+    start = np.where(use, value, start)
+    scale = np.where(use & (np.abs(value) > MIN_SCALE), value, scale)
+
+    db.start_var = pd.DataFrame({'start_var_id': df.var_id.values, 'start_var_value': start})
+    db.scale_var = pd.DataFrame({'scale_var_id': df.var_id.values, 'scale_var_value': scale})
+    n_used = int(use.sum())
+    LOG.info(f"Warm started {n_used} of {len(df)} variables in {path}.")
+    return n_used
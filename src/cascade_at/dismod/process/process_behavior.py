@@ -19,6 +19,8 @@ output is edited.
 
 """
 import re
+from typing import Dict, Optional, Union
+
 from cascade_at.dismod import DismodATException
 from cascade_at.core.log import get_loggers
 
@@ -26,6 +28,11 @@ LOG = get_loggers(__name__)
 
 RE_EXIT = re.compile(r"EXIT: (.*)")
 RE_ITERATIONS = re.compile(r"Number of Iterations\W+ (\d+)")
+# An iteration line, with an r after the count in restoration, starts
+# "iter objective inf_pr inf_du", as in " 81 -2.4294118e-02 0.00e+00 7.51e-09 -11.0 ..."
+RE_IPOPT_ITERATION = re.compile(
+    r"^\s*(\d+)(r?)\s+([-+]?\d\.\d+e[-+]\d+)\s+(\d\.\d+e[-+]\d+)\s+(\d\.\d+e[-+]\d+)(\s|$)"
+)
 
 
 IPOPT_PERFECT = {
@@ -88,6 +95,38 @@ def get_fit_output(stdout):
     return ipopt_class, ipopt_exit, iteration_cnt
 
 
+def get_ipopt_iteration(line: str) -> Optional[Dict[str, Union[int, float, bool]]]:
+    """
+    Reads one line of Ipopt output as it is printed during a fit.
+
+    Args:
+        line (str): A line of stdout.
+
+    Returns:
+        Dict: The ``iteration``, whether it is in ``restoration``, the
+        ``objective``, and the primal and dual infeasibilities ``inf_pr``
+        and ``inf_du``, or None if the line isn't an iteration line.
+    """
+    match = RE_IPOPT_ITERATION.match(line)
+    if not match:
+        return None
+    return dict(
+        iteration=int(match.group(1)),
+        restoration=match.group(2) == "r",
+        objective=float(match.group(3)),
+        inf_pr=float(match.group(4)),
+        inf_du=float(match.group(5)),
+    )
+
+
+def get_ipopt_exit(line: str) -> Optional[str]:
+    """
+    Reads the EXIT message of Ipopt from a line of stdout, if it has one.
+    """
+    match = RE_EXIT.search(line)
+    return match.group(1) if match else None
+
+
 def check_command(command, log, return_code, stdout, stderr):
     """
     This raises an exception if something went wrong. Otherwise
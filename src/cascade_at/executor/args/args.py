@@ -215,6 +215,22 @@ class NPool(IntArg):
         })
 
 
+class PoolBackend(StrArg):
+    """
+    Which backend runs the tasks of a multiprocessing pool argument,
+    one of "process", "thread" or "directory". Defaults to "process".
+    """
+    def __init__(self):
+        super().__init__()
+
+        self._flag = '--pool-backend'
+        self._parser_kwargs.update({
+            'help': 'how to run the pool: process, thread or directory (default to process)',
+            'default': 'process',
+            'choices': ['process', 'thread', 'directory']
+        })
+
+
 class LogLevel(StrArg):
     """
     Logging level argument. Defaults to "info".
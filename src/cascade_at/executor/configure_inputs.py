@@ -90,6 +90,7 @@ def configure_inputs(model_version_id: int, make: bool, configure: bool,
         LOG.error(msg)
 
     context.write_inputs(inputs=inputs, settings=parameter_json)
+    context.write_age_metadata(gbd_round_id=settings.gbd_round_id)
 
 
 def main():
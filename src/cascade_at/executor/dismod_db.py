@@ -4,6 +4,7 @@ import sys
 from pathlib import Path
 from typing import Union, List, Dict, Any, Optional, Tuple
 import os
+from functools import partial
 import numpy as np
 import pandas as pd
 
@@ -13,6 +14,7 @@ from cascade_at.core.log import get_loggers, LEVELS
 from cascade_at.dismod.api.dismod_extractor import DismodExtractor
 from cascade_at.dismod.api.dismod_filler import DismodFiller
 from cascade_at.dismod.api.run_dismod import run_dismod_commands
+from cascade_at.dismod.api.warm_start import fit_values, prior_grid_values, warm_start
 
 from cascade_at.executor.args.arg_utils import ArgumentList
 from cascade_at.executor.args.args import DmCommands, DmOptions, ParentLocationID, SexID
@@ -35,12 +37,18 @@ ARG_LIST = ArgumentList([
     DmCommands(),
     DmOptions(),
     BoolArg('--fill', help='whether or not to fill the dismod database with data'),
+    BoolArg('--fill-in-memory', help='whether to build the database in memory and copy it to its path at the end'),
+    StrArg('--fill-scratch-dir', help='if set, builds the database in this directory and copies it to its path'),
     BoolArg('--prior-samples', help='whether or not the prior came from samples or just a mean fit'),
     IntArg('--prior-parent', help='the location ID of the parent database to grab the prior for'),
     IntArg('--prior-sex', help='the sex ID of the parent database to grab prior for'),
     IntArg('--prior-mulcov', help='the model version id where mulcov stats is passed in', required=False),
     BoolArg('--save-fit', help='whether or not to save the fit'),
     BoolArg('--save-prior', help='whether or not to save the prior'),
+    BoolArg('--record-resources', help='whether to record the time and memory of each command next to the database'),
+    BoolArg('--use-cache', help='whether to restore the results of commands whose inputs have not changed'),
+    BoolArg('--warm-start-parent', help='whether to start the fit from the prior parent\'s predictions'),
+    IntArg('--warm-start-model-version-id', help='a model version whose fit of this database to start from'),
     LogLevel(),
     StrArg('--test-dir', help='if set, will save files to the directory specified')
 ])
@@ -102,17 +110,25 @@ def fill_database(path: Union[str, Path], settings: SettingsConfig,
                   inputs: MeasurementInputs, alchemy: Alchemy,
                   parent_location_id: int, sex_id: int, child_prior: Dict[str, Dict[str, np.ndarray]],
                   mulcov_prior: Dict[Tuple[str, str, str], _Prior],
-                  options: Dict[str, Any]) -> DismodFiller:
+                  options: Dict[str, Any],
+                  in_memory: bool = False, scratch_dir: Optional[str] = None) -> DismodFiller:
     """
     Fill a DisMod database at the specified path with the inputs, model, and settings
     specified, for a specific parent and sex ID, with options to override the priors.
+
+    If in_memory is True or a scratch_dir is given, the database is built there
+    and copied to the path with one SQLite backup once it is full.
     """
     df = DismodFiller(
         path=path, settings_configuration=settings, measurement_inputs=inputs,
         grid_alchemy=alchemy, parent_location_id=parent_location_id, sex_id=sex_id,
         child_prior=child_prior, mulcov_prior=mulcov_prior,
     )
-    df.fill_for_parent_child(**options)
+    if in_memory or scratch_dir is not None:
+        with df.staged(scratch_dir=scratch_dir):
+            df.fill_for_parent_child(**options)
+    else:
+        df.fill_for_parent_child(**options)
     return df
 
 
@@ -122,21 +138,28 @@ def save_predictions(db_file: Union[str, Path],
                      locations: Optional[List[int]] = None,
                      sexes: Optional[List[int]] = None,
                      sample: bool = False,
-                     predictions: Optional[pd.DataFrame] = None) -> None:
+                     predictions: Optional[pd.DataFrame] = None,
+                     draw_format: str = 'csv', float32: bool = False,
+                     age_metadata_file: Optional[Union[str, Path]] = None, n_threads: int = 1) -> None:
     """
     Save the fit from this dismod database for a specific location and sex to be
-    uploaded later on.
+    uploaded later on, with draw files in one of the formats in
+    :py:data:`~cascade_at.saver.results_handler.DRAW_FORMATS`. Ages are mapped to
+    age groups with the ``age_metadata_file``, if there is one, as from
+    :py:meth:`~cascade_at.context.model_context.Context.age_metadata`.
+    With ``n_threads``, that many files for locations and sexes are written at once.
     """
     LOG.info("Extracting results from DisMod SQLite Database.")
     da = DismodExtractor(path=db_file)
     predictions = da.format_predictions_for_ihme(
         locations=locations, sexes=sexes, gbd_round_id=gbd_round_id,
-        samples=sample, predictions=predictions
+        samples=sample, predictions=predictions, age_metadata_file=age_metadata_file
     )
     LOG.info(f"Saving the results to {out_dir}.")
     rh = ResultsHandler()
     rh.save_draw_files(df=predictions, directory=out_dir,
-                       add_summaries=True, model_version_id=model_version_id)
+                       add_summaries=True, model_version_id=model_version_id,
+                       draw_format=draw_format, float32=float32, n_threads=n_threads)
 
 
 def dismod_db(model_version_id: int, parent_location_id: int, sex_id: int,
@@ -145,7 +168,10 @@ def dismod_db(model_version_id: int, parent_location_id: int, sex_id: int,
               prior_parent: Optional[int] = None, prior_sex: Optional[int] = None,
               prior_mulcov_model_version_id: Optional[int] = None,
               test_dir: Optional[str] = None, fill: bool = False,
-              save_fit: bool = True, save_prior: bool = True) -> None:
+              fill_in_memory: bool = False, fill_scratch_dir: Optional[str] = None,
+              save_fit: bool = True, save_prior: bool = True, record_resources: bool = False,
+              use_cache: bool = False, warm_start_parent: bool = False,
+              warm_start_model_version_id: Optional[int] = None) -> None:
     """
     Creates a dismod database using the saved inputs and the file
     structure specified in the context. Alternatively it will
@@ -188,10 +214,30 @@ def dismod_db(model_version_id: int, parent_location_id: int, sex_id: int,
         Whether or not to fill the database with new inputs based on the model_version_id,
         parent_location_id, and sex_id. If not filling, this script can be used
         to just execute commands on the database instead.
+    fill_in_memory
+        Whether to build the database in memory and copy it to its path
+        once it is filled, rather than writing to the path table by table.
+    fill_scratch_dir
+        An optional directory, like node-local disk, to build the database in
+        before copying it to its path.
     save_fit
         Whether or not to save the fit from this database as the parent fit.
     save_prior
         Whether or not to save the prior for the parent as the parent's prior.
+    record_resources
+        Whether to record the wall time, CPU time and maximum memory of each
+        of the dm_commands in a sidecar file next to the database.
+    use_cache
+        Whether to restore the results of fit, sample and predict commands from
+        the model version's cache of results when the tables they read haven't
+        changed since they last ran, rather than running them again.
+    warm_start_parent
+        Whether to start the fit, after init, from the predictions of the prior parent
+        database for this location and sex on the prior grid, rather than from the
+        means of the priors. Needs prior_parent and prior_sex.
+    warm_start_model_version_id
+        A model version whose fit of this location and sex to start the fit from, after init.
+        Where there are both, its values win over the parent's.
     """
     if test_dir is not None:
         context = Context(model_version_id=model_version_id,
@@ -230,13 +276,15 @@ def dismod_db(model_version_id: int, parent_location_id: int, sex_id: int,
             parent_location_id=parent_location_id, sex_id=sex_id,
             child_prior=child_prior, options=dm_options,
             mulcov_prior=mulcov_priors,
+            in_memory=fill_in_memory, scratch_dir=fill_scratch_dir
         )
         if save_prior:
             priors_to_save = format_rate_grid_for_ihme(
                 rates=filler.parent_child_model['rate'],
                 gbd_round_id=settings.gbd_round_id,
                 location_id=parent_location_id,
-                sex_id=sex_id
+                sex_id=sex_id,
+                age_metadata_file=context.age_metadata()
             )
             rh = ResultsHandler()
             rh.save_summary_files(
@@ -244,16 +292,42 @@ def dismod_db(model_version_id: int, parent_location_id: int, sex_id: int,
                 model_version_id=model_version_id
             )
 
+    start_values = list()
+    if warm_start_parent:
+        if not (prior_parent and prior_sex):
+            raise DismodDBError("Need to pass a prior parent and sex to warm start from the parent.")
+        start_values.append(prior_grid_values(
+            path=context.db_file(location_id=prior_parent, sex_id=prior_sex),
+            location_id=parent_location_id, sex_id=sex_id
+        ))
+    if warm_start_model_version_id is not None:
+        previous_context = Context(
+            model_version_id=warm_start_model_version_id,
+            configure_application=test_dir is None, root_directory=test_dir
+        )
+        start_values.append(fit_values(path=previous_context.db_file(location_id=parent_location_id, sex_id=sex_id)))
+
     if dm_commands:
-        run_dismod_commands(dm_file=str(db_path), commands=dm_commands)
+        run_commands = partial(
+            run_dismod_commands, dm_file=str(db_path), record_resources=record_resources,
+            cache_dir=context.dismod_cache_dir if use_cache else None
+        )
+        if start_values and 'init' in dm_commands:
+            # The start comes from the var table that init makes, and goes before the fit.
+            after_init = dm_commands.index('init') + 1
+            run_commands(commands=dm_commands[:after_init])
+            warm_start(path=db_path, values=pd.concat(start_values, ignore_index=True))
+            run_commands(commands=dm_commands[after_init:])
+        else:
+            run_commands(commands=dm_commands)
 
     if save_fit:
         save_predictions(
             db_file=context.db_file(location_id=parent_location_id, sex_id=sex_id),
             model_version_id=model_version_id,
             gbd_round_id=settings.gbd_round_id,
-            out_dir=context.fit_dir
-        
+            out_dir=context.fit_dir,
+            age_metadata_file=context.age_metadata()
         )
 
 
@@ -269,6 +343,8 @@ def main():
         dm_commands=args.dm_commands,
         dm_options=args.dm_options,
         fill=args.fill,
+        fill_in_memory=args.fill_in_memory,
+        fill_scratch_dir=args.fill_scratch_dir,
         prior_samples=args.prior_samples,
         prior_parent=args.prior_parent,
         prior_sex=args.prior_sex,
@@ -276,6 +352,10 @@ def main():
         test_dir=args.test_dir,
         save_fit=args.save_fit,
         save_prior=args.save_prior,
+        record_resources=args.record_resources,
+        use_cache=args.use_cache,
+        warm_start_parent=args.warm_start_parent,
+        warm_start_model_version_id=args.warm_start_model_version_id
     )
 
 
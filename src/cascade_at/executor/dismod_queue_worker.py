@@ -0,0 +1,55 @@
+import logging
+import sys
+
+from cascade_at.executor.args.arg_utils import ArgumentList
+from cascade_at.executor.args.args import StrArg, FloatArg, LogLevel
+from cascade_at.core.log import get_loggers, LEVELS
+from cascade_at.dismod.api.executors import run_queue_worker
+
+LOG = get_loggers(__name__)
+
+
+ARG_LIST = ArgumentList([
+    StrArg('--queue-dir', help='the shared directory that holds the queue of tasks', required=True),
+    FloatArg('--poll-interval', help='how often, in seconds, to look for tasks', default=0.5),
+    FloatArg('--heartbeat-interval', help='how often, in seconds, to show the pool that a task still runs',
+             default=10.0),
+    LogLevel()
+])
+
+
+def dismod_queue_worker(queue_dir: str, poll_interval: float, heartbeat_interval: float = 10.0) -> None:
+    """
+    Runs the tasks of a dmdismod pool with the "directory" backend from a shared
+    directory until the pool closes. Start as many of these as you like,
+    on any node that sees the directory, for instance as a job array.
+
+    Parameters
+    ----------
+    queue_dir
+        The directory of the queue
+    poll_interval
+        How long, in seconds, to wait when there is no task to take
+    heartbeat_interval
+        How often, in seconds, to touch the file of the running task,
+        so that the pool can tell that this worker is alive
+    """
+    n_run = run_queue_worker(queue_dir=queue_dir, poll_interval=poll_interval,
+                             heartbeat_interval=heartbeat_interval)
+    LOG.info(f"Ran {n_run} tasks from {queue_dir}.")
+
+
+def main():
+
+    args = ARG_LIST.parse_args(sys.argv[1:])
+    logging.basicConfig(level=LEVELS[args.log_level])
+
+    dismod_queue_worker(
+        queue_dir=args.queue_dir,
+        poll_interval=args.poll_interval,
+        heartbeat_interval=args.heartbeat_interval
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -14,6 +14,8 @@ from cascade_at.dismod.api.dismod_io import DismodIO
 
 LOG = get_loggers(__name__)
 
+CHUNKSIZE = 1000000
+
 
 ARG_LIST = ArgumentList([
     ModelVersionID(),
@@ -57,25 +59,34 @@ def get_mulcovs(dbs: List[DismodIO], covs: List[str],
     else:
         raise ValueError("Must pass tables fit_var or sample.")
 
-    dfs = pd.DataFrame()
+    dfs = list()
     for db in dbs:
-        mulcov = db.covariate[db.covariate.c_covariate_name.isin(covs)].merge(db.mulcov)
+        covariate = db.covariate
+        mulcov = covariate[covariate.c_covariate_name.isin(covs)].merge(db.mulcov)
         try:
-            df = db.var.merge(getattr(db, table), left_on='var_id', right_on=id_col)
-            df = df.fillna(np.nan)
-            df = df.merge(db.integrand, on='integrand_id', how='left')
-            df = df.merge(db.rate, on='rate_id', how='left')
+            var = db.var
+            integrand = db.integrand
+            rate = db.rate
             mulcov = mulcov.astype({'integrand_id': 'float64', 'rate_id': 'float64'})
-            df = mulcov.merge(df)
-            df.rename(columns={val_col: 'mulcov_value'}, inplace=True)
-            df = df[[
-                'c_covariate_name', 'mulcov_type', 'rate_name',
-                'integrand_name', 'mulcov_value'
-            ]]
+            mulcov_var_ids = var.loc[var.mulcov_id.isin(mulcov.mulcov_id), 'var_id'].values
+            # The sample table can be large, so read only the mulcov rows, a chunk at a time.
+            chunks = list()
+            for values in db.iter_table(table, chunksize=CHUNKSIZE, where={id_col: mulcov_var_ids}):
+                chunk = var.merge(values, left_on='var_id', right_on=id_col)
+                chunk = chunk.fillna(np.nan)
+                chunk = chunk.merge(integrand, on='integrand_id', how='left')
+                chunk = chunk.merge(rate, on='rate_id', how='left')
+                chunk = mulcov.merge(chunk)
+                chunk.rename(columns={val_col: 'mulcov_value'}, inplace=True)
+                chunks.append(chunk[[
+                    'c_covariate_name', 'mulcov_type', 'rate_name',
+                    'integrand_name', 'mulcov_value'
+                ]])
+            df = pd.concat(chunks) if chunks else pd.DataFrame()
         except AttributeError:
             df = pd.DataFrame()
-        dfs = dfs.append(df)
-    return dfs
+        dfs.append(df)
+    return pd.concat(dfs) if dfs else pd.DataFrame()
 
 
 def compute_statistics(df, mean=True, std=True, quantile=None):
@@ -139,7 +150,7 @@ def mulcov_statistics(model_version_id: int, locations: List[int], sexes: List[i
     """
 
     context = Context(model_version_id=model_version_id)
-    db_files = [DismodIO(context.db_file(location_id=loc, sex_id=sex))
+    db_files = [DismodIO(context.db_file(location_id=loc, sex_id=sex), cache=True)
                 for loc in locations for sex in sexes]
     LOG.info(f"There are {len(db_files)} databases that will be aggregated.")
 
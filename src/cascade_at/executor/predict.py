@@ -1,24 +1,25 @@
 import sys
 from pathlib import Path
-from typing import List, Union
+from typing import List, Optional, Union
 
 import logging
-import pandas as pd
 
 from cascade_at.context.model_context import Context
 from cascade_at.core.log import get_loggers, LEVELS
 from cascade_at.dismod.api.dismod_io import DismodIO
 from cascade_at.dismod.api.fill_extract_helpers.data_tables import prep_data_avgint
 from cascade_at.dismod.api.fill_extract_helpers.posterior_to_prior import get_prior_avgint_grid
-from cascade_at.dismod.api.multithreading import _DismodThread, dmdismod_in_parallel
+from cascade_at.dismod.api.multithreading import _DismodThread, dmdismod_in_parallel_streaming
+from cascade_at.dismod.api.multithreading import merge_worker_tables
 from cascade_at.dismod.api.run_dismod import run_dismod_commands
 from cascade_at.executor.args.arg_utils import ArgumentList
-from cascade_at.executor.args.args import LogLevel, BoolArg, ListArg
-from cascade_at.executor.args.args import ModelVersionID, ParentLocationID, SexID, NSim, NPool
+from cascade_at.executor.args.args import LogLevel, BoolArg, IntArg, ListArg, StrArg
+from cascade_at.executor.args.args import ModelVersionID, ParentLocationID, SexID, NSim, NPool, PoolBackend
 from cascade_at.executor.dismod_db import save_predictions
 from cascade_at.inputs.measurement_inputs import MeasurementInputs
 from cascade_at.model.grid_alchemy import Alchemy
 from cascade_at.model.utilities.integrand_grids import integrand_grids
+from cascade_at.saver.results_handler import DRAW_FORMATS
 from cascade_at.settings.settings import SettingsConfig
 
 LOG = get_loggers(__name__)
@@ -30,12 +31,21 @@ ARG_LIST = ArgumentList([
     SexID(),
     NSim(),
     NPool(),
+    PoolBackend(),
     ListArg('--child-locations', help='child locations to make predictions for', type=int, required=False),
     ListArg('--child-sexes', help='sexes to make predictions for', type=int, required=False),
     BoolArg('--prior-grid', help='whether to predict on the prior grid or the regular avgint grid'),
     BoolArg('--save-fit', help='whether to save the results of the predict sample as the fit'),
     BoolArg('--save-final', help='whether to save results as final'),
     BoolArg('--sample', help='whether to predict from the sample table or the fit_var table'),
+    BoolArg('--persistent-workers', help='whether each pool worker copies the database once for all its sims'),
+    BoolArg('--slim-workers', help='whether pool workers copy only the tables that their command needs'),
+    StrArg('--scratch-dir', help='a node-local directory for the pool workers\' copies of the database'),
+    StrArg('--queue-dir', help='a shared directory for the queue of the directory pool backend, '
+                               'which defaults to one next to the database'),
+    StrArg('--draw-format', help='the format of the saved draw files (default to csv)', choices=DRAW_FORMATS),
+    BoolArg('--float32-draws', help='whether to save draws in the npy format as 32-bit floats'),
+    IntArg('--save-threads', help='the number of draw files to write at once (default to 1)'),
     LogLevel()
 ])
 
@@ -87,16 +97,28 @@ class Predict(_DismodThread):
     """
     Predicts for a database in parallel. Chops up the sample table
     into a bunch of copies, each with only one sample.
+
+    Returns the predictions as a data frame, or if ``return_predict``
+    is False, the path to the database that has them.
     """
-    def __init__(self, **kwargs):
+    reset_tables = ['sample']
+    result_tables = ['predict']
+
+    def __init__(self, return_predict: bool = True, **kwargs):
         super().__init__(**kwargs)
+        self.return_predict = return_predict
+
+    def _slim_command(self):
+        return 'predict sample'
+
+    def _slim_where(self):
+        return {'sample': f'sample_index = {int(self.index)}'}
 
     def _process(self, db: str):
 
         dbio = DismodIO(path=db)
-        n_var = len(dbio.var)
 
-        this_sample = dbio.sample.loc[dbio.sample.sample_index == self.index].copy()
+        this_sample = dbio.read_table('sample', where={'sample_index': self.index})
         this_sample['sample_index'] = 0
         this_sample['sample_id'] = this_sample['var_id']
         dbio.sample = this_sample
@@ -104,8 +126,12 @@ class Predict(_DismodThread):
 
         run_dismod_commands(
             dm_file=db,
-            commands=[f'predict sample']
+            commands=[f'predict sample'],
+            timeout=self.timeout,
+            track_process=True
         )
+        if not self.return_predict:
+            return db
         dbio = DismodIO(path=db)
         predict = dbio.predict
         predict['sample_index'] = self.index
@@ -123,31 +149,70 @@ def predict_sample_sequence(path: Union[str, Path], table: str):
 
 
 def predict_sample_pool(main_db: Union[str, Path], index_file_pattern: str,
-                        n_sim: int, n_pool: int):
+                        n_sim: int, n_pool: int, persistent_workers: bool = False,
+                        slim_workers: bool = False, backend: str = 'process',
+                        scratch_dir: Optional[Union[str, Path]] = None,
+                        queue_dir: Optional[Union[str, Path]] = None):
     """
     Run predict sample in a pool by making copies of the existing database
     and splitting out the sample table into n_sim databases, running
     predict sample on each of them, and combining the results back
-    into the main database.
+    into the predict table of the main database. The results of each
+    sample are added inside SQLite as soon as they finish, in any order,
+    without reading them into memory.
+    With persistent_workers, each worker copies the database once
+    for all of its samples. With slim_workers, the workers' databases
+    have only the tables that predict needs, and one sample.
+    The backend, "process", "thread" or "directory", runs the pool.
+    With a scratch_dir, such as node-local disk, the workers' copies are made
+    there, and only the predictions are written next to main_db.
+    The "directory" backend queues the predictions in queue_dir,
+    which workers on every node have to see.
     """
     predict = Predict(
         main_db=main_db,
-        index_file_pattern=index_file_pattern
+        index_file_pattern=index_file_pattern,
+        return_predict=False,
+        slim=slim_workers,
+        scratch_dir=scratch_dir
     )
-    predictions = dmdismod_in_parallel(
+    d = DismodIO(path=main_db)
+    d.write_table('predict', d.empty_table('predict'))
+
+    def merge_predict(index, index_db):
+        # The database the result is in, which is a relaunch's own copy if the first attempt straggled.
+        merge_worker_tables(
+            main_db=main_db, index_file_pattern=str(index_db), indices=[index],
+            source_table='predict', target_table='predict', replace=False,
+            columns={
+                'predict_id': '{offset} + predict_id',
+                'sample_index': '{index}',
+                'avgint_id': 'avgint_id',
+                'avg_integrand': 'avg_integrand'
+            }
+        )
+        # Once merged, the predictions are in the main database, so their own database isn't needed.
+        Path(index_db).unlink(missing_ok=True)
+
+    dmdismod_in_parallel_streaming(
         dm_thread=predict,
         sims=list(range(n_sim)),
-        n_pool=n_pool
+        n_pool=n_pool,
+        sink=merge_predict,
+        persistent=persistent_workers,
+        backend=backend,
+        queue_dir=queue_dir
     )
-    predictions = pd.DataFrame().append(predictions).reset_index(drop=True)
-    d = DismodIO(path=main_db)
-    return predictions[['sample_index', 'avgint_id', 'avg_integrand']]
 
 
 def predict_sample(model_version_id: int, parent_location_id: int, sex_id: int,
                    child_locations: List[int], child_sexes: List[int],
                    prior_grid: bool = True, save_fit: bool = False, save_final: bool = False,
-                   sample: bool = False, n_sim: int = 1, n_pool: int = 1) -> None:
+                   sample: bool = False, n_sim: int = 1, n_pool: int = 1,
+                   persistent_workers: bool = False, slim_workers: bool = False,
+                   pool_backend: str = 'process', scratch_dir: Optional[str] = None,
+                   draw_format: str = 'csv', float32_draws: bool = False,
+                   queue_dir: Optional[str] = None, save_threads: int = 1) -> None:
     """
     Takes a database that has already had a fit and simulate sample run on it,
     fills the avgint table for the child_locations and child_sexes you want to make
@@ -180,14 +245,33 @@ def predict_sample(model_version_id: int, parent_location_id: int, sex_id: int,
     n_pool
         The number of multiprocessing pools to create. If 1, then will not
         run with pools but just run all simulations together in one dmdismod command.
+    persistent_workers
+        Whether each worker in the pool copies the database once,
+        rather than once for each simulation.
+    slim_workers
+        Whether the databases of the workers in the pool have
+        only the tables that predict needs.
+    pool_backend
+        How to run the pool, one of "process", "thread" or "directory"
+    scratch_dir
+        A node-local directory for the copies of the database in the pool
+    draw_format
+        The format of the saved draw files, "csv" or "npy"
+    float32_draws
+        Whether to save draws in the npy format as 32-bit floats
+    queue_dir
+        A shared directory for the queue of the "directory" backend, which
+        defaults to one next to the database, from the context
+    save_threads
+        The number of draw files, one for each location and sex, to write at once
 
     """
-    predictions = None
-
     context = Context(model_version_id=model_version_id)
     inputs, alchemy, settings = context.read_inputs()
     main_db = context.db_file(location_id=parent_location_id, sex_id=sex_id)
     index_file_pattern = context.db_index_file_pattern(location_id=parent_location_id, sex_id=sex_id)
+    if pool_backend == 'directory' and queue_dir is None:
+        queue_dir = context.db_queue_dir(location_id=parent_location_id, sex_id=sex_id, name='predict')
     
     if sample:
         table = 'sample'
@@ -201,9 +285,11 @@ def predict_sample(model_version_id: int, parent_location_id: int, sex_id: int,
         )
 
     if sample and (n_pool > 1):
-        predictions = predict_sample_pool(
+        predict_sample_pool(
             main_db=main_db, index_file_pattern=index_file_pattern,
-            n_sim=n_sim, n_pool=n_pool
+            n_sim=n_sim, n_pool=n_pool, persistent_workers=persistent_workers,
+            slim_workers=slim_workers, backend=pool_backend, scratch_dir=scratch_dir,
+            queue_dir=queue_dir
         )
     else:
         predict_sample_sequence(path=main_db, table=table)
@@ -230,7 +316,10 @@ def predict_sample(model_version_id: int, parent_location_id: int, sex_id: int,
                 gbd_round_id=settings.gbd_round_id,
                 out_dir=folder,
                 sample=sample,
-                predictions=predictions
+                draw_format=draw_format,
+                float32=float32_draws,
+                age_metadata_file=context.age_metadata(),
+                n_threads=save_threads
             )
 
 
@@ -250,7 +339,15 @@ def main():
         save_final=args.save_final,
         sample=args.sample,
         n_sim=args.n_sim,
-        n_pool=args.n_pool
+        n_pool=args.n_pool,
+        persistent_workers=args.persistent_workers,
+        slim_workers=args.slim_workers,
+        pool_backend=args.pool_backend,
+        scratch_dir=args.scratch_dir,
+        draw_format=args.draw_format or 'csv',
+        float32_draws=args.float32_draws,
+        queue_dir=args.queue_dir,
+        save_threads=args.save_threads or 1
     )
 
 
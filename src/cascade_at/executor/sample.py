@@ -1,20 +1,22 @@
+import json
 import sys
 from pathlib import Path
-from typing import Union
+from types import SimpleNamespace
+from typing import Optional, Union
 
 import logging
-import pandas as pd
 
 from cascade_at.context.model_context import Context
 from cascade_at.core.log import get_loggers, LEVELS
 from cascade_at.dismod.api.dismod_io import DismodIO
-from cascade_at.dismod.api.multithreading import _DismodThread, dmdismod_in_parallel
+from cascade_at.dismod.api.multithreading import _DismodThread, dmdismod_in_parallel_streaming
+from cascade_at.dismod.api.multithreading import merge_worker_tables
 from cascade_at.dismod.api.run_dismod import run_dismod_commands
 from cascade_at.dismod.process.process_behavior import check_sample_asymptotic, SampleAsymptoticError
 from cascade_at.executor import ExecutorError
 from cascade_at.executor.args.arg_utils import ArgumentList
-from cascade_at.executor.args.args import ModelVersionID, ParentLocationID, SexID, NPool, NSim
-from cascade_at.executor.args.args import StrArg, BoolArg, LogLevel
+from cascade_at.executor.args.args import ModelVersionID, ParentLocationID, SexID, NPool, NSim, PoolBackend
+from cascade_at.executor.args.args import StrArg, BoolArg, FloatArg, IntArg, LogLevel
 
 LOG = get_loggers(__name__)
 
@@ -25,8 +27,17 @@ ARG_LIST = ArgumentList([
     SexID(),
     NSim(),
     NPool(),
+    PoolBackend(),
     StrArg('--fit-type', help='what type of fit to simulate for, fit fixed or both', default='both'),
     BoolArg('--asymptotic', help='whether or not to do asymptotic statistics or fit-refit'),
+    BoolArg('--persistent-workers', help='whether each pool worker copies the database once for all its sims'),
+    BoolArg('--slim-workers', help='whether pool workers copy only the tables that their command needs'),
+    FloatArg('--fit-timeout', help='limit in seconds on each fit in the pool'),
+    FloatArg('--straggler-factor', help='relaunch fits that take this many times the median fit time'),
+    IntArg('--n-accept', help='stop once this many fits in the pool have succeeded, skipping the rest'),
+    StrArg('--scratch-dir', help='a node-local directory for the pool workers\' copies of the database'),
+    StrArg('--queue-dir', help='a shared directory for the queue of the directory pool backend, '
+                               'which defaults to one next to the database'),
     LogLevel()
 ])
 
@@ -36,6 +47,31 @@ class SampleError(ExecutorError):
     pass
 
 
+def summary_file(main_db: Union[str, Path]) -> Path:
+    """The sidecar file next to a database with the summary of its last pool of sample fits."""
+    return Path(f"{main_db}.sample_summary.json")
+
+
+def _write_summary(main_db: Union[str, Path], summary: SimpleNamespace) -> None:
+    record = {k: v for k, v in vars(summary).items() if k != 'tasks'}
+    record['tasks'] = [vars(task) for task in summary.tasks]
+    with open(summary_file(main_db), 'w') as f:
+        json.dump(record, f, indent=1)
+
+
+def read_summary(main_db: Union[str, Path]) -> Optional[dict]:
+    """
+    Reads the summary of the last pool of sample fits on a database, with the
+    simulations that ``succeeded``, ``failed``, ``timed_out``, were ``relaunched``
+    or ``skipped``, and the ``tasks``, or None if the samples didn't come from a pool.
+    """
+    path = summary_file(main_db)
+    if not path.exists():
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
 def simulate(path: Union[str, Path], n_sim: int):
     """
     Simulate from a database, within a database.
@@ -80,15 +116,27 @@ class FitSample(_DismodThread):
         File pattern to create the index databases with different samples.
     fit_type
         The type of fit to run, one of "fixed" or "both".
+    return_fit
+        Whether to return the fit as a data frame. Otherwise
+        returns the path to the database that has the fit.
     """
-    def __init__(self, fit_type: str, **kwargs):
+    result_tables = ['fit_var']
+
+    def __init__(self, fit_type: str, return_fit: bool = True, **kwargs):
         super().__init__(**kwargs)
         self.fit_type = fit_type
+        self.return_fit = return_fit
+
+    def _slim_command(self):
+        return f'fit {self.fit_type} {self.index}'
 
     def _process(self, db: str):
         run_dismod_commands(
-            dm_file=db, commands=[f'fit {self.fit_type} {self.index}']
+            dm_file=db, commands=[f'fit {self.fit_type} {self.index}'], timeout=self.timeout,
+            track_process=True
         )
+        if not self.return_fit:
+            return db
 
         db = DismodIO(path=db)
         fit = db.fit_var
@@ -101,10 +149,16 @@ class FitSample(_DismodThread):
 
 
 def sample_simulate_pool(main_db: Union[str, Path], index_file_pattern: str,
-                         fit_type: str, n_sim: int, n_pool: int):
+                         fit_type: str, n_sim: int, n_pool: int, persistent_workers: bool = False,
+                         slim_workers: bool = False, timeout: Optional[float] = None,
+                         straggler_factor: Optional[float] = None, n_accept: Optional[int] = None,
+                         backend: str = 'process', scratch_dir: Optional[Union[str, Path]] = None,
+                         queue_dir: Optional[Union[str, Path]] = None, raise_on_failure: bool = True):
     """
     Fit the samples in a database in parallel by making copies of the database, fitting them
     separately, and then combining them back together in the sample table of main_db.
+    Each fit is added to the sample table inside SQLite as it finishes, in order,
+    without reading it into memory.
 
     Parameters
     ----------
@@ -118,6 +172,35 @@ def sample_simulate_pool(main_db: Union[str, Path], index_file_pattern: str,
         Number of simulations that will be fit.
     n_pool
         Number of pools for the multiprocessing.
+    persistent_workers
+        Whether each worker copies the database once for all of its
+        simulations, rather than once for each simulation.
+    slim_workers
+        Whether the workers' databases have only the tables the fit needs.
+    timeout
+        A limit in seconds on each fit. A fit that runs past it fails.
+    straggler_factor
+        Relaunch a fit that has run this many times longer than the median fit,
+        when a worker is free, and take whichever attempt finishes first.
+    n_accept
+        Stop once this many fits have succeeded. The sample table then has
+        n_accept samples, numbered from zero in the order of their simulations.
+    backend
+        How to run the pool, one of "process", "thread" or "directory",
+        from :py:mod:`cascade_at.dismod.api.executors`.
+    scratch_dir
+        A directory, such as node-local disk, for the workers' copies
+        of the database. Only the fits are written next to main_db.
+    queue_dir
+        For the "directory" backend, a directory that workers on every
+        node can see, for the queue of fits
+    raise_on_failure
+        Whether to raise if any fit failed or timed out, or to only report it in the summary
+
+    Returns
+    -------
+    A summary of the fits from :py:func:`dmdismod_in_parallel_streaming`,
+    which records the simulations that failed, timed out or were skipped.
     """
     if fit_type not in ["fixed", "both"]:
         raise SampleError(f"Unrecognized fit type {fit_type}.")
@@ -125,18 +208,52 @@ def sample_simulate_pool(main_db: Union[str, Path], index_file_pattern: str,
     fit_sample = FitSample(
         main_db=main_db,
         index_file_pattern=index_file_pattern,
-        fit_type=fit_type
+        fit_type=fit_type,
+        return_fit=False,
+        slim=slim_workers,
+        timeout=timeout,
+        scratch_dir=scratch_dir
     )
-    fits = dmdismod_in_parallel(
+    # Reconstruct the sample table with all n_sim fits, numbered
+    # the way DisMod-AT numbers samples, merging each fit as it finishes.
+    d = DismodIO(path=main_db)
+    n_var = len(d.var)
+    d.sample = d.empty_table('sample')
+
+    merged = []
+
+    def merge_fit(index, index_db):
+        # Fits arrive in order, but some may be skipped or failed, so
+        # samples are numbered by how many came before them. The fit is in
+        # index_db, which is a relaunch's own copy if the first attempt straggled.
+        sample_index = len(merged)
+        merge_worker_tables(
+            main_db=main_db, index_file_pattern=str(index_db), indices=[index],
+            source_table='fit_var', target_table='sample', replace=False,
+            columns={
+                'sample_id': f'{sample_index} * {n_var} + fit_var_id',
+                'sample_index': f'{sample_index}',
+                'var_id': 'fit_var_id',
+                'var_value': 'fit_var_value'
+            }
+        )
+        merged.append(index)
+        # Once merged, the fit is in the main database, so its own database isn't needed.
+        Path(index_db).unlink(missing_ok=True)
+
+    return dmdismod_in_parallel_streaming(
         dm_thread=fit_sample,
         sims=list(range(n_sim)),
-        n_pool=n_pool
+        n_pool=n_pool,
+        sink=merge_fit,
+        persistent=persistent_workers,
+        ordered=True,
+        straggler_factor=straggler_factor,
+        n_accept=n_accept,
+        backend=backend,
+        queue_dir=queue_dir,
+        raise_on_failure=raise_on_failure
     )
-    # Reconstruct the sample table with all n_sim fits
-    columns = ['sample_index', 'var_id', 'var_value']
-    samp = pd.DataFrame().append(fits)[columns].reset_index(drop=True)
-    d = DismodIO(path=main_db)
-    d.sample = samp
 
 
 def sample_simulate_sequence(path: Union[str, Path], n_sim: int, fit_type: str):
@@ -186,7 +303,11 @@ def sample_asymptotic(path: Union[str, Path], n_sim: int, fit_type: str):
 
 
 def sample(model_version_id: int, parent_location_id: int, sex_id: int,
-           n_sim: int, n_pool: int, fit_type: str, asymptotic: bool = False) -> None:
+           n_sim: int, n_pool: int, fit_type: str, asymptotic: bool = False,
+           persistent_workers: bool = False, slim_workers: bool = False,
+           fit_timeout: Optional[float] = None, straggler_factor: Optional[float] = None,
+           pool_backend: str = 'process', scratch_dir: Optional[str] = None,
+           queue_dir: Optional[str] = None, n_accept: Optional[int] = None) -> None:
     """
     Creates variable samples from a dismod database
     that has already had a fit run on it. Does so
@@ -212,11 +333,37 @@ def sample(model_version_id: int, parent_location_id: int, sex_id: int,
         The type of fit that was performed on this database, one of fixed or both.
     asymptotic
         Whether or not to do asymptotic samples or fit-refit
+    persistent_workers
+        Whether each worker in the pool copies the database once,
+        rather than once for each simulation.
+    slim_workers
+        Whether the databases of the workers in the pool have
+        only the tables that the fit needs.
+    fit_timeout
+        A limit in seconds on each fit in the pool
+    straggler_factor
+        Relaunch a fit in the pool that has run this many times
+        longer than the median fit
+    pool_backend
+        How to run the pool, one of "process", "thread" or "directory"
+    scratch_dir
+        A node-local directory for the copies of the database in the pool
+    queue_dir
+        A shared directory for the queue of the "directory" backend, which
+        defaults to one next to the database, from the context
+    n_accept
+        Stop once this many fits in the pool have succeeded, skipping the rest.
+        Which simulations succeeded, failed, timed out or were skipped is
+        saved next to the database, for :py:func:`read_summary`.
     """
 
     context = Context(model_version_id=model_version_id)
     main_db = context.db_file(location_id=parent_location_id, sex_id=sex_id)
     index_file_pattern = context.db_index_file_pattern(location_id=parent_location_id, sex_id=sex_id)
+    if pool_backend == 'directory' and queue_dir is None:
+        queue_dir = context.db_queue_dir(location_id=parent_location_id, sex_id=sex_id, name='sample')
+    # A summary from before would describe samples that are about to be replaced.
+    summary_file(main_db).unlink(missing_ok=True)
 
     if asymptotic:
         result = sample_asymptotic(path=main_db, n_sim=n_sim, fit_type=fit_type)
@@ -229,10 +376,19 @@ def sample(model_version_id: int, parent_location_id: int, sex_id: int,
     if not asymptotic:
         simulate(path=main_db, n_sim=n_sim)
         if n_pool > 1:
-            sample_simulate_pool(
+            summary = sample_simulate_pool(
                 main_db=main_db, index_file_pattern=index_file_pattern, fit_type=fit_type,
-                n_pool=n_pool, n_sim=n_sim
+                n_pool=n_pool, n_sim=n_sim, persistent_workers=persistent_workers,
+                slim_workers=slim_workers, timeout=fit_timeout, straggler_factor=straggler_factor,
+                n_accept=n_accept, backend=pool_backend, scratch_dir=scratch_dir, queue_dir=queue_dir,
+                raise_on_failure=False
             )
+            _write_summary(main_db, summary)
+            needed = n_sim if n_accept is None else n_accept
+            if len(summary.succeeded) < needed:
+                raise SampleError(f"Only {len(summary.succeeded)} of {needed} fits succeeded, with "
+                                  f"{sorted(summary.failed)} failed and {sorted(summary.timed_out)} timed out. "
+                                  f"See {summary_file(main_db)}.")
         else:
             sample_simulate_sequence(path=main_db, n_sim=n_sim, fit_type=fit_type)
 
@@ -249,7 +405,15 @@ def main():
         n_sim=args.n_sim,
         n_pool=args.n_pool,
         fit_type=args.fit_type,
-        asymptotic=args.asymptotic
+        asymptotic=args.asymptotic,
+        persistent_workers=args.persistent_workers,
+        slim_workers=args.slim_workers,
+        fit_timeout=args.fit_timeout,
+        straggler_factor=args.straggler_factor,
+        pool_backend=args.pool_backend,
+        scratch_dir=args.scratch_dir,
+        queue_dir=args.queue_dir,
+        n_accept=args.n_accept
     )
 
 
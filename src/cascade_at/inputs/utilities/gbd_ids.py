@@ -1,6 +1,8 @@
 import pandas as pd
 import numpy as np
-from typing import Optional
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional, Union
 from intervaltree import IntervalTree
 
 from cascade_at.core.db import db_queries
@@ -89,12 +91,13 @@ def get_location_set_version_id(gbd_round_id):
     return location_set_version_id
 
 
-def get_age_group_metadata(gbd_round_id: int) -> pd.DataFrame:
-    """
-    Gets age group metadata.
-    """
-    df = db_queries.get_age_metadata(age_group_set_id=CascadeConstants.AGE_GROUP_SET_ID,
-                                     gbd_round_id=gbd_round_id)
+@lru_cache(maxsize=None)
+def _age_group_metadata(gbd_round_id: Optional[int], path: Optional[str]) -> pd.DataFrame:
+    if path is not None:
+        df = pd.read_csv(path)
+    else:
+        df = db_queries.get_age_metadata(age_group_set_id=CascadeConstants.AGE_GROUP_SET_ID,
+                                         gbd_round_id=gbd_round_id)
     df.rename(columns={'age_group_years_start': 'age_lower', 'age_group_years_end': 'age_upper'}, inplace=True)
     df.age_lower = df.age_lower.astype(float)
     df.age_upper = df.age_upper.astype(float)
@@ -102,6 +105,29 @@ def get_age_group_metadata(gbd_round_id: int) -> pd.DataFrame:
     return df[['age_group_id', 'age_lower', 'age_upper']]
 
 
+def get_age_group_metadata(gbd_round_id: Optional[int] = None,
+                           path: Optional[Union[str, Path]] = None) -> pd.DataFrame:
+    """
+    Gets age group metadata. It's queried once per process for each
+    GBD round, or read once from a local file.
+
+    Parameters
+    ----------
+    gbd_round_id
+        The GBD round to query the age groups for
+    path
+        A CSV file of age group metadata, with age_group_id and either
+        age_lower and age_upper or age_group_years_start and age_group_years_end,
+        to use rather than querying the database. If passed, ignores gbd_round_id.
+    """
+    if gbd_round_id is None and path is None:
+        raise IhmeIDError("Need to pass either a gbd_round_id or a file to get the age group metadata.")
+    if path is not None:
+        gbd_round_id = None
+        path = str(Path(path).resolve())
+    return _age_group_metadata(gbd_round_id=gbd_round_id, path=path).copy()
+
+
 def make_age_intervals(df: Optional[pd.DataFrame] = None,
                        gbd_round_id: Optional[int] = None) -> IntervalTree:
     """
@@ -161,6 +187,79 @@ def make_time_intervals(df: Optional[pd.DataFrame] = None) -> IntervalTree:
     return time_intervals
 
 
+class IntervalMapper:
+    def __init__(self, lower: np.ndarray, upper: np.ndarray, ids: np.ndarray):
+        """
+        Maps values to the IDs of the intervals [lower, upper) that they are in,
+        with a binary search over the sorted lower bounds, for all of the
+        values at once. The intervals can't overlap, which is checked
+        when the mapper is made, rather than for each value.
+
+        Parameters
+        ----------
+        lower
+            The lower bound of each interval, which is in the interval
+        upper
+            The upper bound of each interval, which isn't
+        ids
+            The ID of each interval
+        """
+        df = pd.DataFrame({'lower': lower, 'upper': upper, 'ids': ids}).drop_duplicates()
+        df = df.sort_values(['lower', 'upper'])
+        self.lower = df.lower.values.astype(float)
+        self.upper = df.upper.values.astype(float)
+        self.ids = df.ids.values
+
+        overlaps = self.lower[1:] < self.upper[:-1]
+        if overlaps.any():
+            raise IhmeIDError(f"The intervals starting at {self.lower[1:][overlaps].tolist()} overlap "
+                              "the intervals before them.")
+
+    def __call__(self, values: Union[pd.Series, np.ndarray]) -> np.ndarray:
+        """
+        The IDs of the intervals that the values are in.
+        Raises an error if any value isn't in an interval.
+        """
+        # There are few distinct ages and times, so each is only searched for once.
+        codes, distinct = pd.factorize(np.asarray(values, dtype=float))
+        position = np.searchsorted(self.lower, distinct, side='right') - 1
+        found = position >= 0
+        found[found] = distinct[found] < self.upper[position[found]]
+        if not found.all() or (codes < 0).any():
+            missing = distinct[~found].tolist() + ([np.nan] if (codes < 0).any() else [])
+            raise IhmeIDError(f"The values {missing} are not in any interval.")
+        return self.ids[position][codes]
+
+
+@lru_cache(maxsize=None)
+def _age_mapper(gbd_round_id: Optional[int], path: Optional[str]) -> IntervalMapper:
+    df = _age_group_metadata(gbd_round_id=gbd_round_id, path=path)
+    return IntervalMapper(lower=df.age_lower.values, upper=df.age_upper.values, ids=df.age_group_id.values)
+
+
+def make_age_mapper(gbd_round_id: Optional[int] = None,
+                    path: Optional[Union[str, Path]] = None) -> IntervalMapper:
+    """
+    Makes a mapper from age to age group ID, once per process for each GBD round
+    or age group metadata file, as in :py:func:`get_age_group_metadata`.
+    """
+    if gbd_round_id is None and path is None:
+        raise IhmeIDError("Need to pass either a gbd_round_id or a file to get the age group metadata.")
+    if path is not None:
+        gbd_round_id = None
+        path = str(Path(path).resolve())
+    return _age_mapper(gbd_round_id=gbd_round_id, path=path)
+
+
+@lru_cache(maxsize=None)
+def make_time_mapper() -> IntervalMapper:
+    """
+    Makes a mapper from time to year ID, for the years in :py:func:`make_time_intervals`.
+    """
+    years = np.arange(1950, 2050)
+    return IntervalMapper(lower=years, upper=years + 1, ids=years)
+
+
 def map_id_from_interval_tree(index, tree):
     i = None
     iset = tree.at(index)
@@ -193,7 +292,8 @@ def get_country_level_covariate_ids(country_covariate_id):
     return {k: f"c_{v['covariate_name_short']}" for k, v in cov_dict.items()}
 
 
-def format_age_time(df: pd.DataFrame, gbd_round_id: int) -> pd.DataFrame:
+def format_age_time(df: pd.DataFrame, gbd_round_id: int,
+                    age_metadata_file: Optional[Union[str, Path]] = None) -> pd.DataFrame:
     """
     Formats age_lower, age_upper, and time_lower and time_upper
     into the IHME age and time bins.
@@ -205,6 +305,9 @@ def format_age_time(df: pd.DataFrame, gbd_round_id: int) -> pd.DataFrame:
         time lower and upper or year_id
     gbd_round_id
         gbd round
+    age_metadata_file
+        optional CSV file of age group metadata to use
+        rather than querying it for the gbd round
 
     Returns
     -------
@@ -214,13 +317,8 @@ def format_age_time(df: pd.DataFrame, gbd_round_id: int) -> pd.DataFrame:
     map_year = 'year_id' not in df.columns
 
     if map_age:
-        age_intervals = make_age_intervals(gbd_round_id=gbd_round_id)
-        df['age_group_id'] = df['age_lower'].apply(
-            lambda x: map_id_from_interval_tree(index=x, tree=age_intervals)
-        )
+        age_mapper = make_age_mapper(gbd_round_id=gbd_round_id, path=age_metadata_file)
+        df['age_group_id'] = age_mapper(df['age_lower'].values)
     if map_year:
-        time_intervals = make_time_intervals()
-        df['year_id'] = df['time_lower'].apply(
-            lambda x: map_id_from_interval_tree(index=x, tree=time_intervals)
-        )
+        df['year_id'] = make_time_mapper()(df['time_lower'].values)
     return df
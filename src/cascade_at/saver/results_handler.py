@@ -6,10 +6,13 @@ to the epi databases for visualization in EpiViz.
 Eventually, this module should be replaced by something like ``save_results_at``.
 """
 
+import json
 import os
+from multiprocessing.pool import ThreadPool
 from pathlib import Path
+import numpy as np
 import pandas as pd
-from typing import List
+from typing import Callable, Dict, List, Optional, Union
 
 from cascade_at.core.db import db_tools
 from cascade_at.core.log import get_loggers
@@ -26,6 +29,15 @@ VALID_TABLES = [
 ]
 
 
+DRAW_FORMATS = ['csv', 'npy']
+"""
+The formats of draw files. In ``npy``, the draws for a location and sex are
+a NumPy array with a row for each draw, next to a CSV index of its columns
+and a JSON file with the names of its rows, so that some draws or some rows
+can be read from it without reading all of it.
+"""
+
+
 class UiCols:
     MEAN = 'mean'
     LOWER = 'lower'
@@ -79,29 +91,100 @@ class ResultsHandler:
     def summarize_results(self, df: pd.DataFrame) -> pd.DataFrame:
         """
         Summarizes results from either mean or draw cols to get
-        mean, upper, and lower cols.
+        mean, upper, and lower cols, for all rows at once. The
+        data frame that is passed isn't changed.
 
         Parameters
         ----------
         df
             A data frame with draw columns or just a mean column
         """
+        summary = df[self.draw_keys].copy()
         if ExtractorCols.VALUE_COL_FIT in df.columns:
-            df[UiCols.MEAN] = df[ExtractorCols.VALUE_COL_FIT]
-            df[UiCols.LOWER] = df[ExtractorCols.VALUE_COL_FIT]
-            df[UiCols.UPPER] = df[ExtractorCols.VALUE_COL_FIT]
+            summary[UiCols.MEAN] = df[ExtractorCols.VALUE_COL_FIT].values
+            summary[UiCols.LOWER] = df[ExtractorCols.VALUE_COL_FIT].values
+            summary[UiCols.UPPER] = df[ExtractorCols.VALUE_COL_FIT].values
+        else:
+            draws = df[self._value_cols(df)].to_numpy(dtype=float)
+            # Missing draws are skipped, as pandas does, with the slower nan functions only when needed.
+            if np.isnan(draws).any():
+                mean, quantile = np.nanmean, np.nanquantile
+            else:
+                mean, quantile = np.mean, np.quantile
+            summary[UiCols.MEAN] = mean(draws, axis=1)
+            summary[UiCols.LOWER] = quantile(draws, q=UiCols.LOWER_QUANTILE, axis=1)
+            summary[UiCols.UPPER] = quantile(draws, q=UiCols.UPPER_QUANTILE, axis=1)
+        return summary
+
+    @staticmethod
+    def _write_partitions(df: pd.DataFrame, directory: Path,
+                          write: Callable[[pd.DataFrame, int, int], None], n_threads: int = 1) -> None:
+        """
+        Splits a data frame by location and sex in one pass, makes each
+        location's directory, and writes each part, in a pool of threads if asked.
+
+        Parameters
+        ----------
+        df
+            A data frame with location_id and sex_id
+        directory
+            Path to save the files to, with a directory for each location
+        write
+            Writes the part of the data frame for a location and sex
+        n_threads
+            The number of parts to write at once
+        """
+        partitions = [
+            (subset, int(loc), int(sex))
+            for (loc, sex), subset in df.groupby(['location_id', 'sex_id'], sort=False)
+        ]
+        for loc in {loc for _, loc, _ in partitions}:
+            os.makedirs(str(directory / str(loc)), exist_ok=True)
+        if n_threads > 1 and len(partitions) > 1:
+            # Writing files mostly releases the GIL, so threads are enough.
+            with ThreadPool(processes=min(n_threads, len(partitions))) as pool:
+                pool.starmap(write, partitions)
         else:
-            draw_cols = [col for col in df.columns if col.startswith(ExtractorCols.VALUE_COL_SAMPLES)]
-            df[UiCols.MEAN] = df[draw_cols].mean(axis=1)
-            df[UiCols.LOWER] = df[draw_cols].quantile(q=UiCols.LOWER_QUANTILE, axis=1)
-            df[UiCols.UPPER] = df[draw_cols].quantile(q=UiCols.UPPER_QUANTILE, axis=1)
+            for partition in partitions:
+                write(*partition)
+
+    @staticmethod
+    def _value_cols(df: pd.DataFrame) -> List[str]:
+        """The draw columns of a data frame, or its mean column if it has no draws."""
+        if ExtractorCols.VALUE_COL_FIT in df.columns:
+            return [ExtractorCols.VALUE_COL_FIT]
+        return [col for col in df.columns if col.startswith(ExtractorCols.VALUE_COL_SAMPLES)]
+
+    @staticmethod
+    def _npy_files(directory: Path, location_id: int, sex_id: int) -> Dict[str, Path]:
+        """The files of the npy draws for a location and sex."""
+        stem = directory / str(location_id) / f'{location_id}_{sex_id}'
+        return {
+            'draws': stem.with_name(stem.name + '_draws.npy'),
+            'index': stem.with_name(stem.name + '_index.csv'),
+            'columns': stem.with_name(stem.name + '_draws.json')
+        }
 
-        return df[self.draw_keys + [UiCols.MEAN, UiCols.LOWER, UiCols.UPPER]]
+    def _save_npy(self, df: pd.DataFrame, directory: Path, location_id: int, sex_id: int,
+                  float32: bool) -> None:
+        """
+        Saves the draws for a location and sex as an array with a row for each draw, whose
+        columns are in order of the draw keys, so that the rows of a measure are together.
+        """
+        files = self._npy_files(directory=directory, location_id=location_id, sex_id=sex_id)
+        value_cols = self._value_cols(df)
+        df = df.sort_values(self.draw_keys)
+        draws = df[value_cols].to_numpy(dtype=np.float32 if float32 else np.float64).T
+        np.save(files['draws'], np.ascontiguousarray(draws))
+        df[self.draw_keys].to_csv(files['index'], index=False)
+        files['columns'].write_text(json.dumps(value_cols))
 
     def save_draw_files(self, df: pd.DataFrame, model_version_id: int,
-                        directory: Path, add_summaries: bool) -> None:
+                        directory: Path, add_summaries: bool,
+                        draw_format: str = 'csv', float32: bool = False, n_threads: int = 1) -> None:
         """
-        Saves a data frame by location and sex in .csv files.
+        Saves a data frame by location and sex in .csv files,
+        or in the columnar ``npy`` format of :py:data:`DRAW_FORMATS`.
         This currently saves the summaries, but when we get
         save_results working it will save draws and then
         summaries as part of that.
@@ -118,27 +201,125 @@ class ResultsHandler:
             Path to save the files to
         add_summaries
             Save an additional file with summaries to upload
+        draw_format
+            The format of the draw files, one of :py:data:`DRAW_FORMATS`
+        float32
+            Whether to save npy draws as 32-bit floats, which halves their size
+        n_threads
+            The number of files to write at once
         """
+        if draw_format not in DRAW_FORMATS:
+            raise ResultsError(f"Unknown draw format {draw_format}. Valid formats are {DRAW_FORMATS}.")
         LOG.info(f"Saving results to {directory.absolute()}")
 
         df['model_version_id'] = model_version_id
         self._validate_results(df=df)
 
-        for loc in df.location_id.unique().tolist():
-            os.makedirs(str(directory / str(loc)), exist_ok=True)
-            for sex in df.sex_id.unique().tolist():
-                subset = df.loc[
-                    (df.location_id == loc) &
-                    (df.sex_id == sex)
-                ].copy()
+        def write(subset: pd.DataFrame, loc: int, sex: int) -> None:
+            if draw_format == 'npy':
+                self._save_npy(df=subset, directory=directory, location_id=loc, sex_id=sex, float32=float32)
+            else:
                 subset.to_csv(directory / str(loc) / f'{loc}_{sex}.csv')
-                if add_summaries:
-                    summary = self.summarize_results(df=subset)
-                    self.save_summary_files(
-                        df=summary, model_version_id=model_version_id, directory=directory
-                    )
 
-    def save_summary_files(self, df: pd.DataFrame, model_version_id: int, directory: Path) -> None:
+        self._write_partitions(df=df, directory=directory, write=write, n_threads=n_threads)
+        if add_summaries:
+            self.save_summary_files(
+                df=self.summarize_results(df=df), model_version_id=model_version_id,
+                directory=directory, n_threads=n_threads
+            )
+
+    def read_draw_files(self, directory: Path,
+                        locations: Optional[List[int]] = None,
+                        sexes: Optional[List[int]] = None,
+                        measure_ids: Optional[List[int]] = None,
+                        draws: Optional[List[Union[int, str]]] = None) -> pd.DataFrame:
+        """
+        Reads draw files saved by :py:meth:`save_draw_files`, in either format,
+        for some locations, sexes, measures and draws. From npy files, only the
+        draws asked for are read, and only the part of each that has the measures.
+
+        Parameters
+        ----------
+        directory
+            Path the files were saved to
+        locations
+            Locations to read, defaulting to all locations in the directory
+        sexes
+            Sexes to read, defaulting to all sexes that were saved
+        measure_ids
+            Measures to read, defaulting to all measures
+        draws
+            Draws to read, as their index or their column name,
+            defaulting to all draws, or the mean for a fit
+
+        Returns
+        -------
+        Data frame with the draw keys and the draw columns.
+        """
+        if locations is None:
+            locations = sorted(int(d.name) for d in directory.iterdir() if d.is_dir() and d.name.isdigit())
+        if draws is not None:
+            draws = [d if isinstance(d, str) else f'{ExtractorCols.VALUE_COL_SAMPLES}_{d}' for d in draws]
+
+        dfs = list()
+        for loc in locations:
+            for sex in sexes or self._saved_sexes(directory=directory, location_id=loc):
+                files = self._npy_files(directory=directory, location_id=loc, sex_id=sex)
+                if files['draws'].exists():
+                    df = self._read_npy(files=files, measure_ids=measure_ids, draws=draws)
+                else:
+                    df = self._read_csv(directory / str(loc) / f'{loc}_{sex}.csv', measure_ids=measure_ids, draws=draws)
+                dfs.append(df)
+        if not dfs:
+            raise ResultsError(f"There are no draw files in {directory} to read.")
+        return pd.concat(dfs, ignore_index=True)
+
+    @staticmethod
+    def _saved_sexes(directory: Path, location_id: int) -> List[int]:
+        """The sexes that have draw files for a location, from names like 102_2.csv or 102_2_draws.npy."""
+        sexes = set()
+        for f in (directory / str(location_id)).iterdir():
+            name = f.name[len(f'{location_id}_'):]
+            if not f.name.endswith('summary.csv') and f.suffix in ['.csv', '.npy'] and not name.endswith('_index.csv'):
+                sexes.add(int(name.split('_')[0].split('.')[0]))
+        return sorted(sexes)
+
+    def _read_npy(self, files: Dict[str, Path], measure_ids: Optional[List[int]],
+                  draws: Optional[List[str]]) -> pd.DataFrame:
+        """Reads some rows and draws of an npy draw file through a memory map."""
+        index = pd.read_csv(files['index'])
+        position = {col: i for i, col in enumerate(json.loads(files['columns'].read_text()))}
+        value_cols = list(position)
+        if draws is not None:
+            missing = [d for d in draws if d not in position]
+            if missing:
+                raise ResultsError(f"The draws {missing} are not in {files['draws']}.")
+            value_cols = draws
+        rows = np.arange(len(index))
+        if measure_ids is not None:
+            rows = np.flatnonzero(index.measure_id.isin(measure_ids).values)
+        matrix = np.load(files['draws'], mmap_mode='r')
+        if len(rows) and rows[-1] - rows[0] + 1 == len(rows):
+            # The rows of the measures are together, so each draw is read as one slice.
+            values = matrix[[position[col] for col in value_cols], rows[0]:rows[-1] + 1]
+        else:
+            values = matrix[[position[col] for col in value_cols]][:, rows]
+        df = index.iloc[rows].reset_index(drop=True)
+        return pd.concat([df, pd.DataFrame(np.asarray(values).T, columns=value_cols)], axis=1)
+
+    def _read_csv(self, path: Path, measure_ids: Optional[List[int]],
+                  draws: Optional[List[str]]) -> pd.DataFrame:
+        """Reads some columns of a CSV draw file, and keeps the rows of some measures."""
+        columns = None
+        if draws is not None:
+            columns = self.draw_keys + draws
+        df = pd.read_csv(path, usecols=columns)
+        if measure_ids is not None:
+            df = df.loc[df.measure_id.isin(measure_ids)].reset_index(drop=True)
+        return df[self.draw_keys + (draws or self._value_cols(df))]
+
+    def save_summary_files(self, df: pd.DataFrame, model_version_id: int, directory: Path,
+                           n_threads: int = 1) -> None:
         """
         Saves a data frame with summaries by location and sex in summary.csv files.
 
@@ -152,6 +333,8 @@ class ResultsHandler:
             The model version to attach to the data
         directory
             Path to save the files to
+        n_threads
+            The number of files to write at once
         """
         LOG.info(f"Saving results to {directory.absolute()}")
 
@@ -159,14 +342,10 @@ class ResultsHandler:
         self._validate_results(df=df)
         self._validate_summaries(df=df)
 
-        for loc in df.location_id.unique().tolist():
-            os.makedirs(str(directory / str(loc)), exist_ok=True)
-            for sex in df.sex_id.unique().tolist():
-                subset = df.loc[
-                    (df.location_id == loc) &
-                    (df.sex_id == sex)
-                    ].copy()
-                subset.to_csv(directory / str(loc) / f'{loc}_{sex}_summary.csv')
+        def write(subset: pd.DataFrame, loc: int, sex: int) -> None:
+            subset.to_csv(directory / str(loc) / f'{loc}_{sex}_summary.csv')
+
+        self._write_partitions(df=df, directory=directory, write=write, n_threads=n_threads)
 
     @staticmethod
     def upload_summaries(directory: Path, conn_def: str, table: str) -> None:
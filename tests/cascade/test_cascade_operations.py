@@ -105,6 +105,20 @@ def test_sample_asymptotic():
     )
 
 
+def test_sample_n_accept():
+    obj = Sample(
+        model_version_id=0,
+        parent_location_id=1,
+        sex_id=1,
+        n_sim=5,
+        n_pool=2,
+        fit_type='both',
+        asymptotic=False,
+        n_accept=4
+    )
+    assert obj.command.endswith('--n-pool 2 --fit-type both --n-accept 4')
+
+
 def test_predict():
     obj = Predict(
         model_version_id=0,
@@ -129,6 +143,11 @@ def test_predict():
     assert obj.template_kwargs['child_locations'] == '--child-locations 1 2'
 
 
+def test_predict_save_threads():
+    obj = Predict(model_version_id=0, parent_location_id=1, sex_id=1, save_final=True, save_threads=4)
+    assert obj.command.endswith('--prior-grid --save-final --sample --save-threads 4')
+
+
 def test_format_upload():
     obj = Upload(
         model_version_id=0,
@@ -1,5 +1,7 @@
+import pandas as pd
 import pytest
 
+from cascade_at.context import model_context
 from cascade_at.context.model_context import Context
 
 
@@ -18,3 +20,16 @@ def test_context_files(context):
 
 def test_context_location_sex(context):
     assert str(context.db_file(1, 3)).endswith('cascade_dir/data/0/dbs/1/3/dismod.db')
+
+
+def test_context_queue_dir(context):
+    assert str(context.db_queue_dir(1, 3, 'sample')).endswith('cascade_dir/data/0/dbs/1/3/sample_queue')
+
+
+def test_context_age_metadata(context, monkeypatch):
+    assert context.age_metadata() is None
+    ages = pd.DataFrame({'age_group_id': [2, 3], 'age_lower': [0., 5.], 'age_upper': [5., 10.]})
+    monkeypatch.setattr(model_context, 'get_age_group_metadata', lambda gbd_round_id: ages)
+    context.write_age_metadata(gbd_round_id=6)
+    assert context.age_metadata() == context.age_metadata_file
+    pd.testing.assert_frame_equal(pd.read_csv(context.age_metadata()), ages)
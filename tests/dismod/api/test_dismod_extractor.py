@@ -1,7 +1,10 @@
 from pathlib import Path
 
+import numpy as np
+import pandas as pd
 import pytest
 
+from cascade_at.dismod.api.dismod_io import DismodIO
 from cascade_at.dismod.api.dismod_extractor import DismodExtractor
 from cascade_at.dismod.api.dismod_extractor import DismodExtractorError
 from cascade_at.dismod.api.run_dismod import run_dismod
@@ -49,3 +52,113 @@ def test_format_fit(ihme, dismod, df):
     assert all(pred.columns == [
         'location_id', 'year_id', 'age_group_id', 'sex_id', 'measure_id', 'mean'
     ])
+
+
+@pytest.fixture
+def predict_db(tmp_path):
+    """A database with a predict table from samples on a 3 x 2 age-time grid."""
+    path = tmp_path / 'predict.db'
+    db = DismodIO(path=path)
+    db.integrand = pd.DataFrame({
+        'integrand_name': ['Sincidence', 'mtexcess'], 'minimum_meas_cv': 0.
+    })
+    grid = pd.DataFrame(
+        [(i, l, s, a, t)
+         for i in [0, 1] for l in [101, 102] for s in [1, 2]
+         for a in [0., 5., 10.] for t in [1990., 2000.]],
+        columns=['integrand_id', 'c_location_id', 'c_sex_id', 'age_lower', 'time_lower']
+    )
+    grid['age_upper'] = grid['age_lower']
+    grid['time_upper'] = grid['time_lower']
+    grid['node_id'] = grid['c_location_id'] - 101
+    grid['weight_id'] = 0
+    grid['subgroup_id'] = 0
+    db.avgint = grid
+    n_draws = 4
+    db.write_table('predict', pd.DataFrame({
+        'sample_index': np.tile(np.arange(n_draws), len(grid)),
+        'avgint_id': np.repeat(np.arange(len(grid)), n_draws),
+        'avg_integrand': np.arange(len(grid) * n_draws, dtype=float)
+    }))
+    return path
+
+
+def test_get_predictions_subset(predict_db):
+    d = DismodExtractor(path=predict_db)
+    pred = d.get_predictions(locations=[102], sexes=[1], samples=True)
+    assert set(pred.location_id) == {102}
+    assert set(pred.sex_id) == {1}
+    assert len(pred) == 2 * 3 * 2
+    assert [c for c in pred.columns if c.startswith('draw')] == ['draw_0', 'draw_1', 'draw_2', 'draw_3']
+    everything = d.get_predictions(samples=True)
+    expected = everything.loc[(everything.location_id == 102) & (everything.sex_id == 1)]
+    pd.testing.assert_frame_equal(pred.reset_index(drop=True), expected.reset_index(drop=True))
+
+
+def test_format_predictions_age_metadata_file(predict_db, tmp_path):
+    path = tmp_path / 'age_metadata.csv'
+    pd.DataFrame({
+        'age_group_id': [5, 6, 7], 'age_group_years_start': [0., 5., 10.], 'age_group_years_end': [5., 10., 15.]
+    }).to_csv(path, index=False)
+    d = DismodExtractor(path=predict_db)
+    pred = d.format_predictions_for_ihme(gbd_round_id=6, samples=True, age_metadata_file=path)
+    assert sorted(pred.age_group_id.unique()) == [5, 6, 7]
+    assert sorted(pred.year_id.unique()) == [1990, 2000]
+    assert [c for c in pred.columns if c.startswith('draw')] == ['draw_0', 'draw_1', 'draw_2', 'draw_3']
+
+
+def test_gather_draws_for_prior_grid(predict_db):
+    d = DismodExtractor(path=predict_db)
+    draws = d.gather_draws_for_prior_grid(
+        location_id=102, sex_id=1, rates=['iota', 'chi'], dage=True, dtime=True
+    )
+    pred = d.get_predictions(locations=[102], sexes=[1], samples=True)
+    draw_cols = ['draw_0', 'draw_1', 'draw_2', 'draw_3']
+    for rate in ['iota', 'chi']:
+        assert draws[rate]['ages'].tolist() == [0., 5., 10.]
+        assert draws[rate]['times'].tolist() == [1990., 2000.]
+        assert draws[rate]['n_draws'] == 4
+        value = draws[rate]['value']
+        assert value.shape == (3, 2, 4)
+        for age_idx, age in enumerate([0., 5., 10.]):
+            for time_idx, time in enumerate([1990., 2000.]):
+                row = pred.loc[(pred.rate == rate) & (pred.age_lower == age) & (pred.time_lower == time)]
+                np.testing.assert_array_equal(value[age_idx, time_idx], row[draw_cols].values.ravel())
+        np.testing.assert_array_equal(draws[rate]['dage'], np.diff(value, axis=0))
+        np.testing.assert_array_equal(draws[rate]['dtime'], np.diff(value, axis=1))
+
+
+def test_get_draw_matrix(predict_db):
+    d = DismodExtractor(path=predict_db)
+    index, sample_index, draws = d.get_draw_matrix(locations=[102], sexes=[1])
+    assert sample_index.tolist() == [0, 1, 2, 3]
+    assert draws.shape == (2 * 3 * 2, 4)
+    assert draws.flags['C_CONTIGUOUS']
+    assert list(index.columns[:5]) == ['avgint_id', 'location_id', 'sex_id', 'integrand_id', 'integrand_name']
+    assert set(index.location_id) == {102}
+    assert (np.diff(index.avgint_id) > 0).all()
+    # The fixture numbers the predictions in order of avgint_id and then sample_index.
+    expected = index.avgint_id.values[:, np.newaxis] * 4 + np.arange(4)
+    np.testing.assert_array_equal(draws, expected)
+
+
+def test_get_draw_matrix_from_predictions(predict_db):
+    d = DismodExtractor(path=predict_db)
+    n_draws = 12
+    predictions = pd.DataFrame({
+        'predict_id': range(3 * n_draws),
+        'sample_index': np.tile(np.arange(n_draws), 3),
+        'avgint_id': np.repeat([5, 0, 7], n_draws),
+        'avg_integrand': np.arange(3 * n_draws, dtype=float)
+    })
+    index, sample_index, draws = d.get_draw_matrix(predictions=predictions)
+    assert index.avgint_id.tolist() == [0, 5, 7]
+    np.testing.assert_array_equal(draws[1], np.arange(n_draws))
+
+    # Draw columns are named for their sample index, past ten draws too.
+    pred = d.get_predictions(samples=True, predictions=predictions.iloc[::-1])
+    assert [c for c in pred.columns if c.startswith('draw')] == [f'draw_{i}' for i in range(n_draws)]
+    np.testing.assert_array_equal(pred[[f'draw_{i}' for i in range(n_draws)]].values, draws)
+
+    with pytest.raises(DismodExtractorError):
+        d.get_draw_matrix(predictions=pd.concat([predictions, predictions.iloc[:1]]))
@@ -1,3 +1,6 @@
+import os
+import sqlite3
+
 import pytest
 import numpy as np
 import pandas as pd
@@ -205,3 +208,54 @@ def test_subgroup(dm, dm_read):
     }, index=[0])
     assert len(dm_read.subgroup) == 1
     assert all(dm_read.subgroup.columns == ['subgroup_id', 'subgroup_name', 'group_id', 'group_name'])
+
+
+@pytest.fixture
+def dm_cache(tmp_path):
+    return DismodIO(path=tmp_path / 'dismod.db', cache=True)
+
+
+def test_cache_reads_once(dm_cache):
+    dm_cache.age = pd.DataFrame({'age': [0.0, 1.0]})
+    first = dm_cache.age
+    # Mutating the returned frame doesn't change the cached table.
+    first['age'] = -1.0
+    assert (dm_cache.age['age'] == [0.0, 1.0]).all()
+    assert 'age' in dm_cache._table_cache
+
+
+def test_cache_invalidated_by_setter(dm_cache):
+    dm_cache.age = pd.DataFrame({'age': [0.0, 1.0]})
+    dm_cache.time = pd.DataFrame({'time': [1990.]})
+    assert len(dm_cache.age) == 2
+    assert len(dm_cache.time) == 1
+    dm_cache.age = pd.DataFrame({'age': [0.0, 1.0, 2.0]})
+    assert len(dm_cache.age) == 3
+    assert 'time' in dm_cache._table_cache
+
+
+def test_cache_invalidated_by_other_writer(dm_cache, dm):
+    dm_cache.age = pd.DataFrame({'age': [0.0, 1.0]})
+    assert len(dm_cache.age) == 2
+    dm.age = pd.DataFrame({'age': [0.0, 1.0, 2.0]})
+    assert len(dm_cache.age) == 3
+
+
+def test_cache_invalidated_by_same_size_write(dm_cache):
+    dm_cache.age = pd.DataFrame({'age': [0.0, 1.0]})
+    assert dm_cache.age.age.tolist() == [0.0, 1.0]
+    stat = os.stat(dm_cache.path)
+    connection = sqlite3.connect(str(dm_cache.path))
+    with connection:
+        connection.execute("UPDATE age SET age = 2.0 WHERE age_id = 1")
+    connection.close()
+    os.utime(dm_cache.path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert dm_cache.age.age.tolist() == [0.0, 2.0]
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc/self/fd'), reason="Lists open files from /proc")
+def test_cache_holds_no_open_file(dm_cache):
+    dm_cache.age = pd.DataFrame({'age': [0.0, 1.0]})
+    assert len(dm_cache.age) == 2
+    open_files = [os.path.realpath(f'/proc/self/fd/{fd}') for fd in os.listdir('/proc/self/fd')]
+    assert os.path.realpath(dm_cache.path) not in open_files
@@ -0,0 +1,297 @@
+import gc
+import sqlite3
+import weakref
+
+import pytest
+import numpy as np
+import pandas as pd
+
+from cascade_at.core.errors import DismodFileError
+from cascade_at.dismod.api.dismod_io import DismodIO
+from cascade_at.dismod.api.dismod_sqlite import _validation_plan
+
+
+@pytest.fixture
+def dm(tmp_path):
+    return DismodIO(path=tmp_path / 'dismod.db')
+
+
+@pytest.fixture
+def dm_read(tmp_path):
+    return DismodIO(path=tmp_path / 'dismod.db')
+
+
+def test_bulk_write(dm, dm_read):
+    with dm.bulk_write(journal_mode='MEMORY', synchronous='OFF'):
+        dm.age = pd.DataFrame({'age': [0.0, 1.0, 5.0]})
+        dm.time = pd.DataFrame({'time': [1990.0, 2000.0]})
+        # Reads inside the session see the session's writes.
+        assert len(dm.age) == 3
+    assert (dm_read.age['age'] == [0.0, 1.0, 5.0]).all()
+    assert (dm_read.time['time'] == [1990.0, 2000.0]).all()
+    assert all(dm_read.age.columns == ['age_id', 'age'])
+
+
+def test_bulk_write_nulls(dm, dm_read):
+    with dm.bulk_write():
+        dm.prior = pd.DataFrame({
+            'prior_id': [0, 1], 'prior_name': ['a', 'b'], 'density_id': [0, 0],
+            'lower': [0., None], 'upper': [1., None], 'mean': [0.5, 0.5],
+            'std': [0.1, None], 'eta': [None, 1e-6], 'nu': [None, None]
+        })
+    prior = dm_read.prior
+    assert prior['lower'].isnull().tolist() == [False, True]
+    assert prior['nu'].isnull().all()
+
+
+def test_bulk_write_rollback(dm, dm_read):
+    dm.age = pd.DataFrame({'age': [0.0]})
+    with pytest.raises(RuntimeError):
+        with dm.bulk_write():
+            dm.age = pd.DataFrame({'age': [0.0, 1.0]})
+            dm.time = pd.DataFrame({'time': [1990.0]})
+            raise RuntimeError("fail in the middle of a fill")
+    assert len(dm_read.age) == 1
+    assert ('time',) not in sqlite3.connect(str(dm.path)).execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table'"
+    ).fetchall()
+
+
+def test_bulk_write_nested(dm, dm_read):
+    with dm.bulk_write(synchronous='OFF'):
+        with dm.bulk_write():
+            dm.age = pd.DataFrame({'age': [0.0]})
+        assert dm.connectable is not dm.engine
+        dm.time = pd.DataFrame({'time': [1990.0]})
+    assert dm.connectable is dm.engine
+    assert len(dm_read.age) == 1
+    assert len(dm_read.time) == 1
+
+
+@pytest.mark.parametrize("use_scratch", [False, True])
+def test_staged(dm, dm_read, tmp_path, use_scratch):
+    dm.age = pd.DataFrame({'age': [0.0]})
+    scratch_dir = None
+    if use_scratch:
+        scratch_dir = tmp_path / 'scratch'
+        scratch_dir.mkdir()
+    with dm.staged(scratch_dir=scratch_dir):
+        dm.time = pd.DataFrame({'time': [1990.0, 2000.0]})
+        with dm.bulk_write():
+            dm.node = pd.DataFrame({'node_name': ['a'], 'parent': [None]})
+        # Nothing reaches the path until the stage closes.
+        assert len(dm.age) == 1
+        assert ('time',) not in sqlite3.connect(str(dm.path)).execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table'"
+        ).fetchall()
+    assert len(dm_read.age) == 1
+    assert len(dm_read.time) == 2
+    assert len(dm_read.node) == 1
+    if use_scratch:
+        assert not list(scratch_dir.iterdir())
+
+
+def test_staged_failure(dm, dm_read):
+    dm.age = pd.DataFrame({'age': [0.0]})
+    with pytest.raises(RuntimeError):
+        with dm.staged():
+            dm.age = pd.DataFrame({'age': [0.0, 1.0]})
+            raise RuntimeError("fail in the middle of a fill")
+    assert dm.connectable is dm.engine
+    assert len(dm_read.age) == 1
+
+
+@pytest.fixture
+def samples(dm):
+    dm.sample = pd.DataFrame({
+        'sample_index': [0, 0, 1, 1, 2, 2],
+        'var_id': [0, 1, 0, 1, 0, 1],
+        'var_value': [0.1, 0.2, 0.3, None, 0.5, 0.6]
+    })
+    return dm
+
+
+def test_read_table_where(samples):
+    df = samples.read_table('sample', where={'sample_index': 1})
+    assert df.sample_index.tolist() == [1, 1]
+    assert df.var_id.dtype == np.int64
+    assert df.var_value.dtype == np.float64
+    assert all(df.columns == samples.read_table('sample').columns)
+
+
+def test_read_table_where_in(samples):
+    df = samples.read_table('sample', where={'sample_index': np.array([0, 2]), 'var_id': [1]})
+    assert df.sample_id.tolist() == [1, 5]
+
+
+def test_read_table_columns(samples):
+    df = samples.read_table('sample', columns=['var_value'], where={'var_id': 1})
+    assert list(df.columns) == ['var_value']
+    assert df.var_value.isnull().tolist() == [False, True, False]
+
+
+def test_read_table_strings(dm):
+    dm.node = pd.DataFrame({'node_name': ['a', 'b', 'c'], 'parent': [None, 0, 0]})
+    df = dm.read_table('node', where={'node_name': ['b', 'c']})
+    assert df.node_id.tolist() == [1, 2]
+    assert df.parent.dtype == np.int64
+    empty = dm.read_table('node', where={'node_name': 'd'})
+    assert empty.empty
+    assert empty.node_id.dtype == np.int64
+
+
+def test_read_table_bad_column(samples):
+    with pytest.raises(DismodFileError):
+        samples.read_table('sample', where={'location_id': 1})
+
+
+def test_iter_table(samples):
+    chunks = list(samples.iter_table('sample', chunksize=4))
+    assert [len(c) for c in chunks] == [4, 2]
+    pd.testing.assert_frame_equal(
+        pd.concat(chunks, ignore_index=True), samples.read_table('sample')
+    )
+    chunks = list(samples.iter_table('sample', chunksize=1, columns=['var_value'], where={'var_id': 0}))
+    assert [c.var_value.iloc[0] for c in chunks] == [0.1, 0.3, 0.5]
+
+
+def test_read_table_numeric_matches_pandas(dm):
+    dm.fit_var = pd.DataFrame({
+        'fit_var_value': [0.1, 0.2], 'residual_value': [np.nan, 1.0], 'residual_dage': [np.nan, np.nan],
+        'residual_dtime': [0.0, 0.0], 'lagrange_value': [0.0, 0.0], 'lagrange_dage': [0.0, 0.0],
+        'lagrange_dtime': [0.0, 0.0]
+    })
+    pd.testing.assert_frame_equal(
+        dm.read_table('fit_var'), pd.read_sql_table('fit_var', con=dm.engine), check_dtype=False
+    )
+    df = dm.read_table('fit_var')
+    assert df.fit_var_id.dtype == np.int64
+    assert df.residual_dage.dtype == np.float64
+
+
+def test_read_table_numeric_nullable_integer(samples):
+    dm = samples
+    dm.smooth_grid = pd.DataFrame({
+        'smooth_id': [0, 1], 'age_id': [0, 0], 'time_id': [0, 0], 'value_prior_id': [np.nan, 1],
+        'dage_prior_id': [np.nan, np.nan], 'dtime_prior_id': [np.nan, np.nan], 'const_value': [1.0, np.nan]
+    })
+    assert dm.read_table('smooth_grid').value_prior_id.dtype == np.float64
+    assert dm.read_table('smooth_grid', where={'smooth_id': 1}).value_prior_id.dtype == np.int64
+    empty = dm.read_table('sample', where={'sample_index': 9})
+    assert empty.empty
+    assert list(empty.columns) == ['sample_id', 'sample_index', 'var_id', 'var_value']
+
+
+def test_shared_engine_and_metadata(dm, dm_read):
+    assert dm.engine is dm_read.engine
+    assert dm._table_definitions['avgint'] is dm_read._table_definitions['avgint']
+
+
+def test_extra_columns_copy_on_write(dm, dm_read):
+    dm.covariate = pd.DataFrame({
+        'covariate_name': ['x_0'], 'reference': [0.0], 'max_difference': [np.nan], 'c_note': ['a']
+    })
+    assert 'c_note' in dm._table_definitions['covariate'].c
+    assert 'c_note' not in dm_read._table_definitions['covariate'].c
+    assert 'c_note' not in DismodIO(path=dm.path)._table_definitions['covariate'].c
+    assert dm_read.covariate.c_note.tolist() == ['a']
+
+
+def test_validation_per_layout(dm):
+    dm.age = pd.DataFrame({'age': [0.0, 1.0]})
+    with pytest.raises(DismodFileError):
+        dm.age = pd.DataFrame({'age': ['a', 'b']})
+    # A failing layout fails every time, not only the first.
+    with pytest.raises(DismodFileError):
+        dm.age = pd.DataFrame({'age': ['c']})
+    with pytest.raises(ValueError):
+        dm.time = pd.DataFrame({'time': [1990.0], 'year': [1990]})
+    dm.prior = pd.DataFrame({
+        'prior_name': ['a'], 'density_id': [0], 'lower': [None], 'upper': [None], 'mean': [0.0],
+        'std': [0.1], 'eta': [None], 'nu': [None]
+    })
+    assert dm.prior.lower.isnull().all()
+
+
+def test_validation_plan_shared(tmp_path):
+    covariate = pd.DataFrame({
+        'covariate_name': ['x_0'], 'reference': [0.0], 'max_difference': [np.nan], 'c_note': ['a']
+    })
+    first = DismodIO(path=tmp_path / 'first.db')
+    first.covariate = covariate
+    table = weakref.ref(first._table_definitions['covariate'])
+    hits = _validation_plan.cache_info().hits
+    # Another file with the same columns uses the same plan,
+    # and the plan doesn't keep the first file's table alive.
+    DismodIO(path=tmp_path / 'second.db').covariate = covariate
+    assert _validation_plan.cache_info().hits == hits + 1
+    del first
+    gc.collect()
+    assert table() is None
+
+
+def test_trusted_write(dm):
+    # Object dtype fails the check for a real column but writes fine.
+    dm.write_table('age', pd.DataFrame({'age': pd.Series([0.0], dtype=object)}), trusted=True)
+    with dm.trusted_writes():
+        dm.time = pd.DataFrame({'time': pd.Series([1990.0], dtype=object)})
+    assert dm.time.time.tolist() == [1990.0]
+    with pytest.raises(DismodFileError):
+        dm.time = pd.DataFrame({'time': pd.Series([1990.0], dtype=object)})
+
+
+def test_write_append(dm, dm_read):
+    dm.write_table('sample', pd.DataFrame({'sample_index': [0], 'var_id': [0], 'var_value': [0.1]}), mode='append')
+    dm.write_table('sample', pd.DataFrame({'sample_index': [1, 1], 'var_id': [0, 1], 'var_value': [0.3, 0.4]}),
+                   mode='append')
+    sample = dm_read.sample
+    assert sample.sample_id.tolist() == [0, 1, 2]
+    assert sample.var_value.tolist() == [0.1, 0.3, 0.4]
+
+
+def test_write_append_renumbers(dm, dm_read):
+    dm.write_table('sample', pd.DataFrame({'sample_index': [0], 'var_id': [0], 'var_value': [0.1]}), mode='append')
+    # Ids that would leave a gap or collide with a row already there are replaced.
+    dm.write_table('sample', pd.DataFrame({
+        'sample_id': [7, 0], 'sample_index': [1, 1], 'var_id': [0, 1], 'var_value': [0.3, 0.4]
+    }), mode='append')
+    dm.write_table('sample', pd.DataFrame({
+        'sample_id': [9], 'sample_index': [2], 'var_id': [0], 'var_value': [0.5]
+    }), mode='upsert')
+    sample = dm_read.sample
+    assert sample.sample_id.tolist() == [0, 1, 2, 3]
+    assert sample.var_value.tolist() == [0.1, 0.3, 0.4, 0.5]
+
+
+def test_write_upsert(samples, dm_read):
+    samples.write_table('sample', pd.DataFrame({
+        'sample_index': [1, 3], 'var_id': [1, 0], 'var_value': [0.4, 0.7]
+    }), mode='upsert', keys=['sample_index', 'var_id'])
+    sample = dm_read.sample
+    assert sample.sample_id.tolist() == list(range(7))
+    assert sample.var_value.tolist() == [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7]
+    samples.write_table('sample', pd.DataFrame({
+        'sample_id': [0], 'sample_index': [0], 'var_id': [0], 'var_value': [0.0]
+    }), mode='upsert')
+    assert dm_read.sample.var_value.iloc[0] == 0.0
+    with pytest.raises(ValueError):
+        samples.write_table('sample', dm_read.sample, mode='merge')
+
+
+def test_write_upsert_new_column(samples, dm_read):
+    samples.write_table('sample', pd.DataFrame({
+        'sample_index': [1, 3], 'var_id': [1, 0], 'var_value': [0.4, 0.7], 'c_note': ['refit', 'new']
+    }), mode='upsert', keys=['sample_index', 'var_id'])
+    sample = dm_read.sample
+    assert sample.var_value.tolist() == [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7]
+    assert sample.c_note.tolist() == [None] * 3 + ['refit', None, None, 'new']
+    # Updated rows are checked like new rows.
+    with pytest.raises(DismodFileError):
+        samples.write_table('sample', pd.DataFrame({
+            'sample_index': [0], 'var_id': [0], 'var_value': ['a']
+        }), mode='upsert', keys=['sample_index', 'var_id'])
+    with pytest.raises(ValueError):
+        samples.write_table('sample', pd.DataFrame({
+            'sample_index': [0], 'var_id': [0], 'note': ['a']
+        }), mode='upsert', keys=['sample_index', 'var_id'])
+    assert dm_read.sample.var_value.iloc[0] == 0.1
@@ -0,0 +1,124 @@
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+from cascade_at.dismod.api import DismodAPIError
+from cascade_at.dismod.api.executors import DirectoryQueueExecutor, ThreadExecutor, at_worker_exit, make_executor
+from cascade_at.dismod.api.executors import run_queue_worker
+
+
+@pytest.mark.parametrize("backend", ['process', 'thread', 'directory'])
+def test_executor_backends(backend):
+    with make_executor(backend, n_workers=2) as executor:
+        assert executor.map(abs, [-3, 2, -1]) == [3, 2, 1]
+        result = executor.apply_async(divmod, (7, 2))
+        assert result.get() == (3, 1)
+        assert result.ready()
+        with pytest.raises(ZeroDivisionError):
+            executor.apply_async(divmod, (7, 0)).get()
+
+
+def test_directory_queue_without_local_workers(tmp_path):
+    queue_dir = tmp_path / 'queue'
+    executor = DirectoryQueueExecutor(queue_dir, n_workers=0)
+    results = [executor.apply_async(abs, (-i,)) for i in range(3)]
+    assert not any(r.ready() for r in results)
+    # A worker that started elsewhere serves the queue until it closes.
+    worker = threading.Thread(target=run_queue_worker, args=(queue_dir, 0.01))
+    worker.start()
+    assert [r.get() for r in results] == [0, 1, 2]
+    executor.close()
+    worker.join()
+    assert not list((queue_dir / 'pending').iterdir())
+    assert not list((queue_dir / 'running').iterdir())
+
+
+def test_unknown_backend():
+    with pytest.raises(DismodAPIError):
+        make_executor('cluster', n_workers=2)
+
+
+def test_directory_queue_exit(tmp_path):
+    with DirectoryQueueExecutor(tmp_path / 'queue', n_workers=1, poll_interval=0.01) as executor:
+        # As run_dismod_commands does when dmdismod fails, which the worker survives.
+        with pytest.raises(DismodAPIError):
+            executor.apply_async(sys.exit, (1,)).get(timeout=30)
+        assert executor.apply_async(abs, (-2,)).get(timeout=30) == 2
+
+
+def test_directory_queue_dead_worker(tmp_path):
+    with DirectoryQueueExecutor(tmp_path / 'queue', n_workers=1, poll_interval=0.01) as executor:
+        with pytest.raises(DismodAPIError):
+            executor.apply_async(os._exit, (1,)).get(timeout=30)
+
+
+def test_directory_queue_timeout(tmp_path):
+    with DirectoryQueueExecutor(tmp_path / 'queue', n_workers=0) as executor:
+        with pytest.raises(multiprocessing.TimeoutError):
+            executor.apply_async(abs, (-1,)).get(timeout=0.2)
+
+
+def test_thread_executor_close_waits():
+    executor = ThreadExecutor(n_workers=1)
+    result = executor.apply_async(time.sleep, (0.3,))
+    executor.close()
+    assert result.ready()
+
+
+def test_directory_queue_reused(tmp_path):
+    queue_dir = tmp_path / 'queue'
+    with DirectoryQueueExecutor(queue_dir, n_workers=1, poll_interval=0.01) as executor:
+        assert executor.apply_async(abs, (-1,)).get(timeout=30) == 1
+    (queue_dir / 'pending' / 'stale').write_bytes(b'')
+    # The stop file and the tasks of the last run don't stop the next one.
+    with DirectoryQueueExecutor(queue_dir, n_workers=1, poll_interval=0.01) as executor:
+        assert not (queue_dir / 'pending' / 'stale').exists()
+        assert len(list((queue_dir / 'done').iterdir())) == 0
+        assert executor.apply_async(abs, (-2,)).get(timeout=30) == 2
+
+
+def test_directory_queue_heartbeat(tmp_path):
+    queue_dir = tmp_path / 'queue'
+    with DirectoryQueueExecutor(queue_dir, n_workers=0, heartbeat_timeout=0.5) as executor:
+        # Workers count as on another node, which the executor knows only by their heartbeat.
+        executor._host = 'elsewhere'
+        worker = threading.Thread(target=run_queue_worker, args=(queue_dir, 0.01, 0.05))
+        worker.start()
+        assert executor.apply_async(time.sleep, (1.5,)).get(timeout=30) is None
+        executor.close()
+        worker.join()
+
+        # A task that a worker took and then stopped beating for fails instead of waiting forever.
+        result = executor.apply_async(abs, (-1,))
+        pending = next((queue_dir / 'pending').iterdir())
+        pending.rename(queue_dir / 'running' / f"{pending.name}.faraway_1")
+        start = time.perf_counter()
+        with pytest.raises(DismodAPIError):
+            result.get(timeout=30)
+        assert time.perf_counter() - start < 5
+
+
+def _leave_marker(path):
+    """A task that has its worker make a file when it stops, once however many times it runs."""
+    at_worker_exit(str(path), lambda: path.write_text(path.read_text() + 'x' if path.exists() else 'x'))
+
+
+def test_at_worker_exit(tmp_path):
+    queue_dir = tmp_path / 'queue'
+    marker = tmp_path / 'marker'
+    executor = DirectoryQueueExecutor(queue_dir, n_workers=0)
+    worker = threading.Thread(target=run_queue_worker, args=(queue_dir, 0.01))
+    worker.start()
+    executor.map(_leave_marker, [marker, marker])
+    assert not marker.exists()
+    executor.close()
+    worker.join()
+    assert marker.read_text() == 'x'
+    # Outside of a queue worker, nothing is registered.
+    _leave_marker(tmp_path / 'other')
+    run_queue_worker(queue_dir, 0.01)
+    assert not (tmp_path / 'other').exists()
@@ -0,0 +1,278 @@
+import os
+import stat
+import time
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from cascade_at.dismod.api import DismodAPIError, multithreading
+from cascade_at.dismod.api.dismod_io import DismodIO
+from cascade_at.dismod.api.multithreading import _DismodThread, _batches, merge_worker_tables
+from cascade_at.dismod.api.multithreading import dmdismod_in_parallel, dmdismod_in_parallel_streaming
+from cascade_at.dismod.api.run_dismod import DismodTimeoutError, run_dismod
+
+
+def test_merge_worker_tables(tmp_path):
+    main_db = tmp_path / 'main.db'
+    pattern = str(tmp_path / 'main_{index}.db')
+    DismodIO(path=main_db).write_table('predict', pd.DataFrame({
+        'sample_index': [0], 'avgint_id': [0], 'avg_integrand': [9.0]
+    }))
+    for index in range(3):
+        DismodIO(path=pattern.format(index=index)).write_table('predict', pd.DataFrame({
+            'sample_index': [0, 0], 'avgint_id': [0, 1], 'avg_integrand': [index + 0.1, index + 0.2]
+        }))
+    merge_worker_tables(
+        main_db=main_db, index_file_pattern=pattern, indices=range(3),
+        source_table='predict', target_table='predict',
+        columns={'predict_id': '{offset} + predict_id', 'sample_index': '{index}',
+                 'avgint_id': 'avgint_id', 'avg_integrand': 'avg_integrand'}
+    )
+    predict = DismodIO(path=main_db).predict
+    assert predict.predict_id.tolist() == list(range(6))
+    assert predict.sample_index.tolist() == [0, 0, 1, 1, 2, 2]
+    assert predict.avgint_id.tolist() == [0, 1] * 3
+    assert predict.avg_integrand.tolist() == [0.1, 0.2, 1.1, 1.2, 2.1, 2.2]
+
+
+class _SampleCounter(_DismodThread):
+    """Predicts the number of rows in the sample table, then clobbers it."""
+    reset_tables = ['sample']
+    result_tables = ['predict']
+
+    def _process(self, db):
+        dm = DismodIO(path=db)
+        n_sample = len(dm.sample)
+        dm.write_table('predict', pd.DataFrame({
+            'sample_index': [0], 'avgint_id': [0], 'avg_integrand': [float(self.index + n_sample)]
+        }))
+        dm.sample = dm.sample.iloc[:1]
+        return db
+
+
+def test_run_batch(tmp_path, monkeypatch):
+    monkeypatch.setattr(multithreading, 'run_dismod', lambda *args: None)
+    main_db = tmp_path / 'main.db'
+    pattern = str(tmp_path / 'main_{index}.db')
+    DismodIO(path=main_db).sample = pd.DataFrame({
+        'sample_index': [0, 0, 1, 1], 'var_id': [0, 1, 0, 1], 'var_value': [0.1, 0.2, 0.3, 0.4]
+    })
+    results = _SampleCounter(main_db=main_db, index_file_pattern=pattern).run_batch([3, 4, 5])
+    assert results == [pattern.format(index=i) for i in [3, 4, 5]]
+    assert not (tmp_path / 'main_worker_3.db').exists()
+    merge_worker_tables(
+        main_db=main_db, index_file_pattern=pattern, indices=[3, 4, 5],
+        source_table='predict', target_table='predict',
+        columns={'predict_id': '{offset} + predict_id', 'sample_index': '{index}',
+                 'avgint_id': 'avgint_id', 'avg_integrand': 'avg_integrand'}
+    )
+    assert DismodIO(path=main_db).predict.avg_integrand.tolist() == [7.0, 8.0, 9.0]
+
+
+def test_batches():
+    assert _batches(list(range(7)), 3) == [[0, 1, 2], [3, 4], [5, 6]]
+    assert _batches([0], 4) == [[0]]
+
+
+class _Square(_DismodThread):
+    """Squares the index without copying anything, and fails for 3."""
+    def __call__(self, index):
+        if index == 3:
+            raise RuntimeError("fit failed")
+        return index ** 2
+
+
+def test_dmdismod_in_parallel_streaming():
+    results = dict()
+    summary = dmdismod_in_parallel_streaming(
+        dm_thread=_Square(main_db='main.db', index_file_pattern='main_{index}.db'),
+        sims=list(range(6)), n_pool=2, sink=results.__setitem__, raise_on_failure=False
+    )
+    assert results == {0: 0, 1: 1, 2: 4, 4: 16, 5: 25}
+    assert summary.failed == [3]
+    assert len(summary.tasks) == 6
+    assert all(t.seconds >= 0 for t in summary.tasks)
+    with pytest.raises(DismodAPIError):
+        dmdismod_in_parallel_streaming(
+            dm_thread=_Square(main_db='main.db', index_file_pattern='main_{index}.db'),
+            sims=[2, 3], n_pool=2, ordered=True
+        )
+
+
+class _Straggler(_DismodThread):
+    """Index 2 is slow on its first attempt, and index 1 times out."""
+    def __call__(self, index):
+        if index == 1:
+            raise DismodTimeoutError("fit took too long")
+        if index == 2 and self.attempt == 0:
+            time.sleep(10)
+        else:
+            time.sleep(0.05)
+        return (index, self.attempt)
+
+
+def test_streaming_stragglers():
+    results = dict()
+    start = time.perf_counter()
+    summary = dmdismod_in_parallel_streaming(
+        dm_thread=_Straggler(main_db='main.db', index_file_pattern='main_{index}.db'),
+        sims=list(range(6)), n_pool=2, sink=results.__setitem__, ordered=True,
+        straggler_factor=3, raise_on_failure=False, poll_interval=0.01
+    )
+    assert time.perf_counter() - start < 5
+    assert summary.relaunched == [2]
+    assert summary.timed_out == [1]
+    assert results[2] == (2, 1)
+    assert list(results) == [0, 2, 3, 4, 5]
+
+
+def test_streaming_accept():
+    results = dict()
+    thread = _Straggler(main_db='main.db', index_file_pattern='main_{index}.db')
+    summary = dmdismod_in_parallel_streaming(
+        dm_thread=thread, sims=[0, 2, 3, 4], n_pool=2, sink=results.__setitem__, n_accept=3,
+        timeout=60, poll_interval=0.01
+    )
+    # The timeout goes to the tasks and not to the caller's thread.
+    assert thread.timeout is None
+    assert summary.skipped == [2]
+    assert sorted(results) == [0, 3, 4]
+
+
+@pytest.fixture
+def sleepy_dmdismod(tmp_path, monkeypatch):
+    """A dmdismod on the path that sleeps for as many seconds as its command and then writes its file."""
+    executable = tmp_path / 'dmdismod'
+    executable.write_text('#!/bin/sh\nsleep "$2"\necho done > "$1"\n')
+    executable.chmod(executable.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv('PATH', f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+    return executable
+
+
+class _Sleeper(_DismodThread):
+    """Runs dmdismod on the index database, for three seconds for index 2 on its first attempt."""
+    def __call__(self, index):
+        name = f'{index}_attempt{self.attempt}' if self.attempt else index
+        index_db = self.index_file_pattern.format(index=name)
+        run_dismod(index_db, '3' if index == 2 and not self.attempt else '0.1', track_process=True)
+        return index_db
+
+
+@pytest.mark.parametrize("policy", [dict(straggler_factor=3), dict(n_accept=2)])
+def test_streaming_kills_abandoned(sleepy_dmdismod, tmp_path, policy):
+    results = dict()
+    pattern = str(tmp_path / 'main_{index}.db')
+    start = time.perf_counter()
+    dmdismod_in_parallel_streaming(
+        dm_thread=_Sleeper(main_db=tmp_path / 'main.db', index_file_pattern=pattern),
+        sims=[0, 1, 2], n_pool=2, sink=results.__setitem__, poll_interval=0.01, **policy
+    )
+    assert time.perf_counter() - start < 2.5
+    # The abandoned dmdismod was killed, so it never writes its file.
+    time.sleep(start + 3.5 - time.perf_counter())
+    assert not os.path.exists(pattern.format(index=2))
+    assert not list(tmp_path.glob('*.pid'))
+    if 'straggler_factor' in policy:
+        assert results[2] == pattern.format(index='2_attempt1')
+        assert os.path.exists(results[2])
+    else:
+        assert sorted(results) == [0, 1]
+
+
+class _Exit(_DismodThread):
+    """Kills the worker for index 1, as when a node goes away."""
+    def __call__(self, index):
+        if index == 1:
+            os._exit(1)
+        return index
+
+
+def test_streaming_dead_worker(tmp_path):
+    results = dict()
+    summary = dmdismod_in_parallel_streaming(
+        dm_thread=_Exit(main_db='main.db', index_file_pattern='main_{index}.db'),
+        sims=[0, 1, 2], n_pool=2, sink=results.__setitem__, raise_on_failure=False, poll_interval=0.01,
+        backend='directory', queue_dir=tmp_path / 'queue'
+    )
+    assert summary.failed == [1]
+    assert results == {0: 0, 2: 2}
+
+
+class _Index(_DismodThread):
+    """Returns the index it was called with, after a pause that lets threads overlap."""
+    def __call__(self, index):
+        self.index = index
+        time.sleep(0.01)
+        return self.index
+
+    def run_batch(self, indices):
+        return [self(index) for index in indices]
+
+
+@pytest.mark.parametrize("persistent", [False, True])
+def test_dmdismod_in_parallel_threads(persistent):
+    results = dmdismod_in_parallel(
+        dm_thread=_Index(main_db='main.db', index_file_pattern='main_{index}.db'),
+        sims=list(range(20)), n_pool=4, persistent=persistent, backend='thread'
+    )
+    assert results == list(range(20))
+
+
+@pytest.mark.parametrize("persistent", [False, True])
+def test_scratch_dir(tmp_path, monkeypatch, persistent):
+    monkeypatch.setattr(multithreading, 'run_dismod', lambda *args: None)
+    main_db = tmp_path / 'main.db'
+    pattern = str(tmp_path / 'main_{index}.db')
+    scratch_dir = tmp_path / 'scratch'
+    DismodIO(path=main_db).sample = pd.DataFrame({
+        'sample_index': [0, 0, 1, 1], 'var_id': [0, 1, 0, 1], 'var_value': [0.1, 0.2, 0.3, 0.4]
+    })
+    thread = _SampleCounter(main_db=main_db, index_file_pattern=pattern, scratch_dir=scratch_dir)
+    if persistent:
+        results = thread.run_batch([3, 4])
+    else:
+        results = [thread(3), thread(4)]
+    assert results == [pattern.format(index=i) for i in [3, 4]]
+    # Only the staged database is left in scratch, and only results next to the main database.
+    assert [p.name for p in scratch_dir.glob('*/*.db')] == ['main.db']
+    assert sorted(p.name for p in tmp_path.glob('*.db')) == ['main.db', 'main_3.db', 'main_4.db']
+    assert DismodIO(path=pattern.format(index=4)).predict.avg_integrand.tolist() == [8.0]
+    thread.cleanup_scratch()
+    assert not list(scratch_dir.iterdir())
+
+
+def test_scratch_dir_failure(tmp_path, monkeypatch):
+    monkeypatch.setattr(multithreading, 'run_dismod', lambda *args: None)
+    main_db = tmp_path / 'main.db'
+    DismodIO(path=main_db).age = pd.DataFrame({'age': [0.0]})
+    thread = _SampleCounter(main_db=main_db, index_file_pattern=str(tmp_path / 'main_{index}.db'),
+                            scratch_dir=tmp_path / 'scratch')
+    with pytest.raises(Exception):
+        thread(0)
+    assert [p.name for p in (tmp_path / 'scratch').glob('*/*.db')] == ['main.db']
+    assert not (tmp_path / 'main_0.db').exists()
+
+
+def test_scratch_dir_full(tmp_path, monkeypatch):
+    monkeypatch.setattr(multithreading, 'run_dismod', lambda *args: None)
+    monkeypatch.setattr(multithreading.shutil, 'disk_usage', lambda path: SimpleNamespace(free=0))
+    main_db = tmp_path / 'main.db'
+    pattern = str(tmp_path / 'main_{index}.db')
+    DismodIO(path=main_db).sample = pd.DataFrame({'sample_index': [0], 'var_id': [0], 'var_value': [0.1]})
+    thread = _SampleCounter(main_db=main_db, index_file_pattern=pattern, scratch_dir=tmp_path / 'scratch')
+    assert thread(0) == pattern.format(index=0)
+    assert not list((tmp_path / 'scratch').glob('*/*.db'))
+
+
+def test_scratch_dir_room_for_copies(tmp_path, monkeypatch):
+    main_db = tmp_path / 'main.db'
+    pattern = str(tmp_path / 'main_{index}.db')
+    DismodIO(path=main_db).sample = pd.DataFrame({'sample_index': [0], 'var_id': [0], 'var_value': [0.1]})
+    thread = _SampleCounter(main_db=main_db, index_file_pattern=pattern, scratch_dir=tmp_path / 'scratch')
+    staged = thread._staged_db()
+    # Room for one more copy, but not for two at once.
+    free = SimpleNamespace(free=int(1.5 * staged.stat().st_size))
+    monkeypatch.setattr(multithreading.shutil, 'disk_usage', lambda path: free)
+    assert thread._work_db(pattern.format(index=0)) == staged.parent / 'main_0.db'
+    assert thread._work_db(pattern.format(index=1)) == pattern.format(index=1)
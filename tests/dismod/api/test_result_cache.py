@@ -0,0 +1,111 @@
+import os
+import stat
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cascade_at.dismod.api.dismod_io import DismodIO
+from cascade_at.dismod.api.result_cache import cache_key, output_tables, prune_cache, restore_results, save_results
+from cascade_at.dismod.api.run_dismod import run_dismod_commands
+
+FAKE_DMDISMOD = """#!{python}
+import sqlite3
+import sys
+from pathlib import Path
+
+dm_file, command = sys.argv[1], ' '.join(sys.argv[2:])
+runs = Path(dm_file).parent / 'runs'
+runs.write_text(str(int(runs.read_text()) + 1 if runs.exists() else 1))
+connection = sqlite3.connect(dm_file)
+n_data = connection.execute('SELECT COUNT(*) FROM data').fetchone()[0]
+connection.execute('DROP TABLE IF EXISTS fit_var')
+connection.execute('CREATE TABLE fit_var (fit_var_id integer primary key, fit_var_value real)')
+connection.execute('INSERT INTO fit_var VALUES (0, ?)', (float(n_data),))
+connection.execute('DROP TABLE IF EXISTS fit_data_subset')
+connection.execute('CREATE TABLE fit_data_subset (fit_data_subset_id integer primary key, avg_integrand real)')
+connection.execute("INSERT INTO log (message_type, unix_time, message) VALUES ('command', 0, ?)", (f'end {{command}}',))
+connection.commit()
+"""
+
+
+@pytest.fixture
+def dmdismod(tmp_path, monkeypatch):
+    """A dmdismod on the path that fits the number of data and counts its runs."""
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    executable = bin_dir / 'dmdismod'
+    executable.write_text(FAKE_DMDISMOD.format(python=sys.executable))
+    executable.chmod(executable.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv('PATH', f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    return executable
+
+
+@pytest.fixture
+def dm(tmp_path):
+    dm = DismodIO(path=tmp_path / 'dismod.db')
+    dm.age = pd.DataFrame({'age': [0.0, 1.0]})
+    dm.data = pd.DataFrame({
+        'data_name': ['a', 'b'], 'integrand_id': 0, 'density_id': 0, 'node_id': 0, 'subgroup_id': 0,
+        'weight_id': 0, 'hold_out': 0, 'meas_value': [0.1, 0.2], 'meas_std': 0.1, 'eta': np.nan,
+        'nu': np.nan, 'age_lower': 0.0, 'age_upper': 1.0, 'time_lower': 2000.0, 'time_upper': 2000.0
+    })
+    dm.create_tables([dm._table_definitions['log']])
+    return dm
+
+
+def runs(tmp_path):
+    return int((tmp_path / 'runs').read_text())
+
+
+def test_output_tables():
+    assert output_tables('fit both') == ['fit_var', 'fit_data_subset']
+    assert output_tables('predict fit_var') == ['predict']
+    assert output_tables('sample simulate fit_var 10') == ['sample']
+    assert output_tables('sample asymptotic both 10') == ['sample', 'hes_fixed', 'hes_random']
+    assert output_tables('init') is None
+
+
+def test_cache_key(dm):
+    key = cache_key(dm.path, 'fit both')
+    assert key == cache_key(dm.path, 'fit  both')
+    assert key != cache_key(dm.path, 'fit fixed')
+    assert cache_key(dm.path, 'init') is None
+    dm.age = pd.DataFrame({'age': [0.0, 2.0]})
+    assert key != cache_key(dm.path, 'fit both')
+
+
+def test_cached_fit(dmdismod, dm, tmp_path):
+    cache_dir = tmp_path / 'cache'
+    processes = run_dismod_commands(dm.path, ['fit both'], cache_dir=cache_dir)
+    assert not processes['fit both'].cached
+    assert runs(tmp_path) == 1
+    dm.write_table('fit_var', pd.DataFrame({'fit_var_value': [-1.0]}))
+
+    processes = run_dismod_commands(dm.path, ['fit both'], cache_dir=cache_dir)
+    assert processes['fit both'].cached
+    assert runs(tmp_path) == 1
+    assert dm.read_table('fit_var').fit_var_value.tolist() == [2.0]
+    assert dm.log.message.iloc[-1] == 'end fit both'
+
+    # A change in the inputs runs the fit again.
+    dm.data = dm.data.iloc[:1].drop(columns='data_id')
+    run_dismod_commands(dm.path, ['fit both'], cache_dir=cache_dir)
+    assert runs(tmp_path) == 2
+    assert dm.read_table('fit_var').fit_var_value.tolist() == [1.0]
+    assert len(list(cache_dir.iterdir())) == 2
+
+
+def test_prune_cache(dm, tmp_path):
+    cache_dir = tmp_path / 'cache'
+    dm.write_table('fit_var', pd.DataFrame({'fit_var_value': np.arange(1000.0)}))
+    entries = [save_results(cache_dir, key, dm.path, 'fit both', max_bytes=None) for key in 'abc']
+    for age, entry in zip([300, 200, 100], entries):
+        os.utime(entry, (entries[0].stat().st_atime - age, entries[0].stat().st_mtime - age))
+    # Restoring an entry marks it as used.
+    assert restore_results(cache_dir, 'a', dm.path, 'fit both')
+    size = entries[0].stat().st_size
+    assert prune_cache(cache_dir, max_bytes=2 * size) == [entries[1]]
+    assert prune_cache(cache_dir, max_bytes=None, max_age_seconds=50) == [entries[2]]
+    assert [p.name for p in cache_dir.iterdir()] == ['a.db']
@@ -0,0 +1,122 @@
+import os
+import stat
+import sys
+import time
+from multiprocessing.pool import ThreadPool
+
+import pytest
+
+from cascade_at.dismod.api.run_dismod import DismodTimeoutError, run_dismod_concurrently
+from cascade_at.dismod.api.run_dismod import kill_dismod, process_file, read_resources, resource_file
+from cascade_at.dismod.api.run_dismod import run_dismod, run_dismod_commands
+
+FAKE_DMDISMOD = """#!{python}
+import sys
+import time
+
+dm_file, command = sys.argv[1], sys.argv[2]
+if command == 'hang':
+    time.sleep(30)
+if command == 'allocate':
+    megabytes = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+    block = bytearray(megabytes * 2 ** 20)
+    sum(range(10 ** 6))
+    sys.exit(0)
+if command == 'fail':
+    print('dismod_at error: no such command', file=sys.stderr)
+    sys.exit(1)
+print('iter    objective    inf_pr   inf_du lg(mu)  ||d||  lg(rg) alpha_du alpha_pr  ls', flush=True)
+for i in range(3):
+    time.sleep(0.2)
+    print(f'{{i:4d}} {{10.0 - i:.7e}} 0.00e+00 1.00e-0{{i}}  -1.0 0.00e+00    -  0.00e+00 0.00e+00   0', flush=True)
+print('EXIT: Optimal Solution Found.', flush=True)
+"""
+
+
+@pytest.fixture
+def dmdismod(tmp_path, monkeypatch):
+    """A dmdismod on the path that prints Ipopt iterations slowly."""
+    executable = tmp_path / 'dmdismod'
+    executable.write_text(FAKE_DMDISMOD.format(python=sys.executable))
+    executable.chmod(executable.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv('PATH', f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+    return executable
+
+
+def test_run_dismod_concurrently(dmdismod):
+    updates = []
+    start = time.perf_counter()
+    results = run_dismod_concurrently(
+        {'a.db': ['fit fixed'], 'b.db': ['fit fixed', 'fail', 'fit both']},
+        on_progress=lambda p: updates.append((p.dm_file, p.iteration, p.objective, p.done))
+    )
+    # The two files ran at the same time.
+    assert time.perf_counter() - start < 1.1
+    assert list(results['b.db']) == ['fit fixed', 'fail']
+    assert results['b.db']['fail'].exit_status == 1
+    assert 'no such command' in results['b.db']['fail'].stderr
+    fit = results['a.db']['fit fixed']
+    assert fit.exit_status == 0
+    assert fit.progress.iteration == 2
+    assert fit.progress.objective == 8.0
+    assert fit.progress.ipopt_exit == 'Optimal Solution Found.'
+    assert fit.stdout.splitlines()[-1] == 'EXIT: Optimal Solution Found.'
+    # Progress arrived while the fits ran, not only at the end.
+    a_updates = [u for u in updates if u[0] == 'a.db']
+    assert [u[1] for u in a_updates if u[1] is not None][:3] == [0, 1, 2]
+    assert not a_updates[0][3] and a_updates[-1][3]
+
+
+def test_run_dismod_concurrently_timeout(dmdismod):
+    start = time.perf_counter()
+    with pytest.raises(DismodTimeoutError):
+        run_dismod_concurrently({'a.db': ['hang'], 'b.db': ['fit fixed']}, timeout=1)
+    assert time.perf_counter() - start < 5
+
+
+def test_run_dismod_resources(dmdismod, tmp_path):
+    dm_file = tmp_path / 'dismod.db'
+    assert read_resources(dm_file).empty
+    processes = run_dismod_commands(dm_file, ['allocate', 'fail'], sys_exit=False, record_resources=True)
+    info = processes['allocate']
+    assert info.max_rss_bytes > 100 * 2 ** 20
+    assert info.user_seconds > 0
+    assert info.system_seconds >= 0
+    resources = read_resources(dm_file)
+    assert resources.command.tolist() == ['allocate', 'fail']
+    assert resources.exit_status.tolist() == [0, 1]
+    assert resources.max_rss_bytes.iloc[0] == info.max_rss_bytes
+    assert not resource_file(tmp_path / 'other.db').exists()
+
+
+def test_run_dismod_resources_in_threads(dmdismod, tmp_path):
+    # Each command gets the resources of its own process, even when they run at the same time.
+    with ThreadPool(2) as pool:
+        allocate, fit = pool.starmap(run_dismod, [(tmp_path / 'a.db', 'allocate 500'), (tmp_path / 'b.db', 'fit')])
+    assert allocate.max_rss_bytes > 500 * 2 ** 20
+    assert fit.max_rss_bytes < 500 * 2 ** 20
+    assert fit.stdout.splitlines()[-1] == 'EXIT: Optimal Solution Found.'
+
+
+def test_run_dismod_timeout(dmdismod, tmp_path):
+    start = time.perf_counter()
+    with pytest.raises(DismodTimeoutError):
+        run_dismod(tmp_path / 'a.db', 'hang', timeout=1)
+    assert time.perf_counter() - start < 5
+
+
+@pytest.mark.parametrize("track_process", [False, True])
+def test_run_dismod_track_process(dmdismod, tmp_path, track_process):
+    dm_file = tmp_path / 'a.db'
+    with ThreadPool(1) as pool:
+        result = pool.apply_async(run_dismod, (dm_file, 'hang'), dict(timeout=5, track_process=track_process))
+        time.sleep(0.5)
+        # Only a tracked command leaves a sidecar that kill_dismod can use, and only while it runs.
+        assert process_file(dm_file).exists() == track_process
+        assert kill_dismod(dm_file) == track_process
+        if track_process:
+            assert result.get().exit_status == -9
+        else:
+            with pytest.raises(DismodTimeoutError):
+                result.get()
+    assert not process_file(dm_file).exists()
@@ -0,0 +1,53 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from cascade_at.dismod.api.dismod_io import DismodIO
+from cascade_at.dismod.api.slim_clone import command_tables, slim_clone
+
+
+@pytest.fixture
+def main_db(tmp_path):
+    path = tmp_path / 'main.db'
+    dm = DismodIO(path=path)
+    dm.age = pd.DataFrame({'age': [0.0, 1.0]})
+    dm.option = pd.DataFrame({'option_name': ['parent_node_id'], 'option_value': ['0']})
+    dm.sample = pd.DataFrame({
+        'sample_index': [0, 0, 1, 1], 'var_id': [0, 1, 0, 1], 'var_value': [0.1, 0.2, 0.3, 0.4]
+    })
+    dm.write_table('data_sim', pd.DataFrame({'simulate_index': [0], 'data_subset_id': [0], 'data_sim_value': [1.0]}))
+    dm.write_table('log', pd.DataFrame({
+        'message_type': ['command'], 'table_name': [None], 'row_id': [None],
+        'unix_time': [0], 'message': ['init']
+    }))
+    return path
+
+
+def test_command_tables():
+    assert 'sample' in command_tables('predict sample')
+    assert 'data_sim' not in command_tables('predict sample')
+    assert 'data_sim' in command_tables('fit both 3')
+    assert 'data_sim' not in command_tables('fit both')
+    assert 'fit_var' in command_tables('set start_var fit_var')
+    assert command_tables('db2csv') is None
+
+
+def test_slim_clone(main_db, tmp_path):
+    clone = tmp_path / 'clone.db'
+    copied = slim_clone(main_db, clone, 'predict sample', where={'sample': 'sample_index = 1'})
+    assert set(copied) == {'age', 'option', 'sample'}
+    dm = DismodIO(path=clone)
+    assert dm.sample.var_value.tolist() == [0.3, 0.4]
+    assert dm.log.empty
+    tables = [r[0] for r in sqlite3.connect(str(clone)).execute("SELECT name FROM sqlite_master WHERE type='table'")]
+    assert 'data_sim' not in tables
+    # Definitions are copied exactly, because DisMod-AT checks column types.
+    definitions = "SELECT sql FROM sqlite_master WHERE name = 'sample'"
+    assert (sqlite3.connect(str(clone)).execute(definitions).fetchall() ==
+            sqlite3.connect(str(main_db)).execute(definitions).fetchall())
+
+
+def test_slim_clone_unknown_command(main_db, tmp_path):
+    copied = slim_clone(main_db, tmp_path / 'clone.db', 'db2csv')
+    assert 'data_sim' in copied
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cascade_at.dismod.api import DismodAPIError
+from cascade_at.dismod.api.dismod_io import DismodIO
+from cascade_at.dismod.api.warm_start import VAR_KEY, describe_vars, fit_values, warm_start
+
+
+def make_db(path, ages, fit=None):
+    """A database after init with iota on an age grid, one constant at the last age, and a covariate multiplier."""
+    dm = DismodIO(path=path)
+    n_age = len(ages)
+    dm.write_table('age', pd.DataFrame({'age_id': range(n_age), 'age': ages}))
+    dm.write_table('time', pd.DataFrame({'time_id': [0], 'time': [2000.0]}))
+    dm.write_table('node', pd.DataFrame({'node_id': [0], 'node_name': ['1'], 'parent': [np.nan], 'c_location_id': [1]}))
+    dm.write_table('rate', pd.DataFrame({
+        'rate_id': [0, 1], 'rate_name': ['pini', 'iota'], 'parent_smooth_id': [np.nan, 0],
+        'child_smooth_id': np.nan, 'child_nslist_id': np.nan
+    }))
+    dm.write_table('integrand', pd.DataFrame({
+        'integrand_id': [0], 'integrand_name': ['prevalence'], 'minimum_meas_cv': [0.0]
+    }))
+    dm.write_table('covariate', pd.DataFrame({
+        'covariate_id': [0], 'covariate_name': ['x_0'], 'reference': [0.0], 'max_difference': [np.nan]
+    }))
+    dm.write_table('prior', pd.DataFrame({
+        'prior_id': [0, 1], 'prior_name': ['rate', 'alpha'], 'density_id': 0,
+        'lower': [1e-6, -1.0], 'upper': [1.0, 1.0], 'mean': [0.1, 0.0], 'std': np.nan, 'eta': np.nan, 'nu': np.nan
+    }))
+    const = [np.nan] * (n_age - 1) + [0.5]
+    dm.write_table('smooth_grid', pd.DataFrame({
+        'smooth_grid_id': range(n_age + 1), 'smooth_id': [0] * n_age + [1], 'age_id': list(range(n_age)) + [0],
+        'time_id': 0, 'value_prior_id': [0] * n_age + [1], 'dage_prior_id': np.nan, 'dtime_prior_id': np.nan,
+        'const_value': const + [np.nan]
+    }))
+    dm.write_table('var', pd.DataFrame({
+        'var_id': range(n_age + 1), 'var_type': ['rate'] * n_age + ['mulcov_rate_value'],
+        'smooth_id': [0] * n_age + [1], 'age_id': list(range(n_age)) + [0], 'time_id': 0,
+        'node_id': [0] * n_age + [np.nan], 'rate_id': 1, 'integrand_id': np.nan,
+        'covariate_id': [np.nan] * n_age + [0], 'mulcov_id': [np.nan] * n_age + [0]
+    }))
+    dm.write_table('start_var', pd.DataFrame({'start_var_id': range(n_age + 1), 'start_var_value': 0.1}))
+    dm.write_table('scale_var', pd.DataFrame({'scale_var_id': range(n_age + 1), 'scale_var_value': 0.1}))
+    if fit is not None:
+        dm.write_table('fit_var', pd.DataFrame({
+            'fit_var_id': range(n_age + 1), 'fit_var_value': fit, 'residual_value': np.nan,
+            'residual_dage': np.nan, 'residual_dtime': np.nan, 'lagrange_value': 0.0,
+            'lagrange_dage': 0.0, 'lagrange_dtime': 0.0
+        }))
+    return dm
+
+
+def test_describe_vars(tmp_path):
+    dm = make_db(tmp_path / 'a.db', ages=[0.0, 1.0 / 3, 50.0])
+    df = describe_vars(dm)
+    assert df.location.tolist() == ['1', '1', '1', '']
+    assert df.rate_name.tolist() == ['iota'] * 4
+    assert df.covariate_name.tolist() == [''] * 3 + ['x_0']
+    assert df.age.tolist()[:3] == [0.0, 0.333333, 50.0]
+
+
+def test_warm_start_from_previous_fit(tmp_path):
+    previous = make_db(tmp_path / 'previous.db', ages=[0.0, 1.0 / 3, 50.0], fit=[0.2, 2.0, 0.5, 0.3])
+    # The new grid has one age the previous fit didn't have, and ids in another order.
+    dm = make_db(tmp_path / 'new.db', ages=[0.0, 10.0, 1.0 / 3, 50.0])
+
+    values = fit_values(previous.path)
+    assert list(values.columns) == VAR_KEY + ['value']
+    assert warm_start(dm.path, values) == 3
+
+    start = dm.start_var.start_var_value.tolist()
+    # Age 1/3 is clipped to the upper limit of its prior, age 10 keeps its start,
+    # and the constant at age 50 isn't changed.
+    assert start == [0.2, 0.1, 1.0, 0.1, 0.3]
+    assert dm.scale_var.scale_var_value.tolist() == start
+
+
+def test_warm_start_keeps_scale_for_zero(tmp_path):
+    previous = make_db(tmp_path / 'previous.db', ages=[0.0, 50.0], fit=[0.2, 0.5, 0.0])
+    dm = make_db(tmp_path / 'new.db', ages=[0.0, 50.0])
+    assert warm_start(dm.path, fit_values(previous.path)) == 2
+    assert dm.start_var.start_var_value.tolist() == [0.2, 0.1, 0.0]
+    # The covariate multiplier starts at zero but keeps the scale from init.
+    assert dm.scale_var.scale_var_value.tolist() == [0.2, 0.1, 0.1]
+
+
+def test_warm_start_needs_init(tmp_path):
+    dm = DismodIO(path=tmp_path / 'empty.db')
+    dm.create_tables([dm._table_definitions['var']])
+    with pytest.raises(DismodAPIError):
+        warm_start(dm.path, pd.DataFrame(columns=VAR_KEY + ['value']))
@@ -1,6 +1,7 @@
 import pandas as pd
 import pytest
 from cascade_at.dismod.process.process_behavior import check_command, get_fit_output
+from cascade_at.dismod.process.process_behavior import get_ipopt_iteration, get_ipopt_exit
 from cascade_at.dismod import DismodATException
 
 
@@ -64,3 +65,15 @@ def test_pulls_iterations():
     assert kind == "perfect"
     assert message == "Optimal Solution Found."
     assert iterations == 81
+
+
+def test_ipopt_iteration_lines():
+    lines = STDOUT.splitlines()
+    assert get_ipopt_iteration(lines[1]) == dict(
+        iteration=81, restoration=False, objective=-2.4294118e-02, inf_pr=0.0, inf_du=7.51e-09
+    )
+    assert get_ipopt_iteration("  12r 1.0000000e+01 2.00e-01 3.00e+00  -1.0 0.00e+00    -  0.00e+00 0.00e+00   0")[
+        "restoration"]
+    assert get_ipopt_iteration("iter    objective    inf_pr   inf_du lg(mu)") is None
+    assert all(get_ipopt_iteration(line) is None for line in lines[2:])
+    assert [get_ipopt_exit(line) for line in lines if get_ipopt_exit(line)] == ["Optimal Solution Found."]
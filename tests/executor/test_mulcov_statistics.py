@@ -2,7 +2,8 @@ import pytest
 import pandas as pd
 import numpy as np
 
-from cascade_at.executor.mulcov_statistics import compute_statistics
+from cascade_at.dismod.api.dismod_io import DismodIO
+from cascade_at.executor.mulcov_statistics import compute_statistics, get_mulcovs
 
 
 @pytest.fixture
@@ -27,3 +28,36 @@ def test_compute_statistics(mulcov_df):
     assert all(stat['std'].to_numpy() == np.zeros(3))
     assert all(stat['quantile_0.025'].to_numpy() == mulcov_df.mulcov_value.to_numpy())
     assert all(stat['quantile_0.975'].to_numpy() == mulcov_df.mulcov_value.to_numpy())
+
+
+@pytest.fixture
+def mulcov_db(tmp_path):
+    db = DismodIO(path=tmp_path / 'dismod.db')
+    db.covariate = pd.DataFrame({
+        'covariate_name': ['x_0', 'x_1'], 'c_covariate_name': ['s_sex', 'c_ldi'],
+        'reference': 0., 'max_difference': np.nan
+    })
+    db.integrand = pd.DataFrame({'integrand_name': ['Sincidence'], 'minimum_meas_cv': 0.})
+    db.rate = pd.DataFrame({
+        'rate_name': ['iota'], 'parent_smooth_id': 0, 'child_smooth_id': np.nan, 'child_nslist_id': np.nan
+    })
+    db.mulcov = pd.DataFrame({
+        'mulcov_type': ['rate_value'], 'rate_id': 0, 'integrand_id': np.nan, 'covariate_id': 0,
+        'group_smooth_id': 0, 'group_id': 0, 'subgroup_smooth_id': np.nan
+    })
+    db.write_table('var', pd.DataFrame({
+        'var_type': ['rate', 'mulcov_rate_value'], 'smooth_id': 0, 'age_id': 0, 'time_id': 0,
+        'node_id': [0, np.nan], 'rate_id': 0, 'integrand_id': np.nan, 'covariate_id': [np.nan, 0],
+        'mulcov_id': [np.nan, 0]
+    }))
+    db.sample = pd.DataFrame({
+        'sample_index': [0, 0, 1, 1], 'var_id': [0, 1, 0, 1], 'var_value': [0.1, 0.2, 0.3, 0.4]
+    })
+    return db
+
+
+def test_get_mulcovs(mulcov_db):
+    df = get_mulcovs(dbs=[mulcov_db], covs=['s_sex'], table='sample')
+    assert df.mulcov_value.tolist() == [0.2, 0.4]
+    assert (df.c_covariate_name == 's_sex').all()
+    assert (df.rate_name == 'iota').all()
@@ -5,7 +5,14 @@ typically be executed in sequence on the same database.
 
 import pytest
 import os
+from types import SimpleNamespace
+
 import numpy as np
+import pandas as pd
+
+from cascade_at.context.model_context import Context
+from cascade_at.dismod.api import multithreading
+from cascade_at.executor import dismod_db, predict, sample
 
 from cascade_at.dismod.api.dismod_io import DismodIO
 from cascade_at.dismod.api.dismod_extractor import DismodExtractor
@@ -124,14 +131,16 @@ def test_predict_pool(mi, settings, dismod):
 
 def test_predict_sample_pools(mi, settings, dismod):
     alchemy = Alchemy(settings)
-    predictions = predict_sample_pool(
+    predict_sample_pool(
         main_db=NAME,
         index_file_pattern='sample_{index}.db',
         n_pool=2,
         n_sim=2
     )
     di = DismodIO(NAME)
-    assert len(predictions) == 2 * len(di.avgint)
+    assert len(di.predict) == 2 * len(di.avgint)
+    assert di.predict.predict_id.tolist() == list(range(len(di.predict)))
+    assert set(di.predict.sample_index) == {0, 1}
 
 
 def test_default_gather_child_draws(mi, settings, dismod):
@@ -173,3 +182,128 @@ def test_format_prior(mi, settings, dismod):
     assert all(pred.columns == [
         'location_id', 'year_id', 'age_group_id', 'sex_id', 'measure_id', 'draw_0', 'draw_1'
     ])
+
+
+def fake_fit(dm_file, commands, **kwargs):
+    """Fits each var to the sample index in the command, as in 'fit both 3'."""
+    index = int(commands[0].split()[-1])
+    DismodIO(path=dm_file).write_table('fit_var', pd.DataFrame({
+        'fit_var_id': [0, 1], 'fit_var_value': [index + 0.1, index + 0.2], 'residual_value': np.nan,
+        'residual_dage': np.nan, 'residual_dtime': np.nan, 'lagrange_value': 0.0,
+        'lagrange_dage': 0.0, 'lagrange_dtime': 0.0
+    }))
+
+
+def fake_predict(dm_file, commands, **kwargs):
+    """Predicts the sum of the sample table, which should hold one sample."""
+    dm = DismodIO(path=dm_file)
+    dm.write_table('predict', pd.DataFrame({
+        'predict_id': [0], 'sample_index': [0], 'avgint_id': [0], 'avg_integrand': [dm.sample.var_value.sum()]
+    }))
+
+
+@pytest.fixture
+def workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(multithreading, 'run_dismod', lambda *args: None)
+    monkeypatch.setattr(sample, 'run_dismod_commands', fake_fit)
+    monkeypatch.setattr(predict, 'run_dismod_commands', fake_predict)
+    main_db = tmp_path / 'main.db'
+    DismodIO(path=main_db).sample = pd.DataFrame({
+        'sample_index': np.repeat([0, 1, 2], 2), 'var_id': [0, 1] * 3, 'var_value': [1., 2., 10., 20., 100., 200.]
+    })
+    return main_db, str(tmp_path / 'main_{index}.db')
+
+
+@pytest.mark.parametrize('batch', [False, True])
+def test_fit_sample_saves_fit(workers, batch):
+    main_db, pattern = workers
+    fit_sample = FitSample(main_db=main_db, index_file_pattern=pattern, fit_type='both', return_fit=False)
+    if batch:
+        results = fit_sample.run_batch([0, 1, 2])
+    else:
+        results = [fit_sample(index) for index in [0, 1, 2]]
+    assert results == [pattern.format(index=i) for i in range(3)]
+    for index in range(3):
+        assert DismodIO(path=pattern.format(index=index)).fit_var.fit_var_value.tolist() == [index + 0.1, index + 0.2]
+
+
+@pytest.mark.parametrize('batch', [False, True])
+def test_predict_resets_sample(workers, batch):
+    main_db, pattern = workers
+    predictor = Predict(main_db=main_db, index_file_pattern=pattern, return_predict=False)
+    if batch:
+        predictor.run_batch([0, 1, 2])
+    else:
+        for index in [0, 1, 2]:
+            predictor(index)
+    for index, total in enumerate([3., 30., 300.]):
+        assert DismodIO(path=pattern.format(index=index)).predict.avg_integrand.tolist() == [total]
+
+
+def test_pools_pass_queue_dir(workers, monkeypatch, tmp_path):
+    main_db, pattern = workers
+    calls = []
+    monkeypatch.setattr(sample, 'dmdismod_in_parallel_streaming', lambda **kwargs: calls.append(kwargs))
+    monkeypatch.setattr(predict, 'dmdismod_in_parallel_streaming', lambda **kwargs: calls.append(kwargs))
+    dm = DismodIO(path=main_db)
+    dm.write_table('var', dm.empty_table('var'))
+    sample_simulate_pool(main_db, pattern, fit_type='both', n_sim=2, n_pool=2, backend='directory',
+                         queue_dir=tmp_path / 'queue')
+    predict_sample_pool(main_db, pattern, n_sim=2, n_pool=2, backend='directory', queue_dir=tmp_path / 'queue')
+    assert [(c['backend'], c['queue_dir']) for c in calls] == [('directory', tmp_path / 'queue')] * 2
+
+
+def test_predict_reset_copies_one_sample(workers, tmp_path):
+    main_db, pattern = workers
+    predictor = Predict(main_db=main_db, index_file_pattern=pattern, return_predict=False)
+    worker_db = tmp_path / 'worker.db'
+    predictor._copy(worker_db)
+    predictor.index = 2
+    predictor._reset(worker_db)
+    assert DismodIO(path=worker_db).sample.var_value.tolist() == [100., 200.]
+
+
+def test_pools_remove_index_dbs(workers, tmp_path):
+    main_db, pattern = workers
+    DismodIO(path=main_db).write_table('var', pd.DataFrame({'var_id': [0, 1], 'var_type': 'rate'}))
+    sample_simulate_pool(main_db, pattern, fit_type='both', n_sim=3, n_pool=2, backend='thread')
+    assert DismodIO(path=main_db).sample.var_value.tolist() == [0.1, 0.2, 1.1, 1.2, 2.1, 2.2]
+    predict_sample_pool(main_db, pattern, n_sim=3, n_pool=2, backend='thread')
+    assert np.allclose(sorted(DismodIO(path=main_db).predict.avg_integrand), [0.3, 2.3, 4.3])
+    # The databases of the indices are merged and removed.
+    assert [p.name for p in tmp_path.glob('*.db')] == ['main.db']
+
+
+def test_sample_saves_summary(tmp_path, monkeypatch):
+    context = Context(model_version_id=0, make=True, configure_application=False, root_directory=tmp_path)
+    monkeypatch.setattr(sample, 'Context', lambda model_version_id: context)
+    monkeypatch.setattr(sample, 'simulate', lambda path, n_sim: None)
+    outcome = SimpleNamespace(indices=[1], attempt=0, results=None, seconds=1.0, error='failed', timed_out=False)
+    summary = SimpleNamespace(tasks=[outcome], succeeded=[0, 2], failed=[1], timed_out=[], relaunched=[], skipped=[3])
+    calls = []
+    monkeypatch.setattr(sample, 'sample_simulate_pool', lambda **kwargs: calls.append(kwargs) or summary)
+    arguments = dict(model_version_id=0, parent_location_id=1, sex_id=2, n_sim=4, n_pool=2, fit_type='both')
+
+    sample.sample(**arguments, n_accept=2)
+    assert calls[0]['n_accept'] == 2
+    saved = sample.read_summary(context.db_file(1, 2))
+    assert saved['failed'] == [1]
+    assert saved['skipped'] == [3]
+    assert saved['tasks'][0]['error'] == 'failed'
+    # Without n_accept, every fit has to succeed, and the summary says which didn't.
+    with pytest.raises(SampleError):
+        sample.sample(**arguments)
+    assert sample.read_summary(context.db_file(1, 2))['failed'] == [1]
+
+
+def test_save_predictions_threads(tmp_path, monkeypatch):
+    calls = []
+    (tmp_path / 'dismod.db').touch()
+    monkeypatch.setattr(dismod_db.DismodExtractor, 'format_predictions_for_ihme', lambda self, **kwargs: kwargs)
+    monkeypatch.setattr(dismod_db.ResultsHandler, 'save_draw_files', lambda self, **kwargs: calls.append(kwargs))
+    dismod_db.save_predictions(
+        db_file=tmp_path / 'dismod.db', model_version_id=0, gbd_round_id=6, out_dir=tmp_path,
+        sample=True, age_metadata_file=tmp_path / 'ages.csv', n_threads=3
+    )
+    assert calls[0]['n_threads'] == 3
+    assert calls[0]['df']['age_metadata_file'] == tmp_path / 'ages.csv'
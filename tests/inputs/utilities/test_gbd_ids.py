@@ -4,6 +4,7 @@ import numpy as np
 
 from cascade_at.inputs.utilities.gbd_ids import make_age_intervals, make_time_intervals
 from cascade_at.inputs.utilities.gbd_ids import map_id_from_interval_tree
+from cascade_at.inputs.utilities.gbd_ids import IhmeIDError, IntervalMapper, format_age_time, get_age_group_metadata
 
 
 @pytest.fixture
@@ -51,3 +52,28 @@ def test_map_id_from_interval_tree(age_df):
     assert map_id_from_interval_tree(1990, ints) == 1990
     ints = make_age_intervals(df=age_df)
     assert map_id_from_interval_tree(5, ints) == 6
+
+
+def test_interval_mapper(age_df):
+    mapper = IntervalMapper(lower=age_df.age_lower.values, upper=age_df.age_upper.values,
+                            ids=age_df.age_group_id.values)
+    np.testing.assert_array_equal(mapper(np.array([5., 9.99, 10., 29.])), [6, 6, 7, 10])
+    with pytest.raises(IhmeIDError):
+        mapper(np.array([4., 5.]))
+    with pytest.raises(IhmeIDError):
+        mapper(np.array([30.]))
+
+
+def test_interval_mapper_overlaps():
+    with pytest.raises(IhmeIDError):
+        IntervalMapper(lower=np.array([0., 5., 4.]), upper=np.array([5., 10., 6.]), ids=np.array([1, 2, 3]))
+
+
+def test_format_age_time_from_file(age_df, tmp_path):
+    path = tmp_path / 'age_metadata.csv'
+    age_df.rename(columns={'age_lower': 'age_group_years_start', 'age_upper': 'age_group_years_end'}).to_csv(path)
+    pd.testing.assert_frame_equal(get_age_group_metadata(path=path), age_df, check_dtype=False)
+    df = pd.DataFrame({'age_lower': [5., 12.5, 25.], 'time_lower': [1990., 1990.5, 2019.]})
+    df = format_age_time(df, gbd_round_id=6, age_metadata_file=path)
+    assert df.age_group_id.tolist() == [6, 7, 10]
+    assert df.year_id.tolist() == [1990, 1990, 2019]
@@ -3,7 +3,7 @@ import pytest
 import pandas as pd
 import numpy as np
 
-from cascade_at.saver.results_handler import ResultsHandler
+from cascade_at.saver.results_handler import ResultsError, ResultsHandler
 
 
 @pytest.fixture
@@ -50,3 +50,73 @@ def test_saver_summaries_draws(draws):
     assert (df['lower'] == draws[['draw_0', 'draw_1']].quantile(0.025, axis=1)).all()
     assert (df['upper'] == draws[['draw_0', 'draw_1']].quantile(0.975, axis=1)).all()
 
+
+
+@pytest.fixture
+def many_draws():
+    keys = pd.DataFrame(
+        [(loc, sex, measure, year) for loc in [101, 102] for sex in [1, 2]
+         for measure in [6, 9] for year in [1990, 2000, 2010]],
+        columns=['location_id', 'sex_id', 'measure_id', 'year_id']
+    )
+    keys['age_group_id'] = 2
+    draws = pd.DataFrame(
+        np.random.default_rng(0).random((len(keys), 12)), columns=[f'draw_{i}' for i in range(12)]
+    )
+    return pd.concat([keys, draws], axis=1)
+
+
+@pytest.mark.parametrize('draw_format', ['csv', 'npy'])
+def test_read_draw_files(many_draws, tmp_path, draw_format):
+    rh = ResultsHandler()
+    rh.save_draw_files(df=many_draws.copy(), model_version_id=0, directory=tmp_path,
+                       add_summaries=True, draw_format=draw_format)
+    assert (tmp_path / '102' / '102_2_summary.csv').exists()
+
+    df = rh.read_draw_files(directory=tmp_path)
+    assert len(df) == len(many_draws)
+    assert [c for c in df.columns if c.startswith('draw')] == [f'draw_{i}' for i in range(12)]
+
+    df = rh.read_draw_files(directory=tmp_path, locations=[102], sexes=[2], measure_ids=[9], draws=[3, 'draw_11'])
+    assert list(df.columns) == rh.draw_keys + ['draw_3', 'draw_11']
+    expected = many_draws.loc[
+        (many_draws.location_id == 102) & (many_draws.sex_id == 2) & (many_draws.measure_id == 9)
+    ].sort_values('year_id')
+    np.testing.assert_allclose(df.sort_values('year_id')[['draw_3', 'draw_11']].values,
+                               expected[['draw_3', 'draw_11']].values)
+
+
+def test_npy_draw_files(many_draws, tmp_path):
+    rh = ResultsHandler()
+    rh.save_draw_files(df=many_draws.copy(), model_version_id=0, directory=tmp_path,
+                       add_summaries=False, draw_format='npy', float32=True)
+    matrix = np.load(tmp_path / '101' / '101_1_draws.npy')
+    assert matrix.dtype == np.float32
+    assert matrix.shape == (12, 6)
+    assert not (tmp_path / '101' / '101_1.csv').exists()
+
+    df = rh.read_draw_files(directory=tmp_path, measure_ids=[6], draws=[0])
+    assert set(df.measure_id) == {6}
+    assert len(df) == 12
+    with pytest.raises(ResultsError):
+        rh.read_draw_files(directory=tmp_path, draws=[12])
+    with pytest.raises(ResultsError):
+        rh.save_draw_files(df=many_draws.copy(), model_version_id=0, directory=tmp_path,
+                           add_summaries=False, draw_format='parquet')
+
+
+def test_save_draw_files_threads(many_draws, tmp_path):
+    rh = ResultsHandler()
+    # Location 102 has no sex 1, which shouldn't get an empty file.
+    df = many_draws.loc[~((many_draws.location_id == 102) & (many_draws.sex_id == 1))].copy()
+    columns = list(df.columns)
+    rh.save_draw_files(df=df, model_version_id=0, directory=tmp_path / 'serial', add_summaries=True)
+    rh.save_draw_files(df=df, model_version_id=0, directory=tmp_path / 'threads', add_summaries=True, n_threads=3)
+    assert list(df.columns) == columns + ['model_version_id']
+
+    files = sorted(f.name for f in (tmp_path / 'threads').rglob('*.csv'))
+    assert files == sorted(f.name for f in (tmp_path / 'serial').rglob('*.csv'))
+    assert '102_1.csv' not in files
+    summary = pd.read_csv(tmp_path / 'threads' / '101' / '101_2_summary.csv', index_col=0)
+    expected = rh.summarize_results(df=df.loc[(df.location_id == 101) & (df.sex_id == 2)])
+    pd.testing.assert_frame_equal(summary, expected)